@@ -7,6 +7,9 @@ from cmat.output_generation.report import Report
 
 parser = argparse.ArgumentParser('Aggregate counts reports')
 parser.add_argument('--counts-yml', nargs='+', help='YAML files containing intermediate counts', required=True)
+parser.add_argument('--evidence-string-keys', nargs='+', help='Files containing evidence string keys, used to detect '
+                                                            'duplicate evidence strings between the intermediate runs',
+                    required=False)
 
 
 if __name__ == '__main__':
@@ -19,11 +22,22 @@ if __name__ == '__main__':
         r = Report()
         r.load_from_file(filename)
         reports.append(r)
+    # Duplicates within each intermediate run are already counted; the keys are added separately to count the duplicates
+    # between different runs
+    keys_filenames = [f for files in args.evidence_string_keys or [] for f in glob.glob(files)]
+    for filename in keys_filenames:
+        r = Report()
+        r.load_evidence_string_keys(filename)
+        reports.append(r)
 
-    # Sum them up and output the results
-    complete_report = sum(reports, start=Report())
+    # Sum them up in place, as sum() would copy the evidence string keys gathered so far for every report
+    complete_report = Report()
+    for r in reports:
+        complete_report += r
     complete_report.print_report()
     complete_report.dump_to_file(dir_out='.')
     complete_report.write_unmapped_terms(dir_out='.')
     if not complete_report.check_counts():
         raise RuntimeError('Aggregate counts not consistent')
+    if complete_report.duplicate_evidence_strings:
+        raise RuntimeError(f'Found {complete_report.duplicate_evidence_strings} duplicate evidence strings')
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.output_generation.consequence_type import write_consequence_store
+
+parser = argparse.ArgumentParser('Converts a consequences file into a consequence store, which can be used in its '
+                                 'place by evidence string generation without loading it into memory')
+parser.add_argument('--gene-mapping', help='Variant to gene & consequence mappings', required=True)
+parser.add_argument('--output-store', help='Output consequence store file',         required=True)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    write_consequence_store(args.gene_mapping, args.output_store)
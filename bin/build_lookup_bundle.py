@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.output_generation.lookup_bundle import write_lookup_bundle
+
+parser = argparse.ArgumentParser('Prepares the trait mappings, consequences and Open Targets schema used by evidence '
+                                 'string generation into a single lookup bundle, which is loaded much faster')
+parser.add_argument('--efo-mapping',   help='Disease string to ontology mappings',    required=True)
+parser.add_argument('--gene-mapping',  help='Variant to gene & consequence mappings, or a consequence store',
+                    required=True)
+parser.add_argument('--ot-schema',     help='OpenTargets schema JSON',                required=True)
+parser.add_argument('--output-bundle', help='Output lookup bundle file',              required=True)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    write_lookup_bundle(args.efo_mapping, args.gene_mapping, args.ot_schema, args.output_bundle)
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.consequence_prediction.common.vep import query_ensembl_release
+from cmat.consequence_prediction.common.vep_cache import VepCache
+
+parser = argparse.ArgumentParser('Deletes the results of previous Ensembl releases from a VEP results cache')
+parser.add_argument('--vep-cache', required=True, help='VEP results cache')
+group = parser.add_mutually_exclusive_group()
+group.add_argument('--keep-release', type=int,
+                   help='Ensembl release whose results are kept (default: the current Ensembl release)')
+group.add_argument('--all', action='store_true', help='Delete all results')
+args = parser.parse_args()
+
+keep_release = None if args.all else args.keep_release or query_ensembl_release()
+with VepCache(args.vep_cache) as cache:
+    deleted = cache.invalidate(keep_release)
+    print(f'{deleted} results deleted, {len(cache)} results kept')
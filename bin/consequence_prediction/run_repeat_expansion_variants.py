@@ -5,10 +5,15 @@ import argparse
 from cmat.consequence_prediction.repeat_expansion_variants import pipeline
 
 parser = argparse.ArgumentParser(description=__doc__)
-parser.add_argument(
-    '--clinvar-xml', required=True,
+input_group = parser.add_mutually_exclusive_group(required=True)
+input_group.add_argument(
+    '--clinvar-xml',
     help='ClinVar XML dump file (ClinVarFullRelease_00-latest.xml.gz)'
 )
+input_group.add_argument(
+    '--clinvar-candidates',
+    help='Repeat expansion variant candidates previously extracted from the ClinVar XML by bin/scan_clinvar.py'
+)
 parser.add_argument(
     '--include-transcripts', required=False, action='store_true',
     help='Whether to include transcript IDs along with consequence terms'
@@ -22,4 +27,5 @@ parser.add_argument(
     help='File to output full dataframe for subsequent analysis and debugging.'
 )
 args = parser.parse_args()
-pipeline.main(args.clinvar_xml, args.include_transcripts, args.output_consequences, args.output_dataframe)
+pipeline.main(args.clinvar_xml, args.include_transcripts, args.output_consequences, args.output_dataframe,
+              args.clinvar_candidates)
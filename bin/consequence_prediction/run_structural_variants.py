@@ -5,18 +5,40 @@ import argparse
 from cmat.consequence_prediction.structural_variants import pipeline
 
 parser = argparse.ArgumentParser(description=__doc__)
-parser.add_argument(
-    '--clinvar-xml', required=True,
+input_group = parser.add_mutually_exclusive_group(required=True)
+input_group.add_argument(
+    '--clinvar-xml',
     help='ClinVar XML dump file (ClinVarFullRelease_00-latest.xml.gz)'
 )
+input_group.add_argument(
+    '--vep-variants',
+    help='Structural variants previously extracted from the ClinVar XML by bin/scan_clinvar.py'
+)
 parser.add_argument(
     '--include-transcripts', required=False, action='store_true',
     help='Whether to include transcript IDs along with consequence terms'
 )
+parser.add_argument(
+    '--vep-cache', required=False,
+    help='VEP results cache, only variants which are not in it are queried (will be created if it does not exist)'
+)
+parser.add_argument(
+    '--local-vep-cache', required=False,
+    help='VEP offline cache directory; if provided, variants are annotated with local VEP instead of VEP API'
+)
+parser.add_argument(
+    '--gene-models', required=False,
+    help='Ensembl GTF file; if provided, variants overlapping too many genes are skipped before querying VEP'
+)
+parser.add_argument(
+    '--vep-rejects', required=False,
+    help='File to output the variants rejected by VEP to, together with the reason for rejection'
+)
 parser.add_argument(
     '--output-consequences', required=True,
     help='File to output functional consequences to. Format is compatible with the main VEP mapping pipeline.'
 )
 
 args = parser.parse_args()
-pipeline.main(args.clinvar_xml, args.include_transcripts, args.output_consequences)
+pipeline.main(args.clinvar_xml, args.include_transcripts, args.output_consequences, args.vep_variants, args.vep_cache,
+              args.vep_rejects, args.local_vep_cache, args.gene_models)
@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
 
-from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io.columnar import is_columnar_file, ColumnarClinVarDataset
+from cmat.clinvar_xml_io.xml_index import count_records, get_chunk_boundaries
 
 parser = argparse.ArgumentParser('Count number of RCV records in the XML, print to stdout')
-parser.add_argument('--clinvar-xml', help='ClinVar XML release', required=True)
+parser.add_argument('--clinvar-xml',   help='ClinVar XML release, or its columnar export (.parquet)', required=True)
+parser.add_argument('--num-chunks',    help='Number of chunks to split the records into', type=int, required=False)
+parser.add_argument('--output-chunks', help='File to write the chunk boundaries to, one chunk per line (start, end)',
+                    required=False)
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
-    print(sum(1 for _ in ClinVarDataset(args.clinvar_xml)))
+    if bool(args.num_chunks) != bool(args.output_chunks):
+        parser.error('--num-chunks and --output-chunks must be specified together')
+    if is_columnar_file(args.clinvar_xml):
+        # The number of rows is stored in the file metadata
+        count = len(ColumnarClinVarDataset(args.clinvar_xml))
+    else:
+        count = count_records(args.clinvar_xml)
+    if args.output_chunks:
+        with open(args.output_chunks, 'w') as f:
+            csv.writer(f, delimiter='\t', lineterminator='\n').writerows(get_chunk_boundaries(count, args.num_chunks))
+    print(count)
@@ -4,14 +4,14 @@ import argparse
 import pandas as pd
 
 from cmat.consequence_prediction.repeat_expansion_variants.pipeline import annotate_ensembl_gene_info
-from cmat import clinvar_xml_io
+from cmat.clinvar_xml_io.columnar import open_dataset
 
 
 def load_clinvar_data(clinvar_xml):
     """Load ClinVar data, process for gene symbols and HGNC IDs, and return it as a Pandas dataframe.
      Modified from similar functionality in the repeat expansion pipeline."""
     variant_data = []  # To populate the return dataframe (see columns below)
-    for clinvar_record in clinvar_xml_io.ClinVarDataset(clinvar_xml):
+    for clinvar_record in open_dataset(clinvar_xml, columns=['accession', 'vcv_id', 'measure']):
         # Skip a record if it does not contain variant information
         if not clinvar_record.measure:
             continue
@@ -60,7 +60,7 @@ def main(clinvar_xml, output_file):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Script to convert HGNC IDs and gene symbols in ClinVar to Ensembl')
-    parser.add_argument('--clinvar-xml', required=True, help='ClinVar XML dump file')
+    parser.add_argument('--clinvar-xml', required=True, help='ClinVar XML dump file, or its columnar export (.parquet)')
     parser.add_argument('--output-file', required=True, help='File to output dataframe')
     args = parser.parse_args()
     main(args.clinvar_xml, args.output_file)
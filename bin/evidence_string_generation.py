@@ -2,19 +2,40 @@
 
 import argparse
 from cmat.output_generation import clinvar_to_evidence_strings
+from cmat.output_generation.evidence_output import COMPRESSION_EXTENSIONS
 
 parser = argparse.ArgumentParser('Generates Open Targets evidence strings from ClinVar data and trait mappings')
 parser.add_argument('--clinvar-xml',  help='ClinVar XML release',                    required=True)
-parser.add_argument('--efo-mapping',  help='Disease string to ontology mappings',    required=True)
-parser.add_argument('--gene-mapping', help='Variant to gene & consequence mappings', required=True)
-parser.add_argument('--ot-schema',    help='OpenTargets schema JSON',                required=True)
+parser.add_argument('--efo-mapping',  help='Disease string to ontology mappings',    required=False)
+parser.add_argument('--gene-mapping', help='Variant to gene & consequence mappings', required=False)
+parser.add_argument('--ot-schema',    help='OpenTargets schema JSON',                required=False)
+parser.add_argument('--lookup-bundle', help='Lookup bundle with all of the above (see build_lookup_bundle.py), used '
+                                            'in their place', required=False)
 parser.add_argument('--out',          help='Output directory',                       required=True)
 parser.add_argument('--start',        help='Start index (inclusive)',                required=False, type=int)
 parser.add_argument('--end',          help='End index (exclusive)',                  required=False, type=int)
+parser.add_argument('--clinvar-index', help='ClinVarSet byte-offset index, used to skip directly to start index',
+                    required=False)
+parser.add_argument('--workers',      help='Number of worker processes (default: process records serially)',
+                    required=False, type=int)
+parser.add_argument('--full-validation', help='Validate every evidence string against the complete schema, rather '
+                                              'than only the values of ones with an already validated structure',
+                    action='store_true', default=False)
+parser.add_argument('--compression',  help='Compress the evidence strings output with this format',
+                    required=False, choices=sorted(COMPRESSION_EXTENSIONS))
+parser.add_argument('--previous-state', help='Evidence state of a previous run, used to only process records whose '
+                                             'inputs changed since then', required=False)
+parser.add_argument('--write-state',  help='Write the evidence state of this run to the output directory',
+                    action='store_true', default=False)
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
+    if not args.lookup_bundle and not (args.efo_mapping and args.gene_mapping and args.ot_schema):
+        parser.error('either --lookup-bundle or all of --efo-mapping, --gene-mapping and --ot-schema are required')
     clinvar_to_evidence_strings.launch_pipeline(
         clinvar_xml_file=args.clinvar_xml, efo_mapping_file=args.efo_mapping, gene_mapping_file=args.gene_mapping,
-        ot_schema_file=args.ot_schema, dir_out=args.out, start=args.start, end=args.end)
+        ot_schema_file=args.ot_schema, dir_out=args.out, start=args.start, end=args.end,
+        clinvar_index_file=args.clinvar_index, workers=args.workers, full_validation=args.full_validation,
+        compression=args.compression, lookup_bundle_file=args.lookup_bundle, previous_state_file=args.previous_state,
+        write_state=args.write_state)
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.clinvar_xml_io.columnar import export_to_parquet
+
+parser = argparse.ArgumentParser('Converts ClinVar XML into a columnar (Parquet) store with one row per RCV record')
+parser.add_argument('--clinvar-xml',    help='ClinVar XML release',                              required=True)
+parser.add_argument('--output-parquet', help='Output Parquet file',                              required=True)
+parser.add_argument('-w', '--workers',  help='Number of worker processes used to parse the XML', type=int,
+                    required=False)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    export_to_parquet(args.clinvar_xml, args.output_parquet, args.workers)
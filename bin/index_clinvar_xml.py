@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.clinvar_xml_io.xml_index import build_index, default_index_path
+
+parser = argparse.ArgumentParser('Builds a byte-offset index of ClinVarSet records in the gzipped ClinVar XML')
+parser.add_argument('--clinvar-xml',  help='ClinVar XML release',                               required=True)
+parser.add_argument('--output-index', help='Output index file (default: <clinvar-xml>.cvsidx)', required=False)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    build_index(args.clinvar_xml, args.output_index or default_index_path(args.clinvar_xml))
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.clinvar_xml_io.compression import recompress, BGZF_FORMAT, ZSTD_FORMAT
+
+parser = argparse.ArgumentParser('Recompresses a ClinVar XML release into a format which can be read faster: BGZF '
+                                 '(decompressed in parallel, still readable as gzip) or zstd')
+parser.add_argument('--clinvar-xml', help='ClinVar XML release',                                 required=True)
+parser.add_argument('--output-xml',  help='Output file',                                         required=True)
+parser.add_argument('--format',      help='Output compression format (default: bgzf)',           required=False,
+                    choices=[BGZF_FORMAT, ZSTD_FORMAT], default=BGZF_FORMAT)
+parser.add_argument('--threads',     help='Number of threads used for compression',              required=False,
+                    type=int)
+parser.add_argument('--level',       help='Compression level (default: 6 for bgzf, 10 for zstd)', required=False,
+                    type=int)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    recompress(args.clinvar_xml, args.output_xml, args.format, args.threads, args.level)
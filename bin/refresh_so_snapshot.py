@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.output_generation.consequence_type import refresh_so_snapshot, get_so_snapshot_path
+
+parser = argparse.ArgumentParser('Fetches the Sequence Ontology accessions and the Ensembl consequence severity '
+                                 'ranking, and writes them to a snapshot which is used instead of querying them on '
+                                 'every run')
+parser.add_argument('--output', help='Output snapshot file (default: $CMAT_SO_SNAPSHOT, or '
+                                     '~/.cache/cmat/so_snapshot.json)', required=False)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    refresh_so_snapshot(args.output or get_so_snapshot_path())
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from cmat.clinvar_xml_io.columnar import open_dataset
+from cmat.clinvar_xml_io.scan import CountConsumer
+from cmat.consequence_prediction.repeat_expansion_variants.pipeline import RepeatCandidateConsumer
+from cmat.consequence_prediction.snp_indel_variants.extraction import VepVariantConsumer
+from cmat.consequence_prediction.structural_variants.pipeline import StructuralVariantConsumer
+from cmat.output_generation.zooma_feedback import ZoomaFeedbackConsumer
+
+
+def main(clinvar_xml, output_count=None, output_vep_variants=None, output_repeat_candidates=None,
+         output_structural_variants=None, output_zooma_feedback=None, workers=None):
+    consumers = []
+    if output_count:
+        consumers.append(CountConsumer(output_count))
+    if output_vep_variants:
+        consumers.append(VepVariantConsumer(output_vep_variants))
+    if output_repeat_candidates:
+        consumers.append(RepeatCandidateConsumer(output_repeat_candidates))
+    if output_structural_variants:
+        consumers.append(StructuralVariantConsumer(output_structural_variants))
+    if output_zooma_feedback:
+        consumers.append(ZoomaFeedbackConsumer(output_zooma_feedback))
+    open_dataset(clinvar_xml).scan(consumers, parallel=workers)
+
+
+parser = argparse.ArgumentParser('Extracts several outputs from ClinVar XML in a single pass through the records')
+parser.add_argument('--clinvar-xml',                help='ClinVar XML release, or its columnar export (.parquet)',
+                    required=True)
+parser.add_argument('--output-count',               help='File to output the number of RCV records to')
+parser.add_argument('--output-vep-variants',        help='File to output variants for the VEP mapping pipeline to')
+parser.add_argument('--output-repeat-candidates',   help='File to output repeat expansion variant candidates to')
+parser.add_argument('--output-structural-variants', help='File to output structural variants for VEP to')
+parser.add_argument('--output-zooma-feedback',      help='File to output cross-references in ZOOMA format to')
+parser.add_argument('-w', '--workers',              help='Number of worker processes used to parse the XML',
+                    type=int, required=False)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    main(args.clinvar_xml, args.output_count, args.output_vep_variants, args.output_repeat_candidates,
+         args.output_structural_variants, args.output_zooma_feedback, args.workers)
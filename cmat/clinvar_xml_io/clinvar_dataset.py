@@ -2,30 +2,111 @@ import gzip
 import logging
 import re
 from datetime import date
+from functools import partial
 
 from cmat.clinvar_xml_io.clinvar_reference_record import ClinVarReferenceRecord
 from cmat.clinvar_xml_io.clinvar_set import ClinVarSet
-from cmat.clinvar_xml_io.xml_parsing import iterate_rcv_from_xml, parse_header_attributes, iterate_cvs_from_xml
+from cmat.clinvar_xml_io.compression import open_decompressed
+from cmat.clinvar_xml_io.parallel import iterate_parallel, RECORDS_PER_SHARD
+from cmat.clinvar_xml_io.scan import scan_records
+from cmat.clinvar_xml_io.xml_index import ClinVarIndex, iterate_cvs_shards
+from cmat.clinvar_xml_io.xml_parsing import iterate_rcv_from_xml, parse_header_attributes, iterate_cvs_from_xml, \
+    iterate_cvs_from_stream, find_mandatory_unique_element
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Number of decompressed bytes read at a time when splitting the XML into shards for parallel parsing.
+SHARD_READ_SIZE = 1024 * 1024
+
 
 class ClinVarDataset:
     """Iterate through records (RCVS) in ClinVar XML dump and convert them into internal ClinVarRecord representation."""
-    def __init__(self, clinvar_xml):
+    def __init__(self, clinvar_xml, index_file=None, parallel=None):
         self.clinvar_xml = clinvar_xml
         self.header_attr = parse_header_attributes(clinvar_xml)
         self.header_attr['LastProcessed'] = date.today().strftime('%Y-%m-%d')
         self.xsd_version = self.get_xsd_version()
+        # Optional byte-offset index (see xml_index.build_index), which allows starting at any record without parsing
+        # the preceding ones.
+        self.index = None
+        if index_file:
+            self.index = ClinVarIndex(index_file)
+            if not self.index.matches(clinvar_xml):
+                raise ValueError(f'Index {index_file} was not built from {clinvar_xml}')
+        # Number of worker processes used to parse records when iterating through the dataset
+        self.parallel = parallel
 
     def __iter__(self):
+        return self.iter_rcvs(parallel=self.parallel)
+
+    def iter_rcvs(self, parallel=None, map_func=None, ordered=True):
+        """Iterates through reference records (RCVs). See iter_cvs for the description of parameters."""
+        if parallel:
+            yield from iterate_parallel(self._iter_shards(), parallel, self.xsd_version, rcv_only=True,
+                                        map_func=map_func, ordered=ordered)
+            return
         for rcv in iterate_rcv_from_xml(self.clinvar_xml):
-            yield ClinVarReferenceRecord(rcv, self.xsd_version)
+            record = ClinVarReferenceRecord(rcv, self.xsd_version)
+            yield map_func(record) if map_func else record
+
+    def iter_cvs(self, start=None, end=None, parallel=None, map_func=None, ordered=True):
+        """Iterates through ClinVarSets, optionally only through the ones with (0-based) record numbers in the range
+        [start, end). If the dataset has an index, records before start are not read at all.
+
+        If parallel is set to N, the XML is split into ranges of records which are parsed by N worker processes. If
+        map_func is provided, the results of applying it to each ClinVarSet are yielded instead of the sets themselves;
+        in parallel mode, map_func is executed by the workers and should return picklable results. Unless ordered is
+        set to False, results are always yielded in the original order of the records."""
+        if parallel:
+            yield from iterate_parallel(self._iter_shards(start, end), parallel, self.xsd_version, map_func=map_func,
+                                        ordered=ordered)
+            return
+        if self.index:
+            with self.index.open_range(self.clinvar_xml, start, end) as fh:
+                for cvs in iterate_cvs_from_stream(fh):
+                    clinvar_set = ClinVarSet(cvs, self.xsd_version)
+                    yield map_func(clinvar_set) if map_func else clinvar_set
+            return
+        for i, cvs in enumerate(iterate_cvs_from_xml(self.clinvar_xml)):
+            if start and i < start:
+                continue
+            if end is not None and i >= end:
+                break
+            clinvar_set = ClinVarSet(cvs, self.xsd_version)
+            yield map_func(clinvar_set) if map_func else clinvar_set
+
+    def map_shards(self, shard_func, workers, start=None, end=None, initializer=None, initargs=()):
+        """Splits the ClinVarSets in the range [start, end) into shards, applies shard_func to the list of ClinVarSets
+        in each shard using a pool of worker processes, and yields the results in the original order of the shards. The
+        initializer is called with initargs once in each worker, so that large data shared by all shards does not have
+        to be sent with every one of them."""
+        yield from iterate_parallel(self._iter_shards(start, end), workers, self.xsd_version, shard_func=shard_func,
+                                    initializer=initializer, initargs=initargs)
+
+    def _iter_shards(self, start=None, end=None):
+        """Splits the records in the range [start, end) into shards which can be parsed independently."""
+        if self.index:
+            with self.index.open_range(self.clinvar_xml, start, end) as fh:
+                yield from iterate_cvs_shards(partial(fh.read, SHARD_READ_SIZE), RECORDS_PER_SHARD)
+        else:
+            with open_decompressed(self.clinvar_xml) as fh:
+                yield from iterate_cvs_shards(partial(fh.read, SHARD_READ_SIZE), RECORDS_PER_SHARD, start, end)
+
+    def scan(self, consumers, parallel=None):
+        """Parses every reference record (RCV) once and passes it to each of the consumers (see scan.RecordConsumer),
+        so that several independent outputs can be extracted in a single pass. If parallel is set, records are parsed
+        by worker processes, but all consumers still run in the current process. Returns the number of records."""
+        return scan_records(self.iter_rcvs(parallel=parallel or self.parallel), consumers)
 
-    def iter_cvs(self):
-        for cvs in iterate_cvs_from_xml(self.clinvar_xml):
-            yield ClinVarSet(cvs, self.xsd_version)
+    def record_number(self, accession):
+        """Returns the (0-based) record number of the ClinVarSet with a given RCV accession, or None if not found."""
+        if self.index:
+            return self.index.record_number(accession)
+        for i, rcv in enumerate(iterate_rcv_from_xml(self.clinvar_xml)):
+            if find_mandatory_unique_element(rcv, './ClinVarAccession').attrib['Acc'] == accession:
+                return i
+        return None
 
     def get_xsd_version(self):
         # For format, see https://github.com/ncbi/clinvar/blob/master/FTPSiteXsdChanges.md
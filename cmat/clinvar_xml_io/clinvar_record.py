@@ -1,6 +1,5 @@
 import logging
 import re
-import xml.etree.ElementTree as ElementTree
 from functools import cached_property
 from xml.dom import minidom
 
@@ -8,7 +7,7 @@ from cmat.clinvar_xml_io.clinical_classification import MultipleClinicalClassifi
 from cmat.clinvar_xml_io.clinvar_measure import ClinVarRecordMeasure
 from cmat.clinvar_xml_io.clinvar_trait import ClinVarTrait
 from cmat.clinvar_xml_io.xml_parsing import find_elements, find_optional_unique_element, \
-    find_mandatory_unique_element
+    find_mandatory_unique_element, element_to_string
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -39,7 +38,7 @@ class ClinVarRecord:
         # * GenotypeSet, which contains an assertion about a group of variants from different chromosome copies, with
         #   the type of be either a "CompoundHeterozygote" or a "Diplotype"
         variant_measure = find_optional_unique_element(self.record_xml, './MeasureSet[@Type="Variant"]/Measure')
-        if not variant_measure:
+        if variant_measure is None or len(variant_measure) == 0:
             self.measure = None
         else:
             self.measure = measure_class(variant_measure, self, self.vcv_id)
@@ -48,7 +47,7 @@ class ClinVarRecord:
         return f'ClinVarRecord object with accession {self.accession}'
 
     def write(self, output):
-        xml_str = minidom.parseString(ElementTree.tostring(self.record_xml)).toprettyxml(indent='  ', encoding='utf-8')
+        xml_str = minidom.parseString(element_to_string(self.record_xml)).toprettyxml(indent='  ', encoding='utf-8')
         # version 3.8 adds superfluous root
         if xml_str.startswith(b'<?xml'):
             xml_str = re.sub(b'<\?xml.*?>', b'', xml_str)
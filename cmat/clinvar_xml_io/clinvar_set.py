@@ -1,3 +1,5 @@
+from functools import cached_property
+
 from cmat.clinvar_xml_io.clinvar_reference_record import ClinVarReferenceRecord
 from cmat.clinvar_xml_io.clinvar_submitted_record import ClinVarSubmittedRecord
 from cmat.clinvar_xml_io.xml_parsing import find_mandatory_unique_element, find_elements
@@ -10,12 +12,25 @@ class ClinVarSet:
 
     def __init__(self, cvs_xml, xsd_version):
         self.cvs_xml = cvs_xml
+        self.xsd_version = xsd_version
 
         rcv_elem = find_mandatory_unique_element(self.cvs_xml, 'ReferenceClinVarAssertion')
         self.rcv = ClinVarReferenceRecord(rcv_elem, xsd_version)
 
-        scv_elems = find_elements(self.cvs_xml, 'ClinVarAssertion', allow_zero=False, allow_multiple=True)
-        self.scvs = [ClinVarSubmittedRecord(elem, xsd_version, self.rcv) for elem in scv_elems]
+    @property
+    def scv_elements(self):
+        return find_elements(self.cvs_xml, 'ClinVarAssertion', allow_zero=False, allow_multiple=True)
+
+    @cached_property
+    def scvs(self):
+        """Submitted records are only constructed when first accessed, as a set can include hundreds of them."""
+        return [ClinVarSubmittedRecord(elem, self.xsd_version, self.rcv) for elem in self.scv_elements]
+
+    @property
+    def submission_names(self):
+        """Submission names of all submitted records (see ClinVarSubmittedRecord.submission_name), read without
+        constructing the records."""
+        return [elem.attrib.get('SubmissionName', None) for elem in self.scv_elements]
 
     @property
     def id(self):
@@ -0,0 +1,459 @@
+"""Columnar (Parquet) store of parsed ClinVar records. A ClinVar XML release is converted once into a table with one row
+per ClinVarSet, which can then be read by downstream stages much faster than the XML, loading only the columns they
+need. Requires the optional pyarrow package."""
+
+import json
+import logging
+from functools import cached_property
+
+from cmat.clinvar_xml_io.clinical_classification import ClinicalClassification, MultipleClinicalClassificationsError
+from cmat.clinvar_xml_io.clinvar_dataset import ClinVarDataset
+from cmat.clinvar_xml_io.clinvar_measure import ClinVarRecordMeasure
+from cmat.clinvar_xml_io.clinvar_reference_record import ClinVarReferenceRecord
+from cmat.clinvar_xml_io.clinvar_trait import ClinVarTrait
+from cmat.clinvar_xml_io.hgvs_variant import HgvsVariant
+from cmat.clinvar_xml_io.scan import scan_records
+from cmat.clinvar_xml_io.xml_parsing import find_elements, find_optional_unique_element
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Number of rows written to / read from the Parquet file at a time.
+BATCH_SIZE = 10000
+
+# Keys of the Parquet file metadata.
+XSD_VERSION_KEY = b'cmat.xsd_version'
+HEADER_ATTRIBUTES_KEY = b'cmat.header_attributes'
+
+# Attributes of the GRCh38 SequenceLocation element which are stored (see ClinVarRecordMeasure.sequence_location_helper)
+SEQUENCE_LOCATION_ATTRIBUTES = ('Accession', 'Chr', 'positionVCF', 'referenceAlleleVCF', 'alternateAlleleVCF')
+
+
+def is_columnar_file(path):
+    return path.endswith('.parquet')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('The columnar ClinVar store requires pyarrow, which is not installed')
+
+
+def get_schema():
+    _require_pyarrow()
+    strings = pa.list_(pa.string())
+    integers = pa.list_(pa.int64())
+    trait = pa.struct([
+        ('identifier', pa.string()),
+        ('names', strings),
+        ('preferred_name', pa.string()),
+        ('pubmed_refs', integers),
+        ('xrefs', pa.list_(pa.struct([('db', pa.string()), ('id', pa.string()), ('status', pa.string())]))),
+    ])
+    classification = pa.struct([
+        ('type', pa.string()),
+        ('review_status', pa.string()),
+        ('descriptions', strings),
+        ('last_evaluated_date', pa.string()),
+    ])
+    measure = pa.struct([
+        ('variant_type', pa.string()),
+        ('names', strings),
+        ('preferred_name', pa.string()),
+        ('preferred_gene_symbols', strings),
+        ('hgnc_ids', strings),
+        ('rs_ids', strings),
+        ('nsv_ids', strings),
+        ('existing_so_terms', strings),
+        ('hgvs', pa.list_(pa.struct([('text', pa.string()), ('types', strings)]))),
+        ('pubmed_refs', integers),
+        ('sequence_location', pa.struct([(attr, pa.string()) for attr in SEQUENCE_LOCATION_ATTRIBUTES])),
+    ])
+    return pa.schema([
+        ('cvs_id', pa.string()),
+        ('title', pa.string()),
+        ('status', pa.string()),
+        ('accession', pa.string()),
+        ('vcv_id', pa.string()),
+        ('last_updated_date', pa.string()),
+        ('created_date', pa.string()),
+        ('trait_set_type', pa.string()),
+        ('mode_of_inheritance', strings),
+        ('evidence_support_pubmed_refs', integers),
+        ('allele_origins', strings),
+        ('clinical_classifications', pa.list_(classification)),
+        ('traits', pa.list_(trait)),
+        ('measure', measure),
+        ('scv_submission_names', strings),
+    ])
+
+
+def _texts(node, xpath):
+    return [elem.text for elem in find_elements(node, xpath)]
+
+
+def _trait_row(trait):
+    preferred_name = find_optional_unique_element(trait.trait_xml, './Name/ElementValue[@Type="Preferred"]')
+    return {
+        'identifier': trait.identifier,
+        'names': _texts(trait.trait_xml, './Name/ElementValue'),
+        'preferred_name': None if preferred_name is None else preferred_name.text,
+        'pubmed_refs': trait.pubmed_refs,
+        'xrefs': [{'db': db, 'id': id_, 'status': status} for db, id_, status in trait.xrefs],
+    }
+
+
+def _classification_row(classification):
+    last_evaluated_date = classification.last_evaluated_date
+    if last_evaluated_date is not None and not isinstance(last_evaluated_date, str):
+        last_evaluated_date = last_evaluated_date.text
+    return {
+        'type': classification.type,
+        'review_status': classification.review_status,
+        'descriptions': _texts(classification.class_xml, './Description'),
+        'last_evaluated_date': last_evaluated_date,
+    }
+
+
+def _measure_row(measure):
+    measure_xml = measure.measure_xml
+    return {
+        'variant_type': measure.variant_type,
+        'names': _texts(measure_xml, './Name/ElementValue'),
+        'preferred_name': measure.preferred_name,
+        'preferred_gene_symbols': measure.preferred_gene_symbols,
+        'hgnc_ids': measure.hgnc_ids,
+        'rs_ids': ['rs' + elem.attrib['ID'] for elem in find_elements(measure_xml, './XRef[@DB="dbSNP"]')],
+        'nsv_ids': [elem.attrib['ID'] for elem in find_elements(measure_xml, './XRef[@DB="dbVar"]')
+                    if elem.attrib['ID'].startswith('nsv')],
+        'existing_so_terms': sorted(measure.existing_so_terms),
+        'hgvs': [{'text': elem.text, 'types': elem.attrib['Type'].split(',')}
+                 for elem in find_elements(measure_xml, './AttributeSet/Attribute')
+                 if elem.attrib['Type'].startswith('HGVS') and elem.text is not None],
+        'pubmed_refs': measure.pubmed_refs,
+        'sequence_location': {attr: measure.sequence_location_helper(attr) for attr in SEQUENCE_LOCATION_ATTRIBUTES},
+    }
+
+
+def clinvar_set_to_row(clinvar_set):
+    """Extracts everything stored in the columnar format from a ClinVarSet, as a dict of plain Python values."""
+    rcv = clinvar_set.rcv
+    return {
+        'cvs_id': clinvar_set.id,
+        'title': clinvar_set.title,
+        'status': clinvar_set.status,
+        'accession': rcv.accession,
+        'vcv_id': rcv.vcv_id,
+        'last_updated_date': rcv.last_updated_date,
+        'created_date': rcv.created_date,
+        'trait_set_type': rcv.trait_set_type,
+        'mode_of_inheritance': rcv.mode_of_inheritance,
+        'evidence_support_pubmed_refs': rcv.evidence_support_pubmed_refs,
+        'allele_origins': sorted(rcv.allele_origins),
+        'clinical_classifications': [_classification_row(c) for c in rcv.clinical_classifications],
+        'traits': [_trait_row(trait) for trait in rcv.traits],
+        'measure': _measure_row(rcv.measure) if rcv.measure else None,
+        'scv_submission_names': clinvar_set.submission_names,
+    }
+
+
+def export_to_parquet(clinvar_xml, output_file, parallel=None):
+    """Converts a ClinVar XML release into a Parquet file with one row per ClinVarSet (see get_schema). Returns the
+    number of records written. If parallel is set, the XML is parsed by that many worker processes."""
+    _require_pyarrow()
+    dataset = ClinVarDataset(clinvar_xml)
+    schema = get_schema().with_metadata({
+        XSD_VERSION_KEY: str(dataset.xsd_version).encode(),
+        HEADER_ATTRIBUTES_KEY: json.dumps(dataset.header_attr).encode(),
+    })
+    count = 0
+    with pq.ParquetWriter(output_file, schema) as writer:
+        rows = []
+        for row in dataset.iter_cvs(parallel=parallel, map_func=clinvar_set_to_row):
+            rows.append(row)
+            if len(rows) == BATCH_SIZE:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                count += len(rows)
+                rows = []
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            count += len(rows)
+    logger.info(f'Exported {count} records to {output_file}')
+    return count
+
+
+class ColumnarClinVarDataset:
+    """Reads records from a Parquet file created by export_to_parquet, providing the same record API as
+    ClinVarDataset. If columns is specified, only these columns are read, and accessing record properties which depend
+    on any other column raises a KeyError."""
+
+    def __init__(self, path, columns=None):
+        _require_pyarrow()
+        self.path = path
+        self.columns = columns
+        metadata = pq.read_schema(path).metadata
+        self.xsd_version = float(metadata[XSD_VERSION_KEY].decode())
+        self.header_attr = json.loads(metadata[HEADER_ATTRIBUTES_KEY].decode())
+
+    def __len__(self):
+        return pq.ParquetFile(self.path).metadata.num_rows
+
+    def __iter__(self):
+        return self.iter_rcvs()
+
+    def _iter_rows(self, start=None, end=None):
+        parquet_file = pq.ParquetFile(self.path)
+        i = 0
+        for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=self.columns):
+            for row in batch.to_pylist():
+                if end is not None and i >= end:
+                    return
+                if not start or i >= start:
+                    yield row
+                i += 1
+
+    def iter_rcvs(self, parallel=None, map_func=None, ordered=True):
+        """Iterates through reference records. The parallel and ordered arguments are accepted for compatibility with
+        ClinVarDataset, but records are always read in order in the current process."""
+        for row in self._iter_rows():
+            record = ColumnarReferenceRecord(row, self.xsd_version)
+            yield map_func(record) if map_func else record
+
+    def iter_cvs(self, start=None, end=None, parallel=None, map_func=None, ordered=True):
+        """Iterates through ClinVarSets, optionally only through the ones with (0-based) record numbers in the range
+        [start, end). See also iter_rcvs."""
+        for row in self._iter_rows(start, end):
+            clinvar_set = ColumnarClinVarSet(row, self.xsd_version)
+            yield map_func(clinvar_set) if map_func else clinvar_set
+
+    def scan(self, consumers, parallel=None):
+        """See ClinVarDataset.scan."""
+        return scan_records(self.iter_rcvs(), consumers)
+
+
+def open_dataset(path, columns=None, **kwargs):
+    """Returns a ColumnarClinVarDataset for a Parquet file and a ClinVarDataset for anything else. The columns argument
+    only applies to the former, and the remaining keyword arguments only to the latter."""
+    if is_columnar_file(path):
+        return ColumnarClinVarDataset(path, columns)
+    return ClinVarDataset(path, **kwargs)
+
+
+class ColumnarClinVarSet:
+
+    def __init__(self, row, xsd_version):
+        self.row = row
+        self.rcv = ColumnarReferenceRecord(row, xsd_version)
+
+    @cached_property
+    def scvs(self):
+        return [ColumnarSubmittedRecord(name, self.rcv) for name in self.submission_names]
+
+    @property
+    def submission_names(self):
+        return self.row['scv_submission_names']
+
+    @property
+    def id(self):
+        return self.row['cvs_id']
+
+    @property
+    def title(self):
+        return self.row['title']
+
+    @property
+    def status(self):
+        return self.row['status']
+
+
+class ColumnarSubmittedRecord:
+    """Only the submission name is stored for submitted records."""
+
+    def __init__(self, submission_name, reference_record):
+        self.submission_name = submission_name
+        self.reference_record = reference_record
+
+
+class ColumnarReferenceRecord(ClinVarReferenceRecord):
+    """Reference record backed by a row of the columnar store. Everything which is derived from the stored values is
+    inherited from the XML-based classes, so that the results are always the same."""
+
+    def __init__(self, row, xsd_version):
+        self.row = row
+        self.xsd_version = xsd_version
+        self.record_xml = None
+
+    def __str__(self):
+        return f'ColumnarReferenceRecord object with accession {self.accession}'
+
+    def write(self, output):
+        raise NotImplementedError('Records read from the columnar store cannot be written as XML')
+
+    @cached_property
+    def trait_set(self):
+        return [ColumnarTrait(trait, self) for trait in self.row['traits']]
+
+    @cached_property
+    def measure(self):
+        if self.row['measure'] is None:
+            return None
+        return ColumnarRecordMeasure(self.row['measure'], self, self.vcv_id)
+
+    @property
+    def accession(self):
+        return self.row['accession']
+
+    @property
+    def vcv_id(self):
+        return self.row['vcv_id']
+
+    @property
+    def last_updated_date(self):
+        return self.row['last_updated_date']
+
+    @property
+    def created_date(self):
+        return self.row['created_date']
+
+    @property
+    def mode_of_inheritance(self):
+        return self.row['mode_of_inheritance']
+
+    @property
+    def trait_set_type(self):
+        return self.row['trait_set_type']
+
+    @property
+    def evidence_support_pubmed_refs(self):
+        return self.row['evidence_support_pubmed_refs']
+
+    @property
+    def allele_origins(self):
+        return set(self.row['allele_origins'])
+
+    @cached_property
+    def clinical_classifications(self):
+        return [ColumnarClinicalClassification(c, self) for c in self.row['clinical_classifications']]
+
+
+class ColumnarClinicalClassification(ClinicalClassification):
+
+    def __init__(self, row, clinvar_record):
+        self.row = row
+        self.class_xml = None
+        self.clinvar_record = clinvar_record
+        self.xsd_version = clinvar_record.xsd_version
+        self.type = row['type']
+
+    @property
+    def last_evaluated_date(self):
+        return self.row['last_evaluated_date']
+
+    @property
+    def review_status(self):
+        return self.row['review_status']
+
+    @property
+    def clinical_significance_raw(self):
+        if len(self.row['descriptions']) != 1:
+            raise MultipleClinicalClassificationsError(f'Found multiple descriptions for one ClinicalClassification in '
+                                                       f'{self.clinvar_record.accession}')
+        return self.row['descriptions'][0]
+
+
+class ColumnarTrait(ClinVarTrait):
+
+    def __init__(self, row, clinvar_record):
+        self.row = row
+        self.trait_xml = None
+        self.clinvar_record = clinvar_record
+
+    @property
+    def identifier(self):
+        return self.row['identifier']
+
+    @property
+    def all_names(self):
+        return sorted(self.row['names'])
+
+    @property
+    def preferred_name(self):
+        return self.row['preferred_name']
+
+    @property
+    def pubmed_refs(self):
+        return self.row['pubmed_refs']
+
+    @property
+    def xrefs(self):
+        return [(xref['db'], xref['id'], xref['status']) for xref in self.row['xrefs']]
+
+
+class ColumnarRecordMeasure(ClinVarRecordMeasure):
+
+    def __init__(self, row, clinvar_record, vcv_id):
+        self.row = row
+        self.measure_xml = None
+        self.clinvar_record = clinvar_record
+        self.vcv_id = vcv_id
+
+    @property
+    def all_names(self):
+        return sorted(self.row['names'])
+
+    @property
+    def preferred_name(self):
+        return self.row['preferred_name']
+
+    @property
+    def preferred_gene_symbols(self):
+        return self.row['preferred_gene_symbols']
+
+    @property
+    def hgnc_ids(self):
+        return self.row['hgnc_ids']
+
+    @property
+    def rs_id(self):
+        return self._single_id(self.row['rs_ids'], 'RS')
+
+    @property
+    def nsv_id(self):
+        return self._single_id(self.row['nsv_ids'], 'NSV')
+
+    def _single_id(self, ids, name):
+        if len(ids) == 0:
+            return None
+        elif len(ids) == 1:
+            return ids[0]
+        else:
+            logger.warning(f'Found multiple {name} IDs for {self.clinvar_record}, this is not yet supported')
+            return None
+
+    @property
+    def existing_so_terms(self):
+        return set(self.row['existing_so_terms'])
+
+    @cached_property
+    def _hgvs_to_types(self):
+        return {
+            HgvsVariant(hgvs['text']): {t.lower().strip() for t in hgvs['types']}
+            for hgvs in self.row['hgvs']
+        }
+
+    @property
+    def variant_type(self):
+        return self.row['variant_type']
+
+    @property
+    def pubmed_refs(self):
+        return self.row['pubmed_refs']
+
+    def sequence_location_helper(self, attr):
+        return self.row['sequence_location'][attr]
@@ -0,0 +1,278 @@
+"""Reading of compressed ClinVar XML. Besides regular gzip, files compressed with BGZF (blocked gzip, as produced by
+bgzip or by recompress) and zstd are supported; BGZF blocks are decompressed in parallel by several threads. The
+format is detected from the content of the file, so all readers go through open_decompressed."""
+
+import gzip
+import io
+import itertools
+import logging
+import os
+import shutil
+import signal
+import struct
+import subprocess
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Number of compressed bytes to read from disk at a time.
+READ_SIZE = 256 * 1024
+
+GZIP_FORMAT = 'gzip'
+BGZF_FORMAT = 'bgzf'
+ZSTD_FORMAT = 'zstd'
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# A BGZF block is a gzip member with an extra field containing the "BC" subfield, which stores the size of the block.
+BGZF_HEADER_SIZE = 18
+BGZF_SUBFIELD = b'BC\x02\x00'
+# Maximum amount of uncompressed data per BGZF block, same as used by bgzip.
+BGZF_BLOCK_SIZE = 0xff00
+# Number of BGZF blocks compressed or decompressed by a thread at a time.
+BGZF_BLOCKS_PER_TASK = 64
+
+# Number of threads used for (de)compression, can be set with the CMAT_COMPRESSION_THREADS environment variable.
+COMPRESSION_THREADS_ENV_VARIABLE = 'CMAT_COMPRESSION_THREADS'
+compression_threads = int(os.environ.get(COMPRESSION_THREADS_ENV_VARIABLE, min(4, os.cpu_count() or 1)))
+
+
+class MemberTrackingReader:
+    """Decompresses a gzip file chunk by chunk, keeping track of where each gzip member starts. A file can consist of
+    multiple concatenated members (this is the case for BGZF, or for files produced by `pigz --independent` or by
+    concatenating several gzip files). Member boundaries are the only points at which decompression can be started
+    without decompressing everything which comes before them."""
+
+    def __init__(self, path):
+        self.fileobj = open(path, 'rb')
+        # List of (compressed offset, decompressed offset) tuples, one per member.
+        self.members = []
+        self.decompressor = None
+        self.compressed_pos = 0
+        self.decompressed_pos = 0
+        self.pending = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.fileobj.close()
+
+    def read_chunk(self):
+        """Returns the next chunk of decompressed data, or an empty bytes object at the end of file."""
+        while True:
+            if not self.pending:
+                self.pending = self.fileobj.read(READ_SIZE)
+                if not self.pending:
+                    return b''
+            if self.decompressor is None:
+                # Skip zero padding which is allowed between and after gzip members
+                stripped = self.pending.lstrip(b'\x00')
+                self.compressed_pos += len(self.pending) - len(stripped)
+                self.pending = stripped
+                if not self.pending:
+                    continue
+                self.members.append((self.compressed_pos, self.decompressed_pos))
+                self.decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+            data = self.decompressor.decompress(self.pending)
+            if self.decompressor.eof:
+                unused_data = self.decompressor.unused_data
+                self.compressed_pos += len(self.pending) - len(unused_data)
+                self.pending = unused_data
+                self.decompressor = None
+            else:
+                self.compressed_pos += len(self.pending)
+                self.pending = b''
+            self.decompressed_pos += len(data)
+            if data:
+                return data
+
+
+class SeekedGzipFile(gzip.GzipFile):
+    """Reads a gzip file starting from a member boundary located at a given compressed offset. All subsequent members
+    are read as well, so the result is the decompressed content of the file from that member until the end."""
+
+    def __init__(self, path, compressed_offset=0):
+        self.raw_fileobj = open(path, 'rb')
+        self.raw_fileobj.seek(compressed_offset)
+        super().__init__(fileobj=self.raw_fileobj, mode='rb')
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.raw_fileobj.close()
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError('zstandard must be installed to read or write zstd-compressed files')
+
+
+def detect_format(path):
+    """Returns the compression format of a file, determined from its first bytes."""
+    with open(path, 'rb') as f:
+        header = f.read(BGZF_HEADER_SIZE)
+    if header.startswith(ZSTD_MAGIC):
+        return ZSTD_FORMAT
+    if header.startswith(GZIP_MAGIC):
+        # The FEXTRA flag must be set and the extra field must start with the BC subfield
+        if len(header) == BGZF_HEADER_SIZE and header[3] & 4 and header[12:16] == BGZF_SUBFIELD:
+            return BGZF_FORMAT
+        return GZIP_FORMAT
+    raise ValueError(f'{path} is not compressed with gzip, BGZF or zstd')
+
+
+@contextmanager
+def open_decompressed(path, threads=None):
+    """Opens a compressed file (see detect_format) for sequential reading of its decompressed content and returns a
+    binary file-like object. BGZF files are decompressed in parallel by a number of threads, which defaults to the
+    CMAT_COMPRESSION_THREADS environment variable. Other gzip files are decompressed using pigz if it is available,
+    which is considerably faster than the gzip module."""
+    threads = threads or compression_threads
+    compression_format = detect_format(path)
+    if compression_format == BGZF_FORMAT and threads > 1:
+        with io.BufferedReader(ChunkStream(iterate_bgzf_decompressed(path, threads)), READ_SIZE) as fileobj:
+            yield fileobj
+    elif compression_format == ZSTD_FORMAT:
+        _require_zstandard()
+        with open(path, 'rb') as raw_fileobj, \
+                zstandard.ZstdDecompressor().stream_reader(raw_fileobj, read_across_frames=True) as fileobj:
+            yield fileobj
+    elif shutil.which('pigz'):
+        yield from _open_with_pigz(path)
+    else:
+        with gzip.open(path, 'rb') as fileobj:
+            yield fileobj
+
+
+def _open_with_pigz(path):
+    pigz = shutil.which('pigz')
+    logger.info(f'Decompressing {path} using {pigz}')
+    process = subprocess.Popen([pigz, '--decompress', '--stdout', path], stdout=subprocess.PIPE)
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        return_code = process.wait()
+    # pigz is terminated by SIGPIPE if the output is closed before it is read completely
+    if return_code not in (0, -signal.SIGPIPE):
+        raise OSError(f'pigz failed to decompress {path} (exit code {return_code})')
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only binary stream over an iterator of bytes objects."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.chunk = memoryview(chunk)
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        super().close()
+
+
+def iterate_bgzf_blocks(fileobj):
+    """Yields the compressed BGZF blocks of a file one by one, without decompressing them."""
+    while True:
+        header = fileobj.read(BGZF_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) < BGZF_HEADER_SIZE or header[12:16] != BGZF_SUBFIELD:
+            raise ValueError('Invalid BGZF block header')
+        block_size = struct.unpack('<H', header[16:18])[0] + 1
+        yield header + fileobj.read(block_size - BGZF_HEADER_SIZE)
+
+
+def _decompress_bgzf_blocks(blocks):
+    return b''.join(zlib.decompress(block, wbits=zlib.MAX_WBITS | 16) for block in blocks)
+
+
+def _compress_bgzf_blocks(data, level):
+    return b''.join(compress_bgzf_block(data[i:i + BGZF_BLOCK_SIZE], level)
+                    for i in range(0, len(data), BGZF_BLOCK_SIZE))
+
+
+def _iterate_in_parallel(func, tasks, threads):
+    """Applies func to all tasks using a pool of threads, and yields the results in order. Only a limited number of
+    tasks are submitted ahead of the one whose result is yielded next, to limit the memory usage."""
+    with ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(func, task))
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iterate_bgzf_decompressed(path, threads):
+    """Decompresses a BGZF file using a number of threads and yields the decompressed data in chunks."""
+    with open(path, 'rb') as fileobj:
+        blocks = iterate_bgzf_blocks(fileobj)
+        tasks = iter(lambda: list(itertools.islice(blocks, BGZF_BLOCKS_PER_TASK)), [])
+        yield from _iterate_in_parallel(_decompress_bgzf_blocks, tasks, threads)
+
+
+def compress_bgzf_block(data, level=6):
+    """Compresses up to BGZF_BLOCK_SIZE bytes of data into a single BGZF block."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = BGZF_HEADER_SIZE + len(deflated) + 8
+    # Magic, compression method (deflate), flags (FEXTRA), mtime, extra flags, OS (unknown), extra field length
+    header = GZIP_MAGIC + b'\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00' + BGZF_SUBFIELD
+    header += struct.pack('<H', block_size - 1)
+    return header + deflated + struct.pack('<II', zlib.crc32(data), len(data))
+
+
+def recompress(input_file, output_file, output_format=BGZF_FORMAT, threads=None, level=None):
+    """Recompresses a file (in any of the supported formats) into BGZF or zstd. Both formats can be decompressed in
+    parallel (BGZF) or much faster than gzip (zstd), and BGZF files can still be read by any gzip reader."""
+    threads = threads or compression_threads
+    task_size = BGZF_BLOCK_SIZE * BGZF_BLOCKS_PER_TASK
+    with open_decompressed(input_file, threads) as input_fileobj, open(output_file, 'wb') as output_fileobj:
+        if output_format == BGZF_FORMAT:
+            level = level if level is not None else 6
+            tasks = iter(partial(input_fileobj.read, task_size), b'')
+            for compressed in _iterate_in_parallel(partial(_compress_bgzf_blocks, level=level), tasks, threads):
+                output_fileobj.write(compressed)
+            # An empty block marks the end of a BGZF file
+            output_fileobj.write(compress_bgzf_block(b'', level))
+        elif output_format == ZSTD_FORMAT:
+            _require_zstandard()
+            compressor = zstandard.ZstdCompressor(level=level if level is not None else 10, threads=threads)
+            with compressor.stream_writer(output_fileobj, closefd=False) as writer:
+                for data in iter(partial(input_fileobj.read, task_size), b''):
+                    writer.write(data)
+        else:
+            raise ValueError(f'Unsupported output format: {output_format}')
@@ -6,7 +6,7 @@ submission_names_to_exclude = ['SUB14299258']
 
 def filter_by_submission_name(clinvar_set):
     """Return False (i.e. filter out) if every submitted record in the set has submission_name in the exclusion list."""
-    for submitted_record in clinvar_set.scvs:
-        if submitted_record.submission_name not in submission_names_to_exclude:
+    for submission_name in clinvar_set.submission_names:
+        if submission_name not in submission_names_to_exclude:
             return True
     return False
@@ -0,0 +1,74 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from cmat.clinvar_xml_io.clinvar_reference_record import ClinVarReferenceRecord
+from cmat.clinvar_xml_io.clinvar_set import ClinVarSet
+from cmat.clinvar_xml_io.xml_parsing import parse_cvs_from_bytes, find_mandatory_unique_element, get_xml_parser, \
+    ETREE_PARSER
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Number of ClinVarSet records parsed by a worker as a single task.
+RECORDS_PER_SHARD = 500
+# Maximum number of shards submitted but not yet consumed, per worker. This bounds the memory used by the reader, which
+# can otherwise split the XML much faster than the workers are able to parse it.
+MAX_PENDING_SHARDS_PER_WORKER = 2
+
+
+def parse_shard(shard, xsd_version, rcv_only=False, map_func=None, shard_func=None, parser=None):
+    """Parses a shard of ClinVar XML (see xml_index.iterate_cvs_shards) and returns a list of ClinVarSet objects, or of
+    ClinVarReferenceRecord objects if rcv_only is set. If map_func is provided, it is applied to each object and the
+    list of results is returned instead. If shard_func is provided, it is applied to the complete list and its result
+    is returned. The XML parser backend is given by parser, defaulting to the one selected in this process."""
+    results = []
+    # Records are sent back to the main process as they are, and only ElementTree elements can be pickled
+    if map_func is None and shard_func is None:
+        parser = ETREE_PARSER
+    for cvs in parse_cvs_from_bytes(shard, parser):
+        if rcv_only:
+            record = ClinVarReferenceRecord(find_mandatory_unique_element(cvs, 'ReferenceClinVarAssertion'),
+                                            xsd_version)
+        else:
+            record = ClinVarSet(cvs, xsd_version)
+        results.append(map_func(record) if map_func else record)
+    return shard_func(results) if shard_func else results
+
+
+def iterate_parallel(shards, workers, xsd_version, rcv_only=False, map_func=None, ordered=True, shard_func=None,
+                     initializer=None, initargs=()):
+    """Parses shards of ClinVar XML in a pool of worker processes and yields the results (see parse_shard). If ordered
+    is set, results are yielded in the original order of records in the XML, otherwise as soon as they are ready. If
+    shard_func is provided, a single result is yielded per shard. The initializer is called with initargs once in every
+    worker process, and can be used to set up data shared by all shards.
+
+    Everything passed between processes is pickled, so map_func must be a module-level function and its return values
+    must be picklable. Returning only the required values from map_func is generally much faster than transferring
+    complete record objects."""
+    max_pending = workers * MAX_PENDING_SHARDS_PER_WORKER
+    # Worker processes which are spawned rather than forked do not inherit the parser backend selected in this process
+    # (see xml_parsing.set_xml_parser), so it is passed along with every shard
+    parser = get_xml_parser()
+    shards = iter(shards)
+    pending = []
+    has_more_shards = True
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        while True:
+            while has_more_shards and len(pending) < max_pending:
+                shard = next(shards, None)
+                if shard is None:
+                    has_more_shards = False
+                else:
+                    pending.append(executor.submit(parse_shard, shard, xsd_version, rcv_only, map_func, shard_func,
+                                                   parser))
+            if not pending:
+                break
+            if ordered:
+                future = pending.pop(0)
+            else:
+                future = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+                pending.remove(future)
+            if shard_func:
+                yield future.result()
+            else:
+                yield from future.result()
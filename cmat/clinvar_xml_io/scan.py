@@ -0,0 +1,54 @@
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class RecordConsumer:
+    """Base class for consumers of ClinVar records, which can share a single pass through the XML (see
+    ClinVarDataset.scan). Each consumer is responsible for producing its own output."""
+
+    def start(self):
+        """Called once before the first record, e.g. to open output files."""
+        pass
+
+    def consume(self, record):
+        """Called for every ClinVarReferenceRecord in the dataset."""
+        raise NotImplementedError
+
+    def finish(self):
+        """Called once after the last record, e.g. to write out accumulated results and close output files."""
+        pass
+
+
+class CountConsumer(RecordConsumer):
+    """Counts the records, and optionally writes the total to a file."""
+
+    def __init__(self, output_file=None):
+        self.output_file = output_file
+        self.count = 0
+
+    def consume(self, record):
+        self.count += 1
+
+    def finish(self):
+        if self.output_file:
+            with open(self.output_file, 'wt') as f:
+                f.write(f'{self.count}\n')
+
+
+def scan_records(records, consumers):
+    """Dispatches each record to all consumers in turn and returns the number of records processed."""
+    for consumer in consumers:
+        consumer.start()
+    count = 0
+    for record in records:
+        for consumer in consumers:
+            consumer.consume(record)
+        count += 1
+        if count % 100000 == 0:
+            logger.info(f'Scanned {count} records')
+    for consumer in consumers:
+        consumer.finish()
+    logger.info(f'Scanned {count} records in total')
+    return count
@@ -0,0 +1,259 @@
+import bisect
+import logging
+import math
+import os
+import re
+from functools import cached_property, partial
+
+from cmat.clinvar_xml_io.compression import MemberTrackingReader, SeekedGzipFile, open_decompressed, detect_format, \
+    ZSTD_FORMAT
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Start of a ClinVarSet element in the decompressed XML. A literal "<" cannot occur inside text or attribute values in
+# well-formed XML, so every occurrence of this byte string (followed by a space or ">") is a record boundary.
+CVS_START_TAG = b'<ClinVarSet'
+# The first ClinVarAccession within a ClinVarSet always belongs to the reference record (RCV).
+RCV_ACCESSION_REGEX = re.compile(rb'<ClinVarAccession [^>]*?Acc="(RCV[0-9]+)"')
+
+# Wrapping used to make a range of ClinVarSet records a well-formed XML document.
+FRAGMENT_PREFIX = b'<ReleaseSet>\n'
+FRAGMENT_SUFFIX = b'\n</ReleaseSet>\n'
+
+
+# Number of decompressed bytes read at a time when scanning for records.
+READ_SIZE = 4 * 1024 * 1024
+
+
+def default_index_path(clinvar_xml):
+    return clinvar_xml + '.cvsidx'
+
+
+def iterate_cvs_records(read_chunk):
+    """Scans decompressed ClinVar XML without parsing it, and yields a (decompressed byte offset, raw bytes) tuple for
+    every ClinVarSet. The data is obtained by repeatedly calling read_chunk until it returns an empty bytes object."""
+    buffer = b''
+    buffer_offset = 0     # Decompressed offset of the first byte in the buffer
+    search_pos = 0        # Position in the buffer from which to continue looking for record starts
+    record_start = None   # Position in the buffer of the last record start which was not yet yielded
+
+    while True:
+        chunk = read_chunk()
+        buffer += chunk
+        while True:
+            pos = buffer.find(CVS_START_TAG, search_pos)
+            # Require the full tag name plus the next character to be available to check for a boundary
+            if pos == -1 or pos + len(CVS_START_TAG) >= len(buffer):
+                break
+            search_pos = pos + len(CVS_START_TAG)
+            if buffer[search_pos:search_pos + 1] not in (b' ', b'>'):
+                continue
+            if record_start is not None:
+                yield buffer_offset + record_start, buffer[record_start:pos]
+            record_start = pos
+        if not chunk:
+            break
+        # Discard everything which is not needed anymore
+        search_pos = max(search_pos, len(buffer) - len(CVS_START_TAG))
+        trim = search_pos if record_start is None else min(record_start, search_pos)
+        buffer = buffer[trim:]
+        buffer_offset += trim
+        search_pos -= trim
+        if record_start is not None:
+            record_start -= trim
+    if record_start is not None:
+        # The last record is followed by the closing tag of the root element
+        record_end = buffer.rfind(b'</ReleaseSet>', record_start)
+        yield buffer_offset + record_start, buffer[record_start:record_end if record_end != -1 else len(buffer)]
+
+
+def iterate_cvs_boundaries(read_chunk):
+    """Yields the decompressed byte offset of every ClinVarSet, see iterate_cvs_records. Only the start tags are
+    searched for and the records are never copied, so this is much faster when their contents are not needed."""
+    tail = b''
+    tail_offset = 0  # Decompressed offset of the first byte in the tail
+    while True:
+        chunk = read_chunk()
+        buffer = tail + chunk
+        # Unless this is the end of the data, the character following the tag name might be in the next chunk
+        limit = max(len(buffer) - len(CVS_START_TAG), 0) if chunk else len(buffer)
+        pos = buffer.find(CVS_START_TAG)
+        while pos != -1 and pos < limit:
+            if buffer[pos + len(CVS_START_TAG):pos + len(CVS_START_TAG) + 1] in (b' ', b'>'):
+                yield tail_offset + pos
+            pos = buffer.find(CVS_START_TAG, pos + len(CVS_START_TAG))
+        if not chunk:
+            break
+        tail = buffer[limit:]
+        tail_offset += limit
+
+
+def get_chunk_boundaries(count, num_chunks):
+    """Splits the range of record numbers [0, count) into at most num_chunks contiguous ranges of equal size (except for
+    the last one), and returns them as a list of (start, end) tuples."""
+    if count == 0:
+        return []
+    step = math.ceil(count / num_chunks)
+    return [(start, min(start + step, count)) for start in range(0, count, step)]
+
+
+def count_records(clinvar_xml):
+    """Counts the ClinVarSet records in the gzipped ClinVar XML by scanning the decompressed bytes, without parsing
+    anything."""
+    with open_decompressed(clinvar_xml) as fh:
+        return sum(1 for _ in iterate_cvs_boundaries(partial(fh.read, READ_SIZE)))
+
+
+def iterate_cvs_offsets(read_chunk):
+    """Yields a (decompressed byte offset, RCV accession) tuple for every ClinVarSet, see iterate_cvs_records."""
+    for offset, record in iterate_cvs_records(read_chunk):
+        m = RCV_ACCESSION_REGEX.search(record)
+        yield offset, m.group(1).decode() if m else None
+
+
+def iterate_cvs_shards(read_chunk, records_per_shard, start=None, end=None):
+    """Splits decompressed ClinVar XML into shards of consecutive ClinVarSet records and yields each one as a
+    well-formed XML document (raw bytes). Optionally only records in the range [start, end) are included; the records
+    outside of it are skipped without being parsed."""
+    shard = []
+    for i, (_, record) in enumerate(iterate_cvs_records(read_chunk)):
+        if start and i < start:
+            continue
+        if end is not None and i >= end:
+            break
+        shard.append(record)
+        if len(shard) == records_per_shard:
+            yield b''.join([FRAGMENT_PREFIX] + shard + [FRAGMENT_SUFFIX])
+            shard = []
+    if shard:
+        yield b''.join([FRAGMENT_PREFIX] + shard + [FRAGMENT_SUFFIX])
+
+
+def build_index(clinvar_xml, index_file):
+    """Scans the gzipped ClinVar XML once and writes an index containing the decompressed byte offset and the RCV
+    accession of every ClinVarSet, as well as the locations of all gzip members which can be used as seek points."""
+    if detect_format(clinvar_xml) == ZSTD_FORMAT:
+        raise ValueError('Only gzip-compressed files (including BGZF) can be indexed')
+    logger.info(f'Building ClinVarSet index for {clinvar_xml}')
+    count = 0
+    with MemberTrackingReader(clinvar_xml) as reader, open(index_file, 'wt') as out:
+        out.write(f'#clinvar_xml_size={os.path.getsize(clinvar_xml)}\n')
+        for offset, accession in iterate_cvs_offsets(reader.read_chunk):
+            out.write(f'{accession}\t{offset}\n')
+            count += 1
+        for compressed_offset, decompressed_offset in reader.members:
+            out.write(f'#member\t{compressed_offset}\t{decompressed_offset}\n')
+    logger.info(f'Indexed {count} records in {len(reader.members)} gzip member(s)')
+    return count
+
+
+class ClinVarIndex:
+    """Byte-offset index of the ClinVarSet records in a gzipped ClinVar XML file, as created by build_index. Allows
+    reading any range of records without parsing the ones preceding it."""
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.clinvar_xml_size = None
+        self.accessions = []
+        self.offsets = []
+        # Seek points: parallel lists of compressed and decompressed offsets of gzip members
+        self.member_compressed_offsets = []
+        self.member_decompressed_offsets = []
+        with open(index_file, 'rt') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith('#clinvar_xml_size='):
+                    self.clinvar_xml_size = int(line.split('=')[1])
+                elif line.startswith('#member\t'):
+                    _, compressed_offset, decompressed_offset = line.split('\t')
+                    self.member_compressed_offsets.append(int(compressed_offset))
+                    self.member_decompressed_offsets.append(int(decompressed_offset))
+                elif line:
+                    accession, offset = line.split('\t')
+                    self.accessions.append(accession)
+                    self.offsets.append(int(offset))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @cached_property
+    def _record_numbers(self):
+        return {accession: i for i, accession in enumerate(self.accessions)}
+
+    def record_number(self, accession):
+        """Returns the (0-based) position of the record with a given RCV accession, or None if it's not present."""
+        return self._record_numbers.get(accession)
+
+    def matches(self, clinvar_xml):
+        """Checks whether this index was (likely) built from a given ClinVar XML file."""
+        return self.clinvar_xml_size == os.path.getsize(clinvar_xml)
+
+    def open_range(self, clinvar_xml, start=None, end=None):
+        """Returns a binary file-like object containing a well-formed XML document with records in the range
+        [start, end) from the ClinVar XML."""
+        start = start or 0
+        if start >= len(self):
+            return ClinVarSetRangeReader(None, 0, 0)
+        start_offset = self.offsets[start]
+        end_offset = self.offsets[end] if end is not None and end < len(self) else None
+
+        # Start decompressing from the last gzip member boundary preceding the first requested record
+        member = bisect.bisect_right(self.member_decompressed_offsets, start_offset) - 1
+        if member < 0:
+            fileobj = SeekedGzipFile(clinvar_xml)
+            skip = start_offset
+        else:
+            fileobj = SeekedGzipFile(clinvar_xml, self.member_compressed_offsets[member])
+            skip = start_offset - self.member_decompressed_offsets[member]
+        length = end_offset - start_offset if end_offset is not None else None
+        return ClinVarSetRangeReader(fileobj, skip, length)
+
+
+class ClinVarSetRangeReader:
+    """File-like object which reads a contiguous range of ClinVarSet records from a decompressed stream and wraps them
+    into a root element, so that they can be processed by a regular XML parser."""
+
+    def __init__(self, fileobj, skip, length=None):
+        self.fileobj = fileobj
+        # Number of bytes left to read from the underlying stream, or None to read until the end
+        self.remaining = length
+        self.parts = [FRAGMENT_PREFIX]
+        if fileobj is not None:
+            # Decompressed streams cannot seek without reading, but at least don't parse anything
+            while skip > 0:
+                skipped = len(fileobj.read(min(skip, 1024 * 1024)))
+                if not skipped:
+                    break
+                skip -= skipped
+        else:
+            self.remaining = 0
+        self.suffix_pending = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+    def read(self, size=-1):
+        if self.parts:
+            return self.parts.pop()
+        if size is None or size < 0:
+            size = 1024 * 1024
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+        data = self.fileobj.read(size) if size > 0 else b''
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        if data:
+            return data
+        if self.suffix_pending and self.remaining is not None:
+            # When reading until the end of file, the closing root tag is already present
+            self.suffix_pending = False
+            return FRAGMENT_SUFFIX
+        return b''
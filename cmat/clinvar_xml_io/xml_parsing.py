@@ -1,15 +1,47 @@
-import gzip
+import copy
 import logging
+import os
 import xml.etree.ElementTree as ElementTree
+from functools import lru_cache
+
+from cmat.clinvar_xml_io.compression import open_decompressed
+
+try:
+    import lxml.etree as LxmlTree
+except ImportError:
+    LxmlTree = None
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Supported XML parser backends. The lxml backend is considerably faster, but requires lxml to be installed.
+ETREE_PARSER = 'etree'
+LXML_PARSER = 'lxml'
+XML_PARSER_ENV_VARIABLE = 'CMAT_XML_PARSER'
+
+xml_parser = os.environ.get(XML_PARSER_ENV_VARIABLE, ETREE_PARSER).lower()
+
+
+def set_xml_parser(parser):
+    """Selects the parser backend used for all subsequent parsing. The initial value is taken from the CMAT_XML_PARSER
+    environment variable, defaulting to the standard library ElementTree."""
+    global xml_parser
+    xml_parser = parser.lower()
+
+
+def get_xml_parser(parser=None):
+    parser = parser or xml_parser
+    if parser not in (ETREE_PARSER, LXML_PARSER):
+        raise ValueError(f'Unknown XML parser: {parser}')
+    if parser == LXML_PARSER and LxmlTree is None:
+        raise ImportError('lxml must be installed to use the lxml XML parser')
+    return parser
+
 
 def parse_header_attributes(clinvar_xml):
     """Parses out attributes to the root-level ReleaseSet element and returns them as a dict."""
     attrib = None
-    with gzip.open(clinvar_xml, 'rt') as fh:
+    with open_decompressed(clinvar_xml) as fh:
         for event, elem in ElementTree.iterparse(fh, events=['start']):
             if elem.tag == 'ReleaseSet':
                 attrib = elem.attrib
@@ -29,7 +61,7 @@ def parse_header_attributes(clinvar_xml):
 
 
 def iterate_rcv_from_xml(clinvar_xml):
-    """Iterates through the gzipped ClinVar XML and yields complete <ReferenceClinVarAssertion> records."""
+    """Iterates through the compressed ClinVar XML and yields complete <ReferenceClinVarAssertion> records."""
     for cvs in iterate_cvs_from_xml(clinvar_xml):
         # Go to a ReferenceClinVarAssertion element. This corresponds to a single RCV record, the main unit of
         # ClinVar. There should only be one such record per ClinVarSet.
@@ -38,21 +70,68 @@ def iterate_rcv_from_xml(clinvar_xml):
 
 
 def iterate_cvs_from_xml(clinvar_xml):
-    """Iterates through the gzipped ClinVar XML and yields complete <ClinVarSet> elements."""
-    with gzip.open(clinvar_xml, 'rt') as fh:
-        for event, elem in ElementTree.iterparse(fh):
-            # Wait until we have built a complete ClinVarSet element
-            if elem.tag != 'ClinVarSet':
-                continue
-            # Return the complete record and then remove the processed element from the tree to save memory
-            yield elem
-            elem.clear()
+    """Iterates through the compressed ClinVar XML and yields complete <ClinVarSet> elements."""
+    with open_decompressed(clinvar_xml) as fh:
+        yield from iterate_cvs_from_stream(fh)
+
+
+def iterate_cvs_from_stream(fh):
+    """Iterates through a binary stream of decompressed ClinVar XML and yields complete <ClinVarSet> elements."""
+    if get_xml_parser() == LXML_PARSER:
+        yield from _iterate_cvs_with_lxml(fh)
+        return
+    for event, elem in ElementTree.iterparse(fh):
+        # Wait until we have built a complete ClinVarSet element
+        if elem.tag != 'ClinVarSet':
+            continue
+        # Return the complete record and then remove the processed element from the tree to save memory
+        yield elem
+        elem.clear()
+
+
+def _iterate_cvs_with_lxml(fh):
+    # Only build events for complete ClinVarSet elements, rather than for every element in the file
+    for event, elem in LxmlTree.iterparse(fh, events=('end',), tag='ClinVarSet', huge_tree=True):
+        yield elem
+        # Free the processed record, and also drop the references to it and any preceding siblings from the root
+        elem.clear(keep_tail=True)
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def parse_cvs_from_bytes(data, parser=None):
+    """Parses a complete in-memory XML document and returns a list of all <ClinVarSet> elements under its root."""
+    if get_xml_parser(parser) == LXML_PARSER:
+        return LxmlTree.fromstring(data, parser=LxmlTree.XMLParser(huge_tree=True)).findall('ClinVarSet')
+    return ElementTree.fromstring(data).findall('ClinVarSet')
+
+
+def is_lxml_element(node):
+    return LxmlTree is not None and isinstance(node, LxmlTree._Element)
+
+
+@lru_cache(maxsize=None)
+def compile_xpath(xpath):
+    return LxmlTree.XPath(xpath)
+
+
+def element_to_string(node):
+    """Serialises a single element (without any text following it), regardless of the parser which produced it."""
+    if is_lxml_element(node):
+        # Unlike ElementTree, lxml would also output namespace declarations inherited from the ancestors
+        node = copy.deepcopy(node)
+        LxmlTree.cleanup_namespaces(node)
+        return LxmlTree.tostring(node, encoding='utf-8', with_tail=False)
+    return ElementTree.tostring(node)
 
 
 def find_elements(node, xpath, allow_zero=True, allow_multiple=True):
     """Attempt to find child elements in a node by xpath. Raise exceptions if conditions are violated. Return a
     (possibly empty) list of elements."""
-    all_elements = node.findall(xpath)
+    if is_lxml_element(node):
+        all_elements = compile_xpath(xpath)(node)
+    else:
+        all_elements = node.findall(xpath)
     if (len(all_elements) == 0 and not allow_zero) or (len(all_elements) > 1 and not allow_multiple):
         raise AssertionError(f'Found {len(all_elements)} instances of {xpath} in {node}, which is not allowed')
     return all_elements
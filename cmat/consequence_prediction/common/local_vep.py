@@ -0,0 +1,68 @@
+"""Annotation of variants with a locally installed VEP and its offline cache, instead of VEP REST API. Local VEP outputs
+results in the same JSON format as the API, so they are processed by extract_consequences in exactly the same way."""
+
+import json
+import os
+import re
+import subprocess
+
+from cmat.consequence_prediction.common.vep import VepClient, VEP_SHORT_QUERY_DISTANCE, VEP_SHIFT_3PRIME
+
+# VEP executable, which can be overridden for installations which are not on the PATH
+VEP_EXECUTABLE = os.environ.get('CMAT_VEP_EXECUTABLE', 'vep')
+VEP_SPECIES = 'homo_sapiens'
+VEP_ASSEMBLY = 'GRCh38'
+# Starting VEP and loading its cache takes several seconds, so every process annotates a much larger batch than a
+# request to the API
+LOCAL_VEP_BATCH_SIZE = 20000
+LOCAL_VEP_CONCURRENCY = 4
+
+
+def get_cache_release(cache_dir, assembly=VEP_ASSEMBLY):
+    """Returns the latest Ensembl release of the VEP cache in cache_dir for the given assembly. The cache of each
+    release is stored in a directory such as homo_sapiens/113_GRCh38."""
+    species_dir = os.path.join(cache_dir, VEP_SPECIES)
+    releases = [int(match.group(1)) for match in (re.fullmatch(rf'(\d+)_{assembly}', name)
+                                                  for name in os.listdir(species_dir)) if match] \
+        if os.path.isdir(species_dir) else []
+    if not releases:
+        raise ValueError(f'No VEP cache for {VEP_SPECIES} {assembly} found in {cache_dir}')
+    return max(releases)
+
+
+class LocalVepClient(VepClient):
+    """
+    Same as VepClient, but annotates each batch of variants by running VEP in offline mode with the cache in cache_dir,
+    rather than by querying the API. Batches are annotated by up to `concurrency` VEP processes at once, and results
+    can be cached in a VepCache in the same way, with the Ensembl release of the VEP cache.
+    """
+
+    batch_size = LOCAL_VEP_BATCH_SIZE
+
+    def __init__(self, cache_dir, concurrency=LOCAL_VEP_CONCURRENCY, search_distance=VEP_SHORT_QUERY_DISTANCE,
+                 cache=None, assembly=VEP_ASSEMBLY, executable=VEP_EXECUTABLE):
+        ensembl_release = get_cache_release(cache_dir, assembly)
+        # Failures of local VEP are not transient, so they are not retried
+        super().__init__(concurrency=concurrency, requests_per_second=float('inf'), search_distance=search_distance,
+                         tries=1, cache=cache, ensembl_release=ensembl_release)
+        self.cache_dir = cache_dir
+        self.assembly = assembly
+        self.executable = executable
+
+    def get_command(self):
+        return [
+            self.executable, '--offline', '--cache', '--dir_cache', self.cache_dir,
+            '--species', VEP_SPECIES, '--assembly', self.assembly, '--cache_version', str(self.ensembl_release),
+            # Same options as used by the API, which outputs gene symbols and biotypes by default
+            '--distance', str(self.search_distance), '--shift_3prime', str(VEP_SHIFT_3PRIME), '--symbol', '--biotype',
+            '--json', '--output_file', 'STDOUT', '--no_stats', '--quiet',
+        ]
+
+    def post(self, variants):
+        """Annotates a single batch of variants with local VEP, which reads them from its standard input and outputs
+        the result for each of them as a line of JSON."""
+        process = subprocess.run(self.get_command(), input=''.join(variant + '\n' for variant in variants),
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f'VEP exited with code {process.returncode}: {process.stderr.strip()}')
+        return [json.loads(line) for line in process.stdout.splitlines() if line.strip()]
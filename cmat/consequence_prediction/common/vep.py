@@ -1,10 +1,16 @@
+import asyncio
 import itertools
 import json
 import logging
-from collections import defaultdict
+import random
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from functools import lru_cache
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from retry import retry
 
@@ -15,28 +21,230 @@ logger.setLevel(logging.INFO)
 # The "distance to the nearest gene" parameters, used to query VEP.
 VEP_SHORT_QUERY_DISTANCE = 5000
 
+VEP_REQUEST_URL = 'https://rest.ensembl.org/vep/human/region'
+VEP_REQUEST_HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+# VEP REST API accepts at most 200 variants per request, and Ensembl allows at most 15 requests per second per client.
+VEP_BATCH_SIZE = 200
+VEP_CONCURRENCY = 8
+VEP_REQUESTS_PER_SECOND = 10
+VEP_SHIFT_3PRIME = 0
+
 
 def deduplicate_list(lst):
     """Removes duplicates from a list containing arbitrary (possibly unhashable) values."""
     return [element for element, _ in itertools.groupby(sorted(lst))]
 
 
-@retry(tries=10, delay=5, backoff=1.2, jitter=(1, 3), logger=logger)
 def query_vep(variants, search_distance=VEP_SHORT_QUERY_DISTANCE):
-    """Query VEP and return results in JSON format. Upstream/downstream genes are searched up to a given distance."""
-    ensembl_request_url = 'https://rest.ensembl.org/vep/human/region'
-    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-    result = requests.post(ensembl_request_url, headers=headers, data=json.dumps({
-        'variants': variants, 'distance': search_distance, 'shift_3prime': 0,
-    }))
-
-    if result.status_code == 400:
-        logger.error('Bad request for the following variants:')
-        logger.error(variants)
-
-    # If there was an HTTP error, raise an exception. This will be caught by @retry
+    """Query VEP and return results in JSON format. Upstream/downstream genes are searched up to a given distance.
+    Variants rejected by VEP are left out of the results (see VepClient)."""
+    vep_client = VepClient(concurrency=1, search_distance=search_distance)
+    return [result for _, results in vep_client.query_all(variants, batch_size=max(len(variants), 1))
+            for result in results]
+
+
+def is_bad_request(exception):
+    return getattr(exception, 'response', None) is not None and exception.response.status_code == 400
+
+
+def parse_retry_after(value):
+    """Returns the number of seconds to wait given by a Retry-After header, which is either a number of seconds or an
+    HTTP date, or None if it is neither."""
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class RateLimiter:
+    """Spaces out the starts of requests made from an event loop, so that at most a given number is started per
+    second."""
+
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second
+        self.next_start = 0
+
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class VepClient:
+    """
+    Client querying VEP with many batches of variants concurrently. All requests share a pool of connections, at most
+    `concurrency` of them are in flight at any time, and at most `requests_per_second` of them are started per second,
+    so that the load on Ensembl is the same regardless of the number of variants. Failed requests are retried with an
+    increasing delay, except for bad requests: a batch which VEP rejects is split in halves which are queried
+    separately, until the variants causing the rejection are isolated. These are left out of the results and recorded
+    in `rejected_variants`, and all other variants of the batch are still annotated.
+
+    Results are streamed in the order of the batches, either to an asynchronous consumer (see stream) or to a regular
+    one (see query_all). If a VepCache is given, only the variants without cached results for the Ensembl release are
+    queried, and their results are added to the cache.
+    """
+
+    def __init__(self, concurrency=VEP_CONCURRENCY, requests_per_second=VEP_REQUESTS_PER_SECOND,
+                 search_distance=VEP_SHORT_QUERY_DISTANCE, tries=10, delay=5, backoff=1.2, jitter=(1, 3), cache=None,
+                 ensembl_release=None):
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.search_distance = search_distance
+        self.tries = tries
+        self.delay = delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.cache = cache
+        self.ensembl_release = ensembl_release
+        self.rejected_variants = []
+        self.session = requests.Session()
+        self.session.headers.update(VEP_REQUEST_HEADERS)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    def post(self, variants):
+        """Queries VEP with a single batch of variants, without retrying."""
+        result = self.session.post(VEP_REQUEST_URL, data=json.dumps({
+            'variants': variants, 'distance': self.search_distance, 'shift_3prime': VEP_SHIFT_3PRIME,
+        }))
+        result.raise_for_status()
+        return result.json()
+
+    async def query(self, variants, executor, semaphore, rate_limiter):
+        """Queries VEP with a single batch of variants, retrying on errors other than bad requests."""
+        loop = asyncio.get_running_loop()
+        delay = self.delay
+        for attempt in range(1, self.tries + 1):
+            async with semaphore:
+                await rate_limiter.wait()
+                try:
+                    return await loop.run_in_executor(executor, self.post, variants)
+                except requests.RequestException as e:
+                    # The same request would be rejected again
+                    if attempt == self.tries or is_bad_request(e):
+                        raise
+                    # Ensembl asks clients which exceed the rate limit to wait for a given time
+                    retry_after = e.response.headers.get('Retry-After') if e.response is not None else None
+                    wait = parse_retry_after(retry_after) if retry_after else None
+                    if wait is None:
+                        wait = delay
+                    logger.warning(f'{e}, retrying in {wait} seconds...')
+            await asyncio.sleep(wait)
+            delay = delay * self.backoff + random.uniform(*self.jitter)
+
+    async def query_or_bisect(self, variants, executor, semaphore, rate_limiter):
+        """Same as query, but if VEP rejects the batch as a bad request, its halves are queried separately. Each bad
+        variant is thus isolated in a number of requests logarithmic in the batch size."""
+        try:
+            return await self.query(variants, executor, semaphore, rate_limiter)
+        except requests.HTTPError as e:
+            if not is_bad_request(e):
+                raise
+            if len(variants) == 1:
+                reason = ' '.join(e.response.text.split())
+                logger.warning(f'Variant {variants[0]} rejected by VEP: {reason}')
+                self.rejected_variants.append((variants[0], reason))
+                return []
+        middle = len(variants) // 2
+        first_half, second_half = await asyncio.gather(
+            self.query_or_bisect(variants[:middle], executor, semaphore, rate_limiter),
+            self.query_or_bisect(variants[middle:], executor, semaphore, rate_limiter))
+        return first_half + second_half
+
+    def write_rejected_variants(self, output_file):
+        """Writes the variants rejected by VEP so far, together with the reason given by VEP, as TSV."""
+        with open(output_file, 'wt') as f:
+            for variant, reason in self.rejected_variants:
+                f.write(f'{variant}\t{reason}\n')
+
+    # Number of variants queried in a single request, unless another one is given to stream or query_all
+    batch_size = VEP_BATCH_SIZE
+
+    async def stream(self, variants, batch_size=None):
+        """Queries VEP with all variants in batches of batch_size, and yields each batch together with its results, in
+        the order of the batches. Cached results are yielded first, in batches of the same size."""
+        batch_size = batch_size or self.batch_size
+        if self.cache is None:
+            uncached_batches = self.stream_uncached(variants, batch_size)
+            try:
+                async for batch, results in uncached_batches:
+                    yield batch, results
+            finally:
+                # Cancel the queued batches right away if the consumer stops early, rather than whenever the generator
+                # is garbage collected, possibly after the event loop is closed
+                await uncached_batches.aclose()
+            return
+
+        ensembl_release = self.ensembl_release or query_ensembl_release()
+        cached = self.cache.get_many(variants, ensembl_release, self.search_distance, VEP_SHIFT_3PRIME)
+        cached_variants = [variant for variant in variants if variant in cached]
+        for i in range(0, len(cached_variants), batch_size):
+            batch = cached_variants[i:i + batch_size]
+            yield batch, [cached[variant] for variant in batch]
+        uncached_variants = [variant for variant in variants if variant not in cached]
+        uncached_batches = self.stream_uncached(uncached_variants, batch_size)
+        try:
+            async for batch, results in uncached_batches:
+                self.cache.put_many(results, ensembl_release, self.search_distance, VEP_SHIFT_3PRIME)
+                yield batch, results
+        finally:
+            await uncached_batches.aclose()
+        self.cache.log_hit_rate()
+
+    async def stream_uncached(self, variants, batch_size):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        rate_limiter = RateLimiter(self.requests_per_second)
+        pending = deque()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            try:
+                for i in range(0, len(variants), batch_size):
+                    batch = variants[i:i + batch_size]
+                    pending.append((batch, asyncio.ensure_future(
+                        self.query_or_bisect(batch, executor, semaphore, rate_limiter))))
+                    # Keep the next batches queued while waiting for the first one, so that the requests are not
+                    # blocked by a single slow response, but do not queue all of them, so that results are not held
+                    # in memory for long
+                    if len(pending) >= 2 * self.concurrency:
+                        batch, task = pending.popleft()
+                        yield batch, await task
+                while pending:
+                    batch, task = pending.popleft()
+                    yield batch, await task
+            finally:
+                for _, task in pending:
+                    task.cancel()
+                await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+    def query_all(self, variants, batch_size=None):
+        """Same as stream, for consumers outside an event loop."""
+        loop = asyncio.new_event_loop()
+        batches = self.stream(variants, batch_size)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(batches.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(batches.aclose())
+            loop.close()
+
+
+@lru_cache
+@retry(tries=10, delay=5, backoff=1.2, jitter=(1, 3), logger=logger)
+def query_ensembl_release():
+    """Returns the current Ensembl release, which VEP results depend on."""
+    result = requests.get('https://rest.ensembl.org/info/software?content-type=application/json')
     result.raise_for_status()
-    return result.json()
+    return result.json()['release']
 
 
 @lru_cache
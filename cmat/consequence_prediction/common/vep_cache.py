@@ -0,0 +1,101 @@
+"""Persistent cache of VEP results, so that variants annotated by a previous run are not queried again. Results are
+stored per variant, and are keyed by the variant, the Ensembl release and the parameters of the query, so that results
+of a different release or of a different query are never returned."""
+
+import json
+import logging
+import sqlite3
+
+logger = logging.getLogger('consequence_mapping')
+
+# Time for which a process waits for another one writing to the same cache, in seconds
+LOCK_TIMEOUT = 600
+# Number of variants looked up in a single query, below the limit of SQLite on the number of query parameters
+QUERY_CHUNK_SIZE = 500
+
+
+def normalise_variant(variant):
+    """Returns the key of a VEP variant identifier, which does not depend on the whitespace used in it."""
+    return ' '.join(variant.split())
+
+
+class VepCache:
+    """
+    Cache of raw VEP results stored in an SQLite database. Hits and misses of all lookups are counted, and can be
+    reported with log_hit_rate.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        # Allows several processes (e.g. the SNP and the structural variant pipelines) to use the cache at once
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS vep_results (
+                variant TEXT NOT NULL,
+                ensembl_release INTEGER NOT NULL,
+                distance INTEGER NOT NULL,
+                shift_3prime INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (variant, ensembl_release, distance, shift_3prime)
+            ) WITHOUT ROWID''')
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_many(self, variants, ensembl_release, distance, shift_3prime):
+        """Returns a dict of the cached VEP results of the given variants, by variant. Variants which are not cached
+        are not included."""
+        keys = {normalise_variant(variant): variant for variant in variants}
+        key_list = list(keys)
+        cached = {}
+        for i in range(0, len(key_list), QUERY_CHUNK_SIZE):
+            chunk = key_list[i:i + QUERY_CHUNK_SIZE]
+            rows = self.connection.execute(
+                'SELECT variant, result FROM vep_results '
+                'WHERE ensembl_release = ? AND distance = ? AND shift_3prime = ? '
+                f'AND variant IN ({", ".join("?" * len(chunk))})',
+                (ensembl_release, distance, shift_3prime, *chunk))
+            for key, result in rows:
+                cached[keys[key]] = json.loads(result)
+        self.hits += len(cached)
+        self.misses += len(variants) - len(cached)
+        return cached
+
+    def put_many(self, vep_results, ensembl_release, distance, shift_3prime):
+        """Stores VEP results, each of which is stored for the variant given in its 'input' attribute."""
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO vep_results VALUES (?, ?, ?, ?, ?)',
+                [(normalise_variant(result['input']), ensembl_release, distance, shift_3prime, json.dumps(result))
+                 for result in vep_results])
+
+    def invalidate(self, keep_release=None):
+        """Deletes the results of all Ensembl releases other than keep_release, or all results if it is None. Returns
+        the number of deleted results."""
+        with self.connection:
+            if keep_release is None:
+                deleted = self.connection.execute('DELETE FROM vep_results').rowcount
+            else:
+                deleted = self.connection.execute(
+                    'DELETE FROM vep_results WHERE ensembl_release != ?', (keep_release,)).rowcount
+        self.connection.execute('VACUUM')
+        return deleted
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM vep_results').fetchone()[0]
+
+    def log_hit_rate(self):
+        total = self.hits + self.misses
+        if total:
+            logger.info(f'VEP cache {self.path}: {self.hits} hits, {self.misses} misses '
+                        f'({self.hits / total:.1%} hit rate)')
+
+    def close(self):
+        self.connection.close()
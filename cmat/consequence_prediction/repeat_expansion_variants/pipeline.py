@@ -8,7 +8,9 @@ import numpy as np
 import pandas as pd
 
 from cmat import clinvar_xml_io
+from cmat.clinvar_xml_io.columnar import open_dataset
 from cmat.clinvar_xml_io.repeat_variant import parse_all_identifiers, repeat_type_from_length
+from cmat.clinvar_xml_io.scan import RecordConsumer
 import cmat.consequence_prediction.common.biomart as biomart
 
 logging.basicConfig()
@@ -18,37 +20,49 @@ logger.setLevel(logging.INFO)
 
 STANDARD_CHROMOSOME_NAMES = {str(c) for c in range(1, 23)} | {'X', 'Y', 'M', 'MT'}
 
+# Columns of the dataframe with repeat expansion variant candidates extracted from ClinVar.
+CANDIDATE_COLUMNS = ('Name', 'RCVaccession', 'GeneSymbol', 'HGNC_ID', 'TranscriptID', 'RepeatType')
+
 
 def none_to_nan(value):
     """Converts arguments which are None to np.nan, for consistency inside a Pandas dataframe."""
     return np.nan if value is None else value
 
 
-def load_clinvar_data(clinvar_xml):
-    """Load ClinVar data, preprocess, and return it as a Pandas dataframe."""
-    # Iterate through ClinVar XML records
-    variant_data = []  # To populate the return dataframe (see columns below)
-    stats = Counter()
-    for i, clinvar_record in enumerate(clinvar_xml_io.ClinVarDataset(clinvar_xml)):
-        if i and i % 100000 == 0:
-            total_repeat_expansion_variants = stats[clinvar_xml_io.ClinVarRecordMeasure.MS_REPEAT_EXPANSION] + \
-                                              stats[clinvar_xml_io.ClinVarRecordMeasure.MS_NO_COMPLETE_COORDS]
-            logger.info(f'Processed {i} records, collected {total_repeat_expansion_variants} repeat expansion variant '
-                        f'candidates')
+class RepeatCandidateConsumer(RecordConsumer):
+    """Collects repeat expansion variant candidates from ClinVar records, as well as statistics of microsatellite
+    categories. Optionally writes the candidates to a file (see write_candidates), so that the rest of the pipeline can
+    be run separately from parsing the XML."""
+
+    def __init__(self, output_file=None):
+        self.output_file = output_file
+        self.variant_data = []  # To populate the candidates dataframe (see CANDIDATE_COLUMNS)
+        self.stats = Counter()
+        self.count = 0
+
+    def total_repeat_expansion_variants(self):
+        return self.stats[clinvar_xml_io.ClinVarRecordMeasure.MS_REPEAT_EXPANSION] + \
+            self.stats[clinvar_xml_io.ClinVarRecordMeasure.MS_NO_COMPLETE_COORDS]
+
+    def consume(self, clinvar_record):
+        self.count += 1
+        if self.count % 100000 == 0:
+            logger.info(f'Processed {self.count} records, collected {self.total_repeat_expansion_variants()} repeat '
+                        f'expansion variant candidates')
 
         # Skip a record if it does not contain variant information
         if not clinvar_record.measure:
-            continue
+            return
         measure = clinvar_record.measure
 
         # Repeat expansion events come in two forms: with explicit coordinates and allele sequences (CHROM/POS/REF/ALT),
         # or without them. In the first case we can compute the explicit variant length as len(ALT) - len(REF). In the
         # second case, which is more rare but still important, we have to resort to parsing HGVS-like variant names.
         if measure.microsatellite_category:
-            stats[measure.microsatellite_category] += 1
+            self.stats[measure.microsatellite_category] += 1
         # Skip the record if it's a deletion or a short insertion
         if not measure.is_repeat_expansion_variant:
-            continue
+            return
 
         # Extract gene symbol(s). Here and below, dashes are sometimes assigned to be compatible with the variant
         # summary format which was used previously.
@@ -67,7 +81,7 @@ def load_clinvar_data(clinvar_xml):
 
         # Append data strings
         for gene_symbol in gene_symbols:
-            variant_data.append([
+            self.variant_data.append([
                 measure.preferred_or_other_name,
                 clinvar_record.accession,
                 gene_symbol,
@@ -75,21 +89,50 @@ def load_clinvar_data(clinvar_xml):
                 none_to_nan(transcript_id),
                 none_to_nan(repeat_type)
             ])
-    total_repeat_expansion_variants = stats[clinvar_xml_io.ClinVarRecordMeasure.MS_REPEAT_EXPANSION] + \
-                                      stats[clinvar_xml_io.ClinVarRecordMeasure.MS_NO_COMPLETE_COORDS]
-    logger.info(f'Done. A total of {i} records, {total_repeat_expansion_variants} repeat expansion variant candidates')
 
-    variants = pd.DataFrame(variant_data, columns=('Name',
-                                                   'RCVaccession',
-                                                   'GeneSymbol',
-                                                   'HGNC_ID',
-                                                   'TranscriptID',
-                                                   'RepeatType'))
+    def finish(self):
+        logger.info(f'Done. A total of {self.count} records, {self.total_repeat_expansion_variants()} repeat expansion '
+                    f'variant candidates')
+        if self.output_file:
+            write_candidates(self.get_variants(), self.stats, self.output_file)
+
+    def get_variants(self):
+        variants = pd.DataFrame(self.variant_data, columns=CANDIDATE_COLUMNS)
+        # Since the same record can have coordinates in multiple builds, it can be repeated. Remove duplicates
+        variants = variants.drop_duplicates()
+        # Sort values by variant name
+        return variants.sort_values(by=['Name'])
 
-    # Since the same record can have coordinates in multiple builds, it can be repeated. Remove duplicates
-    variants = variants.drop_duplicates()
-    # Sort values by variant name
-    return variants.sort_values(by=['Name']), stats
+
+def load_clinvar_data(clinvar_xml):
+    """Load ClinVar data (XML or its columnar export), preprocess, and return it as a Pandas dataframe."""
+    consumer = RepeatCandidateConsumer()
+    open_dataset(clinvar_xml, columns=['accession', 'vcv_id', 'measure']).scan([consumer])
+    return consumer.get_variants(), consumer.stats
+
+
+def write_candidates(variants, stats, candidates_file):
+    """Writes the candidates dataframe to a TSV file, preceded by the microsatellite statistics as comment lines."""
+    with open(candidates_file, 'wt') as f:
+        for category, count in stats.items():
+            f.write(f'#{category}\t{count}\n')
+        variants.to_csv(f, sep='\t', index=False)
+
+
+def load_candidates(candidates_file):
+    """Loads the candidates written by write_candidates, in the same form as returned by load_clinvar_data."""
+    stats = Counter()
+    header_lines = 0
+    with open(candidates_file, 'rt') as f:
+        for line in f:
+            if not line.startswith('#'):
+                break
+            category, count = line[1:].rstrip('\n').split('\t')
+            stats[category] = int(count)
+            header_lines += 1
+    variants = pd.read_csv(candidates_file, sep='\t', skiprows=header_lines, dtype=str, keep_default_na=False,
+                           na_values=[''])
+    return variants, stats
 
 
 def annotate_ensembl_gene_info(variants, include_transcripts):
@@ -244,7 +287,7 @@ def generate_all_variants_file(output_dataframe, variants):
     variants.to_csv(output_dataframe, sep='\t', index=False)
 
 
-def main(clinvar_xml, include_transcripts, output_consequences=None, output_dataframe=None):
+def main(clinvar_xml, include_transcripts, output_consequences=None, output_dataframe=None, clinvar_candidates=None):
     """Process data and generate output files.
 
     Args:
@@ -253,10 +296,15 @@ def main(clinvar_xml, include_transcripts, output_consequences=None, output_data
         output_consequences: filepath to the output file with variant consequences. The file uses a 6-column format
             compatible with the VEP mapping pipeline (see /consequence_prediction/README.md).
         output_dataframe: filepath to the output file with the full dataframe used in the analysis. This will contain
-            all relevant columns and can be used for review or debugging purposes."""
+            all relevant columns and can be used for review or debugging purposes.
+        clinvar_candidates: filepath to the candidates previously extracted from the ClinVar XML file by
+            RepeatCandidateConsumer. If provided, clinvar_xml is not used."""
 
     logger.info('Load and preprocess variant data')
-    variants, s = load_clinvar_data(clinvar_xml)
+    if clinvar_candidates:
+        variants, s = load_candidates(clinvar_candidates)
+    else:
+        variants, s = load_clinvar_data(clinvar_xml)
 
     # Output ClinVar record statistics
     logger.info(f'''
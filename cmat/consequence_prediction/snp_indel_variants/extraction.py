@@ -0,0 +1,38 @@
+"""Extraction of variants with complete coordinates from ClinVar, for processing by the VEP mapping pipeline."""
+
+import re
+
+from cmat.clinvar_xml_io.scan import RecordConsumer
+
+# A regular expression to detect alleles with IUPAC ambiguity bases.
+IUPAC_AMBIGUOUS_SEQUENCE = re.compile(r'[^ACGT]')
+
+
+def get_vep_variant(clinvar_record):
+    """Returns the variant of a ClinVar record in CHROM:POS:REF:ALT format, or None if it cannot be processed by VEP."""
+    if clinvar_record.measure is None or not clinvar_record.measure.has_complete_coordinates:
+        return None
+    m = clinvar_record.measure
+    if IUPAC_AMBIGUOUS_SEQUENCE.search(m.vcf_ref + m.vcf_alt):
+        return None
+    return f'{m.chr}:{m.vcf_pos}:{m.vcf_ref}:{m.vcf_alt}'
+
+
+class VepVariantConsumer(RecordConsumer):
+    """Writes the variants of all records which can be processed by VEP, one per line. The output is not
+    deduplicated."""
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.outfile = None
+
+    def start(self):
+        self.outfile = open(self.output_file, 'wt')
+
+    def consume(self, record):
+        variant = get_vep_variant(record)
+        if variant:
+            self.outfile.write(variant + '\n')
+
+    def finish(self):
+        self.outfile.close()
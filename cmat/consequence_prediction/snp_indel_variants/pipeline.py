@@ -12,13 +12,36 @@ import sys
 
 from retry import retry
 
-from cmat.consequence_prediction.common.vep import query_vep, extract_consequences, deduplicate_list
+from cmat.consequence_prediction.common.vep import VepClient, extract_consequences, deduplicate_list, \
+    VEP_CONCURRENCY, VEP_REQUESTS_PER_SECOND
+from cmat.consequence_prediction.common.local_vep import LocalVepClient
+from cmat.consequence_prediction.common.vep_cache import VepCache
 
 parser = argparse.ArgumentParser(description=__doc__)
 parser.add_argument(
     '--include-transcripts', required=False, action='store_true',
     help='Whether to include transcript IDs along with consequence terms'
 )
+parser.add_argument(
+    '--concurrency', type=int, default=VEP_CONCURRENCY,
+    help='Maximum number of VEP requests in flight at any time'
+)
+parser.add_argument(
+    '--requests-per-second', type=float, default=VEP_REQUESTS_PER_SECOND,
+    help='Maximum number of VEP requests started per second'
+)
+parser.add_argument(
+    '--vep-cache', required=False,
+    help='VEP results cache, only variants which are not in it are queried (will be created if it does not exist)'
+)
+parser.add_argument(
+    '--local-vep-cache', required=False,
+    help='VEP offline cache directory; if provided, variants are annotated with local VEP instead of VEP API'
+)
+parser.add_argument(
+    '--vep-rejects', required=False,
+    help='File to output the variants rejected by VEP to, together with the reason for rejection'
+)
 
 logging.basicConfig()
 logger = logging.getLogger('consequence_mapping')
@@ -110,13 +133,12 @@ def get_variants_without_consequences(results_by_variant):
     })
 
 
-def process_variants(variants, include_transcripts):
-    """Given a list of variant IDs, return a list of consequence types (each including Ensembl gene name & ID and a
-    functional consequence code) for a given variant.
+def process_vep_results(vep_results, include_transcripts):
+    """Given VEP results for a batch of variants, return a list of consequence types (each including Ensembl gene name &
+    ID and a functional consequence code) for each variant.
     """
-    # Query VEP with default parameters, looking for variants affecting protein coding and miRNA transcripts
-    # up to a standard distance (5000 nucleotides either way, which is default for VEP) from the variant.
-    vep_results = query_vep(variants=variants)
+    # Consider consequences affecting protein coding and miRNA transcripts up to a standard distance (5000 nucleotides
+    # either way, which is default for VEP) from the variant.
     results_by_variant = extract_consequences(vep_results=vep_results, acceptable_biotypes={'protein_coding', 'miRNA'},
                                               include_transcripts=include_transcripts)
 
@@ -133,6 +155,16 @@ def process_variants(variants, include_transcripts):
             yield consequence_to_yield
 
 
+def process_variants(variants, include_transcripts, vep_client=None):
+    """Given a list of variant IDs, return a list of consequence types (each including Ensembl gene name & ID and a
+    functional consequence code) for a given variant. Variants are queried in concurrent batches, and the consequences
+    of each batch are yielded as soon as they are available.
+    """
+    vep_client = vep_client or VepClient()
+    for _, vep_results in vep_client.query_all(variants):
+        yield from process_vep_results(vep_results, include_transcripts)
+
+
 def main():
     # Parse command line arguments
     args = parser.parse_args()
@@ -140,8 +172,14 @@ def main():
     # Load variants to query from STDIN
     variants_to_query = [colon_based_id_to_vep_id(v) for v in sys.stdin.read().splitlines()]
 
-    # Query VEP with all variants at once (for the purpose of efficiency), print out the consequences to STDOUT.
-    consequences = process_variants(variants_to_query, args.include_transcripts)
+    # Query VEP with all variants in concurrent batches, print out the consequences to STDOUT.
+    vep_cache = VepCache(args.vep_cache) if args.vep_cache else None
+    if args.local_vep_cache:
+        vep_client = LocalVepClient(args.local_vep_cache, concurrency=args.concurrency, cache=vep_cache)
+    else:
+        vep_client = VepClient(concurrency=args.concurrency, requests_per_second=args.requests_per_second,
+                               cache=vep_cache)
+    consequences = process_variants(variants_to_query, args.include_transcripts, vep_client)
     if args.include_transcripts:
         for variant_id, gene_id, gene_symbol, consequence_term, transcript_id in consequences:
             print('\t'.join([vep_id_to_colon_id(variant_id), gene_id, gene_symbol, consequence_term, transcript_id]))
@@ -150,6 +188,12 @@ def main():
             print('\t'.join([vep_id_to_colon_id(variant_id), gene_id, gene_symbol, consequence_term]))
 
     logger.info('Successfully processed {} variants'.format(len(variants_to_query)))
+    if vep_client.rejected_variants:
+        logger.warning('{} variant(s) rejected by VEP'.format(len(vep_client.rejected_variants)))
+    if args.vep_rejects:
+        vep_client.write_rejected_variants(args.vep_rejects)
+    if vep_cache:
+        vep_cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,183 @@
+"""Local index of Ensembl gene and transcript coordinates, which finds the genes overlapped by a genomic span without
+querying VEP. It is used to skip structural variants which overlap too many genes to be used (see
+clinvar_to_evidence_strings.MAX_TARGET_GENES) before querying VEP, and as a first-pass annotator of the spans derived
+from HGVS identifiers (see pipeline.hgvs_to_vep_identifier)."""
+
+import gzip
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Transcript biotypes considered by the structural variant pipeline (see extract_consequences)
+ACCEPTABLE_BIOTYPES = frozenset({'protein_coding', 'miRNA'})
+
+# How a span overlaps a gene
+CONTAINED = 'contained'  # the span is within the gene
+COVERED = 'covered'  # the whole gene is within the span
+PARTIAL = 'partial'  # the span overlaps one end of the gene
+
+GTF_ATTRIBUTE_REGEX = re.compile(r'(\w+) "([^"]*)"')
+REFSEQ_CHROMOSOME_REGEX = re.compile(r'NC_0+(\d+)\.\d+')
+REFSEQ_MITOCHONDRIAL_ACCESSION = 'NC_012920'
+
+
+def refseq_to_chromosome(accession):
+    """Converts a RefSeq accession of a GRCh38 chromosome into the chromosome name used by Ensembl. Example:
+    'NC_000016.10' → '16', 'NC_000023.11' → 'X'. Returns None for other accessions."""
+    if accession.split('.')[0] == REFSEQ_MITOCHONDRIAL_ACCESSION:
+        return 'MT'
+    m = REFSEQ_CHROMOSOME_REGEX.fullmatch(accession)
+    if not m:
+        return None
+    number = int(m.group(1))
+    return {23: 'X', 24: 'Y'}.get(number, str(number)) if 1 <= number <= 24 else None
+
+
+class IntervalTree:
+    """
+    Static interval tree of half-open intervals [start, end), each with a value. Intervals are sorted by start and
+    stored as an implicit binary search tree over this order, where each node also stores the maximum end of its
+    subtree, so that an overlap query takes O(log n + k) time for k overlapping intervals.
+    """
+
+    __slots__ = ('starts', 'ends', 'values', 'max_ends', 'max_level')
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.values = [value for _, _, value in intervals]
+        self.max_ends = list(self.ends)
+        self.max_level = self.index()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def index(self):
+        """Computes the maximum end of each subtree, and returns the level of the root. Nodes at level k are the ones
+        whose index has exactly k lowest bits set; the last subtrees can be incomplete, in which case the missing
+        children stand for the last node (last_i) at their level."""
+        n = len(self.starts)
+        if n == 0:
+            return -1
+        last_i = (n - 1) & ~1
+        last = self.max_ends[last_i]
+        k = 1
+        while 1 << k <= n:
+            x = 1 << (k - 1)
+            for i in range((x << 1) - 1, n, x << 2):
+                right = self.max_ends[i + x] if i + x < n else last
+                self.max_ends[i] = max(self.ends[i], self.max_ends[i - x], right)
+            # Move last_i to its parent at level k
+            last_i = last_i - x if last_i >> k & 1 else last_i + x
+            if last_i < n and self.max_ends[last_i] > last:
+                last = self.max_ends[last_i]
+            k += 1
+        return k - 1
+
+    def overlap(self, start, end):
+        """Returns the values of all intervals which overlap [start, end), in the order of their starts."""
+        return [self.values[i] for i in self.overlap_indices(start, end)]
+
+    def overlap_indices(self, start, end):
+        """Returns the positions in the tree of all intervals which overlap [start, end), in increasing order."""
+        n = len(self.starts)
+        starts, ends, max_ends = self.starts, self.ends, self.max_ends
+        found = []
+        if n == 0:
+            return found
+        stack = [((1 << self.max_level) - 1, self.max_level, False)]
+        while stack:
+            x, k, left_done = stack.pop()
+            if k <= 3:
+                # Small subtrees are scanned linearly
+                i0 = x >> k << k
+                for i in range(i0, min(i0 + (1 << (k + 1)) - 1, n)):
+                    if starts[i] >= end:
+                        break
+                    if start < ends[i]:
+                        found.append(i)
+            elif not left_done:
+                y = x - (1 << (k - 1))
+                stack.append((x, k, True))
+                # The left subtree is skipped if none of its intervals ends after the start of the query
+                if y >= n or max_ends[y] > start:
+                    stack.append((y, k - 1, False))
+            elif x < n and starts[x] < end:
+                if start < ends[x]:
+                    found.append(x)
+                stack.append((x + (1 << (k - 1)), k - 1, False))
+        return sorted(found)
+
+
+class GeneIntervalIndex:
+    """
+    Coordinates of Ensembl transcripts and of their genes, by chromosome. As in extract_consequences, a gene is
+    overlapped by a span if one of its transcripts of the acceptable biotypes is.
+    """
+
+    __slots__ = ('trees', 'gene_spans')
+
+    def __init__(self, transcripts):
+        """Builds the index from an iterable of (chromosome, start, end, gene_id, gene_name) tuples for transcripts,
+        with 1-based inclusive coordinates."""
+        intervals_by_chromosome = {}
+        self.gene_spans = {}
+        for chromosome, start, end, gene_id, gene_name in transcripts:
+            intervals_by_chromosome.setdefault(chromosome, []).append((start - 1, end, (gene_id, gene_name)))
+            gene_start, gene_end = self.gene_spans.get(gene_id, (start - 1, end))
+            self.gene_spans[gene_id] = (min(start - 1, gene_start), max(end, gene_end))
+        self.trees = {chromosome: IntervalTree(intervals) for chromosome, intervals in intervals_by_chromosome.items()}
+
+    @classmethod
+    def from_gtf(cls, gtf_file, acceptable_biotypes=ACCEPTABLE_BIOTYPES):
+        """Loads the transcripts of the acceptable biotypes from an Ensembl GTF file (optionally gzipped), e.g.
+        Homo_sapiens.GRCh38.113.gtf.gz."""
+        transcripts = []
+        opener = gzip.open if gtf_file.endswith('.gz') else open
+        with opener(gtf_file, 'rt') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 9 or fields[2] != 'transcript':
+                    continue
+                attributes = dict(GTF_ATTRIBUTE_REGEX.findall(fields[8]))
+                if attributes.get('transcript_biotype') in acceptable_biotypes:
+                    transcripts.append((fields[0], int(fields[3]), int(fields[4]), attributes['gene_id'],
+                                        attributes.get('gene_name', '')))
+        index = cls(transcripts)
+        logger.info(f'{len(transcripts)} transcripts of {len(index.gene_spans)} genes loaded from {gtf_file}')
+        return index
+
+    def __len__(self):
+        return len(self.gene_spans)
+
+    def overlapping_genes(self, chromosome, start, end):
+        """Returns the genes overlapped by a span with 1-based inclusive coordinates, as (gene_id, gene_name, overlap)
+        tuples, where overlap is one of CONTAINED, COVERED or PARTIAL."""
+        tree = self.trees.get(chromosome)
+        if tree is None:
+            return []
+        genes = dict.fromkeys(tree.overlap(start - 1, end))
+        results = []
+        for gene_id, gene_name in genes:
+            gene_start, gene_end = self.gene_spans[gene_id]
+            if gene_start <= start - 1 and end <= gene_end:
+                overlap = CONTAINED
+            elif start - 1 <= gene_start and gene_end <= end:
+                overlap = COVERED
+            else:
+                overlap = PARTIAL
+            results.append((gene_id, gene_name, overlap))
+        return results
+
+    def annotate_vep_identifier(self, vep_identifier):
+        """Returns the genes overlapped by a structural variant given as a VEP identifier (see
+        pipeline.hgvs_to_vep_identifier), or None if its sequence is not a known chromosome."""
+        sequence, start, end = vep_identifier.split()[:3]
+        chromosome = refseq_to_chromosome(sequence)
+        if chromosome is None:
+            return None
+        return self.overlapping_genes(chromosome, int(start), int(end))
@@ -1,25 +1,21 @@
 import logging
-from itertools import zip_longest
 
 import pandas as pd
 
-from cmat.consequence_prediction.common.vep import query_vep, extract_consequences, deduplicate_list
+from cmat.consequence_prediction.common.vep import VepClient, extract_consequences, deduplicate_list
+from cmat.consequence_prediction.common.local_vep import LocalVepClient
+from cmat.consequence_prediction.common.vep_cache import VepCache
+from cmat.consequence_prediction.structural_variants.gene_index import GeneIntervalIndex
+from cmat.output_generation.clinvar_to_evidence_strings import MAX_TARGET_GENES
 from cmat.clinvar_xml_io import ClinVarDataset
 from cmat.clinvar_xml_io.hgvs_variant import HgvsVariant, VariantType, SequenceType
+from cmat.clinvar_xml_io.scan import RecordConsumer
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def grouper(iterable, n):
-    args = [iter(iterable)] * n
-    result = []
-    for group in zip_longest(*args, fillvalue=None):
-        result.append([x for x in group if x is not None])
-    return result
-
-
 def hgvs_to_vep_identifier(hgvs: HgvsVariant):
     if hgvs.sequence_type != SequenceType.GENOMIC:
         return
@@ -44,27 +40,62 @@ def can_process(record):
     return record.measure and record.measure.preferred_current_hgvs and not record.measure.has_complete_coordinates
 
 
-def get_vep_results(clinvar_xml):
-    n = 0
-    hgvs_list = []
-    for record in ClinVarDataset(clinvar_xml):
+class StructuralVariantConsumer(RecordConsumer):
+    """Collects VEP identifiers (see hgvs_to_vep_identifier) of the records which can be processed by this pipeline, and
+    optionally writes them to a file, one per line."""
+
+    def __init__(self, output_file=None):
+        self.output_file = output_file
+        self.n = 0
+        self.variants = []
+
+    def consume(self, record):
         if not can_process(record):
-            continue
+            return
+        self.n += 1
         # use only the preferred current HGVS
-        hgvs_list.append(record.measure.preferred_current_hgvs)
-        n += 1
-    logger.info(f'{n} records processed with {len(hgvs_list)} HGVS expressions')
+        variant = hgvs_to_vep_identifier(record.measure.preferred_current_hgvs)
+        if variant:  # variant is None if it couldn't be parsed
+            self.variants.append(variant)
+
+    def finish(self):
+        logger.info(f'{self.n} records processed, {len(self.variants)} parsed into chrom/start/end/type')
+        if self.output_file:
+            with open(self.output_file, 'wt') as f:
+                for variant in self.variants:
+                    f.write(variant + '\n')
+
+
+def extract_variants(clinvar_xml):
+    consumer = StructuralVariantConsumer()
+    ClinVarDataset(clinvar_xml).scan([consumer])
+    return consumer.variants
+
+
+def load_variants(variants_file):
+    with open(variants_file, 'rt') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+def filter_broad_variants(variants, gene_index, max_genes=MAX_TARGET_GENES):
+    """Returns the variants which overlap at most max_genes genes according to gene_index. Consequences of the other
+    variants are not used when generating the outputs (see clinvar_to_evidence_strings.get_consequence_types), so they
+    do not need to be queried."""
+    kept_variants = []
+    for variant in variants:
+        genes = gene_index.annotate_vep_identifier(variant)
+        if genes is None or len(genes) <= max_genes:
+            kept_variants.append(variant)
+    logger.info(f'{len(variants) - len(kept_variants)} variants overlapping more than {max_genes} genes skipped')
+    return kept_variants
 
-    variants = [hgvs_to_vep_identifier(hgvs) for hgvs in hgvs_list]
-    variants = [v for v in variants if v]  # v is None if it couldn't be parsed
-    logger.info(f'{len(variants)} parsed into chrom/start/end/type')
 
-    # VEP only accepts batches of 200
-    i = 0
+def get_vep_results(variants, vep_client=None):
+    # VEP only accepts batches of 200, which are queried concurrently
+    vep_client = vep_client or VepClient()
     vep_results = []
-    for group in grouper(variants, n=200):
-        vep_results.extend(query_vep(variants=group))
-        i += 1
+    for i, (_, batch_results) in enumerate(vep_client.query_all(variants), start=1):
+        vep_results.extend(batch_results)
         logger.info(f'Done with batch {i}')
 
     return vep_results
@@ -79,8 +110,26 @@ def generate_consequences_file(consequences, output_consequences):
     consequences.to_csv(output_consequences, sep='\t', index=False, header=False)
 
 
-def main(clinvar_xml, include_transcripts, output_consequences=None):
-    vep_results = get_vep_results(clinvar_xml)
+def main(clinvar_xml, include_transcripts, output_consequences=None, vep_variants=None, vep_cache=None,
+         vep_rejects=None, local_vep_cache=None, gene_models=None):
+    """Maps structural variants to genes and functional consequences. If vep_variants is provided, the variants are
+    loaded from this file as written by StructuralVariantConsumer, and clinvar_xml is not used. If vep_cache is
+    provided, only the variants which are not in this VEP results cache are queried. If vep_rejects is provided, the
+    variants rejected by VEP are written to this file. If local_vep_cache is provided, variants are annotated with
+    local VEP using this offline cache instead of VEP API. If gene_models (an Ensembl GTF file) is provided, variants
+    overlapping too many genes to be used are skipped before querying VEP."""
+    variants = load_variants(vep_variants) if vep_variants else extract_variants(clinvar_xml)
+    if gene_models:
+        variants = filter_broad_variants(variants, GeneIntervalIndex.from_gtf(gene_models))
+    cache = VepCache(vep_cache) if vep_cache else None
+    vep_client = LocalVepClient(local_vep_cache, cache=cache) if local_vep_cache else VepClient(cache=cache)
+    vep_results = get_vep_results(variants, vep_client)
+    if cache:
+        cache.close()
+    if vep_client.rejected_variants:
+        logger.warning(f'{len(vep_client.rejected_variants)} variant(s) rejected by VEP')
+    if vep_rejects:
+        vep_client.write_rejected_variants(vep_rejects)
     results_by_variant = extract_consequences(
         vep_results=vep_results,
         acceptable_biotypes={'protein_coding', 'miRNA'},
@@ -1,5 +1,4 @@
 import re
-import xml.etree.ElementTree as ET
 from collections import defaultdict
 
 from cmat.clinvar_xml_io.ontology_uri import OntologyUri
@@ -9,6 +8,7 @@ from cmat.clinvar_xml_io.xml_parsing import iterate_rcv_from_xml
 from cmat.output_generation.clinvar_to_evidence_strings import load_ontology_mapping, get_consequence_types
 from cmat.output_generation import consequence_type as CT
 from cmat.output_generation.evaluation.set_metrics import SetComparisonMetrics
+from cmat.output_generation.ontology_mapping import OntologyMappingIndex
 
 PROCESSOR = 'CMAT'
 
@@ -21,6 +21,8 @@ class AnnotatingClinVarDataset(ClinVarDataset):
                  eval_gene_mappings=None, eval_xref_mappings=None, eval_latest_mappings=None):
         super().__init__(clinvar_xml)
         self.header_attr['ProcessedBy'] = PROCESSOR
+        if not isinstance(string_to_ontology_mappings, OntologyMappingIndex):
+            string_to_ontology_mappings = OntologyMappingIndex(string_to_ontology_mappings, target_ontology)
         self.string_to_ontology_mappings = string_to_ontology_mappings
         self.variant_to_gene_mappings = variant_to_gene_mappings
         self.target_ontology = target_ontology
@@ -130,9 +132,10 @@ class AnnotatingClinVarDataset(ClinVarDataset):
 
             # Add annotations - only based on preferred name
             target_ontology_ids = [
-                OntologyMappedClinVarTrait.format_ontology_id(ontology_id)
-                for ontology_id, ontology_label
-                in self.string_to_ontology_mappings.get(trait.preferred_or_other_valid_name.lower(), [])
+                OntologyMappedClinVarTrait.format_ontology_id(self.string_to_ontology_mappings.get_ontology_id(
+                    ontology_id_number))
+                for ontology_id_number, ontology_label
+                in self.string_to_ontology_mappings.lookup(trait.preferred_or_other_valid_name)
             ]
             trait.add_ontology_mappings(target_ontology_ids, self.target_ontology)
 
@@ -225,7 +228,7 @@ class OntologyMappedClinVarTrait(ClinVarTrait):
         for ontology_id in ontology_ids:
             ontology_id = self.format_ontology_id(ontology_id)
             # Include Status attribute so this isn't included among current xrefs
-            ontology_elts.append(ET.Element('XRef', attrib={
+            ontology_elts.append(self.trait_xml.makeelement('XRef', {
                 'ID': ontology_id, 'DB': target_ontology, 'Status': 'annotated', 'providedBy': PROCESSOR}))
         self.trait_xml.extend(ontology_elts)
 
@@ -240,19 +243,21 @@ class EnsemblAnnotatedClinVarMeasure(ClinVarRecordMeasure):
 
     def add_ensembl_annotations(self, consequences):
         consequence_elts = []
+        # Create elements using the same parser backend as the rest of the record
+        make_element = self.measure_xml.makeelement
         for consequence_attributes in consequences:
-            attr_set_elt = ET.Element('AttributeSet', attrib={'providedBy': PROCESSOR})
-            attribute_elt = ET.Element('Attribute', attrib={'Type': 'MolecularConsequence'})
+            attr_set_elt = make_element('AttributeSet', {'providedBy': PROCESSOR})
+            attribute_elt = make_element('Attribute', {'Type': 'MolecularConsequence'})
             attribute_elt.text = consequence_attributes.so_term.so_name.replace('_', ' ')
-            so_elt = ET.Element('XRef', attrib={'ID': self.format_so_term(consequence_attributes.so_term),
-                                                'DB': 'Sequence Ontology'})
-            ensembl_gene_elt = ET.Element('XRef', attrib={'ID': consequence_attributes.ensembl_gene_id,
-                                                          'DB': 'Ensembl Gene'})
+            so_elt = make_element('XRef', {'ID': self.format_so_term(consequence_attributes.so_term),
+                                           'DB': 'Sequence Ontology'})
+            ensembl_gene_elt = make_element('XRef', {'ID': consequence_attributes.ensembl_gene_id,
+                                                     'DB': 'Ensembl Gene'})
             attr_set_elt.extend((attribute_elt, so_elt, ensembl_gene_elt))
             # Add transcript if present
             if consequence_attributes.ensembl_transcript_id:
-                ensembl_transcript_elt = ET.Element('XRef', attrib={'ID': consequence_attributes.ensembl_transcript_id,
-                                                                    'DB': 'Ensembl Transcript'})
+                ensembl_transcript_elt = make_element('XRef', {'ID': consequence_attributes.ensembl_transcript_id,
+                                                               'DB': 'Ensembl Transcript'})
                 attr_set_elt.append(ensembl_transcript_elt)
             consequence_elts.append(attr_set_elt)
         self.measure_xml.extend(consequence_elts)
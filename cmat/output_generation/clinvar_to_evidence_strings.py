@@ -1,17 +1,25 @@
+import hashlib
 import logging
 import itertools
 import json
 import re
 import sys
 import os
-from collections import defaultdict
 
 import jsonschema
 
 from cmat.clinvar_xml_io import ClinVarDataset
 from cmat.clinvar_xml_io.clinical_classification import MultipleClinicalClassificationsError
 from cmat.clinvar_xml_io.filtering import filter_by_submission_name
+from cmat.clinvar_xml_io.xml_parsing import element_to_string
 from cmat.output_generation import consequence_type as CT
+from cmat.output_generation.evidence_output import EvidenceStringWriter, encode_evidence_string, \
+    get_output_file_name, get_json_encoder
+from cmat.output_generation.evidence_state import EvidenceState, EvidenceStateWriter, STATE_FILE_NAME, STATE_VERSION, \
+    encode_state_entry, decode_state_entry
+from cmat.output_generation.evidence_validation import get_validator
+from cmat.output_generation.lookup_bundle import load_lookup_bundle
+from cmat.output_generation.ontology_mapping import OntologyMappingIndex, group_trait_names, load_ontology_mapping
 from cmat.output_generation.report import Report
 
 logger = logging.getLogger(__package__)
@@ -22,14 +30,20 @@ IUPAC_AMBIGUOUS_SEQUENCE = re.compile(r'[^ACGT]')
 # If a structural variant has more than this number of target genes, we omit it as too broad in consequences.
 MAX_TARGET_GENES = 3
 
+# Attributes of an evidence string which must be unique among all evidence strings.
+EVIDENCE_STRING_KEY_ATTRIBUTES = ('datatypeId', 'studyId', 'targetFromSourceId', 'variantId',
+                                  'variantFunctionalConsequenceId', 'diseaseFromSourceMappedId', 'diseaseFromSource')
+
 # Output file names.
 EVIDENCE_STRINGS_FILE_NAME = 'evidence_strings.json'
 EVIDENCE_RECORDS_FILE_NAME = 'evidence_records.tsv'
 
 
-def validate_evidence_string(ev_string, ot_schema_contents):
+def validate_evidence_string(ev_string, ot_schema_contents, full_validation=False):
+    """Validates an evidence string against the schema. Unless full_validation is set, evidence strings with the same
+    structure as one validated before only have their values checked (see evidence_validation.FingerprintValidator)."""
     try:
-        jsonschema.validate(ev_string, ot_schema_contents, format_checker=jsonschema.FormatChecker())
+        get_validator(ot_schema_contents, fingerprint=not full_validation).validate(ev_string)
         return True
     except jsonschema.exceptions.ValidationError as err:
         logger.error('Error: evidence string does not validate against schema.')
@@ -41,155 +55,314 @@ def validate_evidence_string(ev_string, ot_schema_contents):
         sys.exit(1)
 
 
-def launch_pipeline(clinvar_xml_file, efo_mapping_file, gene_mapping_file, ot_schema_file, dir_out, start, end):
+def launch_pipeline(clinvar_xml_file, efo_mapping_file, gene_mapping_file, ot_schema_file, dir_out, start, end,
+                    clinvar_index_file=None, workers=None, full_validation=False, compression=None,
+                    lookup_bundle_file=None, previous_state_file=None, write_state=False):
+    """Generates the evidence strings and the report for the records in the range [start, end). The trait mappings, the
+    consequences and the schema are either loaded from their respective files, or all at once from a lookup bundle
+    (see lookup_bundle), in which case the files are not needed. If previous_state_file is set, records with the same
+    inputs as in the previous run are not processed again (see evidence_state). If write_state is set, the state of
+    this run is written to the output directory."""
     os.makedirs(dir_out, exist_ok=True)
-    string_to_efo_mappings, _ = load_ontology_mapping(efo_mapping_file)
-    variant_to_gene_mappings = CT.process_consequence_type_file(gene_mapping_file)
+    if lookup_bundle_file:
+        string_to_efo_mappings, _, variant_to_gene_mappings, ot_schema = load_lookup_bundle(lookup_bundle_file)
+    else:
+        string_to_efo_mappings, _ = load_ontology_mapping(efo_mapping_file)
+        variant_to_gene_mappings = CT.process_consequence_type_file(gene_mapping_file)
+        ot_schema = ot_schema_file
 
     report, exception_raised = clinvar_to_evidence_strings(
-        string_to_efo_mappings, variant_to_gene_mappings, clinvar_xml_file, ot_schema_file,
-        output_evidence_strings=os.path.join(dir_out, EVIDENCE_STRINGS_FILE_NAME), start=start, end=end)
+        string_to_efo_mappings, variant_to_gene_mappings, clinvar_xml_file, ot_schema,
+        output_evidence_strings=os.path.join(dir_out, get_output_file_name(EVIDENCE_STRINGS_FILE_NAME, compression)),
+        start=start, end=end, clinvar_index=clinvar_index_file, workers=workers, full_validation=full_validation,
+        compression=compression, previous_state=previous_state_file,
+        output_state=os.path.join(dir_out, STATE_FILE_NAME) if write_state else None)
     counts_consistent = report.check_counts()
     report.print_report()
     report.dump_to_file(dir_out)
+    report.write_evidence_string_keys(dir_out)
     if exception_raised or not counts_consistent:
         sys.exit(1)
 
 
 def clinvar_to_evidence_strings(string_to_efo_mappings, variant_to_gene_mappings, clinvar_xml, ot_schema,
-                                output_evidence_strings, start=None, end=None):
+                                output_evidence_strings, start=None, end=None, clinvar_index=None, workers=None,
+                                full_validation=False, compression=None, previous_state=None, output_state=None):
+    """Generates evidence strings for the ClinVar records in the range [start, end) and writes them to
+    output_evidence_strings, one per line, compressed with gzip or zstd if compression is set (see evidence_output).
+    The schema can be given either as a file or as its parsed contents. Returns the report and whether an exception was
+    raised while processing any of the records.
+
+    In incremental mode, the evidence strings and counts of records whose inputs are unchanged since the run which
+    wrote previous_state are taken from it instead. The output and the report are the same as for a full run. If
+    output_state is set, the state of this run is written to it, to be used as the previous state of the next one."""
     report = Report(trait_mappings=string_to_efo_mappings, consequence_mappings=variant_to_gene_mappings)
-    ot_schema_contents = json.loads(open(ot_schema).read())
-    output_evidence_strings_file = open(output_evidence_strings, 'wt')
+    ot_schema_contents = ot_schema if isinstance(ot_schema, dict) else json.loads(open(ot_schema).read())
+    evidence_string_writer = EvidenceStringWriter(output_evidence_strings, compression)
     exception_raised = False
+    incremental = previous_state is not None or output_state is not None
+    if previous_state is not None and not isinstance(previous_state, EvidenceState):
+        previous_state = EvidenceState(previous_state)
+    state_writer = EvidenceStateWriter(output_state) if output_state is not None else None
+    fingerprint = get_evidence_fingerprint(ot_schema_contents, full_validation) if incremental else None
 
     logger.info('Processing ClinVar records')
-    i = -1
-    dataset = ClinVarDataset(clinvar_xml)
-    for clinvar_set in dataset.iter_cvs():
-        # If start & end provided, only process records in the range [start, end)
-        i += 1
-        if start and i < start:
-            continue
-        if end and i >= end:
-            break
-
-        report.clinvar_total += 1
-        if report.clinvar_total % 1000 == 0:
-            logger.info(f'{report.clinvar_total} records processed')
-
-        # Catch any exceptions for this record so we can continue processing.
-        try:
-            # Failure mode 1 (fatal). Record is only supported by submissions deemed to be unusable.
-            if not filter_by_submission_name(clinvar_set):
-                report.clinvar_fatal_excluded_submission += 1
-                continue
-            clinvar_record = clinvar_set.rcv
-
-            # Failure mode 2 (skip). Contains multiple clinical classification annotations.
-            # This is new as of V2 of the ClinVar XSD and should definitely be supported at some point,
-            # but as it can cause parsing complications we catch these cases first.
-            # See GH issue for context: https://github.com/EBIvariation/CMAT/issues/396
-            if len(clinvar_record.clinical_classifications) > 1:
-                logger.warning(f'Found multiple clinical classifications in record {clinvar_record.accession}')
-                report.clinvar_skip_multiple_clinical_classifications += 1
-                continue
-
-            # Failure mode 3 (fatal). A ClinVar record contains no valid traits (traits which have at least one valid,
-            # potentially mappable name).
-            if not clinvar_record.traits_with_valid_names:
-                report.clinvar_fatal_no_valid_traits += 1
-                continue
-            # Failure mode 4 (fatal). A ClinVar record contains no valid clinical significance terms, likely due to
-            # submissions being flagged.
-            if not clinvar_record.valid_clinical_significances:
-                report.clinvar_fatal_no_clinical_significance += 1
-                continue
-
-            # Failure mode 5 (skip). A ClinVar record contains an unsupported variation type.
-            if clinvar_record.measure is None:
-                report.clinvar_skip_unsupported_variation += 1
-                continue
-
-            # Within each ClinVar record, an evidence string is generated for all possible permutations of (1) valid
-            # allele origins, (2) EFO mappings, and (3) genes where the variant has effect.
-            grouped_allele_origins = convert_allele_origins(clinvar_record.valid_allele_origins)
+    dataset = ClinVarDataset(clinvar_xml, index_file=clinvar_index)
+    # If start & end provided, only process records in the range [start, end)
+    if workers:
+        # Records are processed by a pool of workers in shards, which are merged back in the original order
+        shard_results = dataset.map_shards(
+            process_clinvar_sets, workers, start=start, end=end, initializer=init_worker,
+            initargs=(string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, full_validation,
+                      incremental, previous_state, fingerprint))
+        for evidence_strings, shard_report, shard_exception_raised, state_entries in shard_results:
+            evidence_string_writer.write_all(evidence_strings)
+            if state_writer:
+                state_writer.write_all(state_entries)
+            processed_before = report.clinvar_total
+            report += shard_report
+            exception_raised = exception_raised or shard_exception_raised
+            if report.clinvar_total // 1000 > processed_before // 1000:
+                logger.info(f'{report.clinvar_total} records processed')
+    else:
+        for clinvar_set in dataset.iter_cvs(start=start, end=end):
+            if incremental:
+                evidence_strings, record_exception_raised, state_entry = process_clinvar_set_incrementally(
+                    clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, report,
+                    full_validation, previous_state, fingerprint)
+                if state_writer:
+                    state_writer.write_all([state_entry])
+            else:
+                evidence_strings, record_exception_raised = process_clinvar_set(
+                    clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, report,
+                    full_validation)
+            evidence_string_writer.write_all(evidence_strings)
+            exception_raised = exception_raised or record_exception_raised
+            if report.clinvar_total % 1000 == 0:
+                logger.info(f'{report.clinvar_total} records processed')
+
+    evidence_string_writer.close()
+    if state_writer:
+        state_writer.close()
+    return report, exception_raised
+
+
+# Arguments of process_clinvar_set shared by all records, set once in each worker process (see init_worker).
+worker_args = None
+
+
+def init_worker(string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, full_validation,
+                incremental=False, previous_state=None, fingerprint=None):
+    """Makes the mappings available in a worker process, so that they don't have to be sent with every shard."""
+    global worker_args
+    worker_args = (string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, full_validation, incremental,
+                   previous_state, fingerprint)
+
+
+def process_clinvar_sets(clinvar_sets):
+    """Processes a shard of ClinVarSets in a worker process, and returns the evidence strings generated, the report
+    for the shard, whether any exception was raised and, in incremental mode, the state entries of the records."""
+    report = Report()
+    evidence_strings = []
+    exception_raised = False
+    state_entries = []
+    for clinvar_set in clinvar_sets:
+        string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, full_validation, incremental, \
+            previous_state, fingerprint = worker_args
+        if incremental:
+            record_evidence_strings, record_exception_raised, state_entry = process_clinvar_set_incrementally(
+                clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, report,
+                full_validation, previous_state, fingerprint)
+            state_entries.append(state_entry)
+        else:
+            record_evidence_strings, record_exception_raised = process_clinvar_set(
+                clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, report,
+                full_validation)
+        evidence_strings.extend(record_evidence_strings)
+        exception_raised = exception_raised or record_exception_raised
+    return evidence_strings, report, exception_raised, state_entries
+
+
+def get_evidence_fingerprint(ot_schema_contents, full_validation):
+    """Returns a hash of the inputs of evidence string generation which are the same for all records: the schema, the
+    validation and serialisation settings, the SO accessions and severity ranking, and the version of the state."""
+    so_accessions, severity_ranks = CT.get_so_terms_data()
+    fingerprint = json.dumps([STATE_VERSION, ot_schema_contents, full_validation, get_json_encoder(), so_accessions,
+                              severity_ranks], sort_keys=True)
+    return hashlib.blake2b(fingerprint.encode('utf-8'), digest_size=16).digest()
+
+
+def get_record_input_hash(clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, fingerprint):
+    """Returns a hash of all inputs of evidence string generation for a ClinVarSet: its XML, the ontology mappings of
+    all names of its traits, its functional consequences, and the fingerprint of the inputs shared by all records (see
+    get_evidence_fingerprint). Returns None if the inputs cannot be determined, in which case the record is always
+    processed."""
+    try:
+        clinvar_record = clinvar_set.rcv
+        trait_mappings = [string_to_efo_mappings.get(trait_name.lower(), [])
+                          for trait in clinvar_record.trait_set for trait_name in trait.all_names]
+        consequences = []
+        if clinvar_record.measure is not None:
             consequence_types, _ = get_consequence_types(clinvar_record.measure, variant_to_gene_mappings)
-            grouped_diseases = group_diseases_by_efo_mapping(clinvar_record.traits_with_valid_names,
-                                                             string_to_efo_mappings)
-
-            # Failure mode 6 (skip). No functional consequences are available.
-            if not consequence_types:
-                report.clinvar_skip_no_functional_consequences += 1
-                continue
-
-            # Gather consequence mapping counts for variants of interest
-            if clinvar_record.measure.is_repeat_expansion_variant:
-                report.repeat_expansion_variants += len(consequence_types)
-            if is_structural_variant(clinvar_record.measure):
-                report.structural_variants += len(consequence_types)
-
-            # Failure mode 7 (skip). A ClinVar record has at least one trait with at least one valid name, but no
-            # suitable EFO mappings were found in the database. This will still generate an evidence string, but is
-            # tracked as a failure so we can continue to measure mapping coverage.
-            if not contains_mapping(grouped_diseases):
-                report.clinvar_skip_missing_efo_mapping += 1
-                unmapped_trait_name = clinvar_record.traits_with_valid_names[0].preferred_or_other_valid_name
-                report.unmapped_trait_names[unmapped_trait_name] += 1
-
-            assert grouped_allele_origins and grouped_diseases and consequence_types, \
-                'Some of the attribute lists are still empty even after passing all checks.'
-
-            complete_evidence_strings_generated = 0
-            evidence_strings_generated = 0
-            for allele_origins, disease_attributes, consequence_attributes in itertools.product(
-                    grouped_allele_origins, grouped_diseases, consequence_types):
-                disease_name, disease_source_id, disease_mapped_efo_id = disease_attributes
-                evidence_string = generate_evidence_string(clinvar_record, allele_origins, disease_name,
-                                                           disease_source_id, disease_mapped_efo_id,
-                                                           consequence_attributes)
-
-                # Validate and immediately output the evidence string (not keeping everything in memory).
-                is_valid = validate_evidence_string(evidence_string, ot_schema_contents)
-                if is_valid:
-                    output_evidence_strings_file.write(json.dumps(evidence_string) + '\n')
-
-                    # Record some evidence string and trait metrics.
-                    evidence_strings_generated += 1
-                    if disease_mapped_efo_id is not None:
-                        complete_evidence_strings_generated += 1
-                        report.used_trait_mappings.add(disease_mapped_efo_id)
-
-            if complete_evidence_strings_generated == 1:
-                report.clinvar_done_one_complete_evidence_string += 1
-            elif complete_evidence_strings_generated > 1:
-                report.clinvar_done_multiple_complete_evidence_strings += 1
-
-            if evidence_strings_generated == 0:
-                report.clinvar_skip_invalid_evidence_string += 1
-                # If this record also did not have any EFO-mapped traits, it has already been counted as "skip".
-                # Correct this so the counts match up but we retain the more important skip reason.
-                if not contains_mapping(grouped_diseases):
-                    report.clinvar_skip_missing_efo_mapping -= 1
-
-            report.complete_evidence_string_count += complete_evidence_strings_generated
-            report.evidence_string_count += evidence_strings_generated
-
-        except MultipleClinicalClassificationsError as mcce:
-            # Ensure we catch any of these that fall through (e.g. from multiple description text)
-            logger.error(str(mcce))
+            consequences = [(consequence_type.ensembl_gene_id, consequence_type.so_term.so_name,
+                             consequence_type.ensembl_transcript_id) for consequence_type in consequence_types]
+    except Exception:
+        return None
+    input_hash = hashlib.blake2b(fingerprint, digest_size=16)
+    input_hash.update(element_to_string(clinvar_set.cvs_xml))
+    input_hash.update(repr((trait_mappings, consequences)).encode('utf-8'))
+    return input_hash.digest()
+
+
+def process_clinvar_set_incrementally(clinvar_set, string_to_efo_mappings, variant_to_gene_mappings,
+                                      ot_schema_contents, report, full_validation, previous_state, fingerprint):
+    """Same as process_clinvar_set, but reuses the evidence strings and counts of the record from the previous state
+    if its inputs did not change. Additionally returns the state entry of the record, or None if an exception was
+    raised while processing it."""
+    input_hash = get_record_input_hash(clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, fingerprint)
+    accession = clinvar_set.rcv.accession
+    if previous_state is not None and input_hash is not None:
+        state_entry = previous_state.get(accession, input_hash)
+        if state_entry is not None:
+            evidence_strings, record_report = decode_state_entry(state_entry)
+            report += record_report
+            return evidence_strings, False, state_entry
+
+    # Counts of the record are collected separately, so that they can be stored in its state entry
+    record_report = Report()
+    evidence_strings, exception_raised = process_clinvar_set(
+        clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, record_report,
+        full_validation)
+    report += record_report
+    if exception_raised or input_hash is None:
+        return evidence_strings, exception_raised, None
+    return evidence_strings, exception_raised, encode_state_entry(accession, input_hash, evidence_strings,
+                                                                  record_report)
+
+
+def process_clinvar_set(clinvar_set, string_to_efo_mappings, variant_to_gene_mappings, ot_schema_contents, report,
+                        full_validation=False):
+    """Generates and validates all evidence strings for a single ClinVarSet, updating the counts in the report. Returns
+    the list of evidence strings serialised to bytes (see evidence_output.encode_evidence_string) and whether an
+    exception was raised while processing the record."""
+    report.clinvar_total += 1
+    evidence_strings = []
+
+    # Catch any exceptions for this record so we can continue processing.
+    try:
+        # Failure mode 1 (fatal). Record is only supported by submissions deemed to be unusable.
+        if not filter_by_submission_name(clinvar_set):
+            report.clinvar_fatal_excluded_submission += 1
+            return evidence_strings, False
+        clinvar_record = clinvar_set.rcv
+
+        # Failure mode 2 (skip). Contains multiple clinical classification annotations.
+        # This is new as of V2 of the ClinVar XSD and should definitely be supported at some point,
+        # but as it can cause parsing complications we catch these cases first.
+        # See GH issue for context: https://github.com/EBIvariation/CMAT/issues/396
+        if len(clinvar_record.clinical_classifications) > 1:
+            logger.warning(f'Found multiple clinical classifications in record {clinvar_record.accession}')
             report.clinvar_skip_multiple_clinical_classifications += 1
+            return evidence_strings, False
+
+        # Failure mode 3 (fatal). A ClinVar record contains no valid traits (traits which have at least one valid,
+        # potentially mappable name).
+        if not clinvar_record.traits_with_valid_names:
+            report.clinvar_fatal_no_valid_traits += 1
+            return evidence_strings, False
+        # Failure mode 4 (fatal). A ClinVar record contains no valid clinical significance terms, likely due to
+        # submissions being flagged.
+        if not clinvar_record.valid_clinical_significances:
+            report.clinvar_fatal_no_clinical_significance += 1
+            return evidence_strings, False
+
+        # Failure mode 5 (skip). A ClinVar record contains an unsupported variation type.
+        if clinvar_record.measure is None:
+            report.clinvar_skip_unsupported_variation += 1
+            return evidence_strings, False
+
+        # Within each ClinVar record, an evidence string is generated for all possible permutations of (1) valid
+        # allele origins, (2) EFO mappings, and (3) genes where the variant has effect.
+        grouped_allele_origins = convert_allele_origins(clinvar_record.valid_allele_origins)
+        consequence_types, _ = get_consequence_types(clinvar_record.measure, variant_to_gene_mappings)
+        grouped_diseases = group_diseases_by_efo_mapping(clinvar_record.traits_with_valid_names,
+                                                         string_to_efo_mappings)
+
+        # Failure mode 6 (skip). No functional consequences are available.
+        if not consequence_types:
+            report.clinvar_skip_no_functional_consequences += 1
+            return evidence_strings, False
+
+        # Gather consequence mapping counts for variants of interest
+        if clinvar_record.measure.is_repeat_expansion_variant:
+            report.repeat_expansion_variants += len(consequence_types)
+        if is_structural_variant(clinvar_record.measure):
+            report.structural_variants += len(consequence_types)
+
+        # Failure mode 7 (skip). A ClinVar record has at least one trait with at least one valid name, but no
+        # suitable EFO mappings were found in the database. This will still generate an evidence string, but is
+        # tracked as a failure so we can continue to measure mapping coverage.
+        if not contains_mapping(grouped_diseases):
+            report.clinvar_skip_missing_efo_mapping += 1
+            unmapped_trait_name = clinvar_record.traits_with_valid_names[0].preferred_or_other_valid_name
+            report.unmapped_trait_names[unmapped_trait_name] += 1
+
+        assert grouped_allele_origins and grouped_diseases and consequence_types, \
+            'Some of the attribute lists are still empty even after passing all checks.'
+
+        complete_evidence_strings_generated = 0
+        evidence_strings_generated = 0
+        # Attributes which are the same for all evidence strings of the record are only extracted once
+        template = get_evidence_string_template(clinvar_record)
+        for allele_origins, disease_attributes, consequence_attributes in itertools.product(
+                grouped_allele_origins, grouped_diseases, consequence_types):
+            disease_name, disease_source_id, disease_mapped_efo_id = disease_attributes
+            evidence_string = generate_evidence_string(clinvar_record, allele_origins, disease_name,
+                                                       disease_source_id, disease_mapped_efo_id,
+                                                       consequence_attributes, template)
+
+            # Validate and serialise the evidence string straight away (not keeping the whole object in memory).
+            is_valid = validate_evidence_string(evidence_string, ot_schema_contents, full_validation)
+            if is_valid:
+                evidence_strings.append(encode_evidence_string(evidence_string))
+                evidence_string_key = get_evidence_string_key(evidence_string)
+                if report.add_evidence_string_key(evidence_string_key):
+                    logger.warning(f'Duplicate evidence string: {evidence_string_key}')
+
+                # Record some evidence string and trait metrics.
+                evidence_strings_generated += 1
+                if disease_mapped_efo_id is not None:
+                    complete_evidence_strings_generated += 1
+                    report.used_trait_mappings.add(disease_mapped_efo_id)
+
+        if complete_evidence_strings_generated == 1:
+            report.clinvar_done_one_complete_evidence_string += 1
+        elif complete_evidence_strings_generated > 1:
+            report.clinvar_done_multiple_complete_evidence_strings += 1
+
+        if evidence_strings_generated == 0:
+            report.clinvar_skip_invalid_evidence_string += 1
+            # If this record also did not have any EFO-mapped traits, it has already been counted as "skip".
+            # Correct this so the counts match up but we retain the more important skip reason.
+            if not contains_mapping(grouped_diseases):
+                report.clinvar_skip_missing_efo_mapping -= 1
 
-        except Exception as e:
-            # We catch exceptions but record when one is thrown, so that the pipeline will crash after processing all
-            # records and printing the report.
-            logger.error(f'Problem generating evidence for {clinvar_set.rcv.accession}')
-            logger.error(f'Error: {repr(e)}')
-            exception_raised = True
-            continue
+        report.complete_evidence_string_count += complete_evidence_strings_generated
+        report.evidence_string_count += evidence_strings_generated
 
-    output_evidence_strings_file.close()
-    return report, exception_raised
+    except MultipleClinicalClassificationsError as mcce:
+        # Ensure we catch any of these that fall through (e.g. from multiple description text)
+        logger.error(str(mcce))
+        report.clinvar_skip_multiple_clinical_classifications += 1
+
+    except Exception as e:
+        # We catch exceptions but record when one is thrown, so that the pipeline will crash after processing all
+        # records and printing the report.
+        logger.error(f'Problem generating evidence for {clinvar_set.rcv.accession}')
+        logger.error(f'Error: {repr(e)}')
+        return evidence_strings, True
+
+    return evidence_strings, False
 
 
 def format_creation_date(s):
@@ -201,9 +374,33 @@ def format_creation_date(s):
     return None
 
 
+def get_evidence_string_template(clinvar_record):
+    """Returns the attributes of the evidence strings which only depend on the ClinVar record, and are therefore the
+    same for all evidence strings generated from it. See generate_evidence_string for their description."""
+    return {
+        'allelicRequirements': clinvar_record.mode_of_inheritance,
+        'clinicalSignificances': clinvar_record.valid_clinical_significances,
+        'confidence': clinvar_record.review_status,
+        'literature': sorted(set([str(r) for r in clinvar_record.evidence_support_pubmed_refs])),
+        'studyId': clinvar_record.accession,
+        'releaseDate': format_creation_date(clinvar_record.created_date),
+        'variantId': clinvar_record.measure.vcf_full_coords,
+        'variantRsId': clinvar_record.measure.rs_id,
+        'variantFromSourceId': clinvar_record.vcv_id,
+        'cohortPhenotypes': sorted({name for trait in clinvar_record.traits_with_valid_names
+                                    for name in trait.all_valid_names}),
+        'variantHgvsId': (clinvar_record.measure.preferred_current_hgvs.text
+                          if clinvar_record.measure.preferred_current_hgvs else None),
+    }
+
+
 def generate_evidence_string(clinvar_record, allele_origins, disease_name, disease_source_id, disease_mapped_efo_id,
-                             consequence_attributes):
-    """Generates an evidence string based on ClinVar record and some additional attributes."""
+                             consequence_attributes, template=None):
+    """Generates an evidence string based on ClinVar record and some additional attributes. The attributes which only
+    depend on the record are taken from the template (see get_evidence_string_template) if it is provided, so that they
+    are not extracted again for every evidence string of the record."""
+    if template is None:
+        template = get_evidence_string_template(clinvar_record)
     is_somatic = allele_origins == ['somatic']
     evidence_string = {
         # ALLELE ORIGIN ATTRIBUTES. There are three attributes which are currently completely redundant (their
@@ -215,35 +412,35 @@ def generate_evidence_string(clinvar_record, allele_origins, disease_name, disea
 
         # ASSOCIATION ATTRIBUTES.
         # List of patterns of inheritance reported for the variant.
-        'allelicRequirements': clinvar_record.mode_of_inheritance,
+        'allelicRequirements': template['allelicRequirements'],
 
         # Levels of clinical significance reported for the variant.
-        'clinicalSignificances': clinvar_record.valid_clinical_significances,
+        'clinicalSignificances': template['clinicalSignificances'],
 
         # Confidence (review status).
-        'confidence': clinvar_record.review_status,
+        'confidence': template['confidence'],
 
         # Literature. ClinVar records provide three types of references: trait-specific; variant-specific; and
         # "observed in" references. Open Targets are interested only in that last category.
-        'literature': sorted(set([str(r) for r in clinvar_record.evidence_support_pubmed_refs])),
+        'literature': template['literature'],
 
         # RCV identifier.
-        'studyId': clinvar_record.accession,
+        'studyId': template['studyId'],
 
         # Record creation date, formatted as YYYY-MM-DD
-        'releaseDate': format_creation_date(clinvar_record.created_date),
+        'releaseDate': template['releaseDate'],
 
         # VARIANT ATTRIBUTES.
         'targetFromSourceId': consequence_attributes.ensembl_gene_id,
         'variantFunctionalConsequenceId': consequence_attributes.so_term.accession,
-        'variantId': clinvar_record.measure.vcf_full_coords,  # CHROM_POS_REF_ALT notation.
-        'variantRsId': clinvar_record.measure.rs_id,
-        'variantFromSourceId': clinvar_record.vcv_id,
+        'variantId': template['variantId'],  # CHROM_POS_REF_ALT notation.
+        'variantRsId': template['variantRsId'],
+        'variantFromSourceId': template['variantFromSourceId'],
 
         # PHENOTYPE ATTRIBUTES.
         # The alphabetical list of *all* valid disease names from all traits from that ClinVar record, reported as a
         # flat list. See https://github.com/EBIvariation/eva-opentargets/issues/221 for a discussion of this choice.
-        'cohortPhenotypes': sorted({name for trait in clinvar_record.traits_with_valid_names for name in trait.all_valid_names}),
+        'cohortPhenotypes': template['cohortPhenotypes'],
 
         # One disease name for this evidence string (see group_diseases_by_efo_mapping).
         'diseaseFromSource': disease_name,
@@ -254,15 +451,21 @@ def generate_evidence_string(clinvar_record, allele_origins, disease_name, disea
         # The EFO identifier to which we mapped that first disease. Converting the URI to a compact representation as
         # required by the Open Targets JSON schema.
         'diseaseFromSourceMappedId': disease_mapped_efo_id.split('/')[-1] if disease_mapped_efo_id else None,
+
+        # Preferred current HGVS expression of the variant.
+        'variantHgvsId': template['variantHgvsId'],
     }
-    if clinvar_record.measure.preferred_current_hgvs:
-        evidence_string['variantHgvsId'] = clinvar_record.measure.preferred_current_hgvs.text
 
     # Remove the attributes with empty values (either None or empty lists).
     evidence_string = {key: value for key, value in evidence_string.items() if value}
     return evidence_string
 
 
+def get_evidence_string_key(evidence_string):
+    """Returns the combination of attributes which identifies an evidence string, as a tab-separated string."""
+    return '\t'.join(str(evidence_string.get(attribute)) for attribute in EVIDENCE_STRING_KEY_ATTRIBUTES)
+
+
 def get_consequence_types(clinvar_record_measure, consequence_type_dict):
     """Returns the list of functional consequences for a given ClinVar record measure.
 
@@ -323,32 +526,6 @@ def write_string_list_to_file(string_list, filename):
         out_file.write('\n'.join(string_list))
 
 
-def load_ontology_mapping(trait_mapping_file):
-    trait_2_ontology = defaultdict(list)
-    target_ontology = 'EFO'
-    n_ontology_mappings = 0
-    in_header = True
-
-    with open(trait_mapping_file, 'rt') as f:
-        for line in f:
-            line = line.rstrip()
-            if in_header:
-                # Extract ontology if present
-                m = re.match(r'^#ontology=(.*?)$', line)
-                if m and m.group(1):
-                    target_ontology = m.group(1).upper()
-            if line.startswith('#') or not line:
-                continue
-            in_header = False
-            line_list = line.split('\t')
-            assert len(line_list) == 3, f'Incorrect string to ontology mapping format for line {line}'
-            clinvar_name, ontology_id, ontology_label = line_list
-            trait_2_ontology[clinvar_name.lower()].append((ontology_id, ontology_label))
-            n_ontology_mappings += 1
-    logger.info('{} ontology mappings loaded for ontology {}'.format(n_ontology_mappings, target_ontology))
-    return trait_2_ontology, target_ontology
-
-
 def get_terms_from_file(terms_file_path):
     if terms_file_path is not None:
         print('Loading list of terms...')
@@ -399,28 +576,19 @@ def group_diseases_by_efo_mapping(clinvar_record_traits, string_to_efo_mappings)
         * (D, MedGen_D, EFO_3)
         * (E, MedGen_E, EFO_4)
         * (E, MedGen_E, EFO_5)
-        * (G, MedGen_G, None)"""
-
-    # Group traits by their EFO mappings and explode multiple mappings.
-    efo_to_traits = defaultdict(list)  # Key: EFO ID, value: list of traits mapped to that ID.
-    grouped_tuples = []
-    for trait in clinvar_record_traits:
-        is_unmapped = True
-        # Try to match using all trait names.
-        for trait_name in trait.all_names:
-            for efo_id, efo_label in string_to_efo_mappings.get(trait_name.lower(), []):
-                is_unmapped = False
-                efo_to_traits[efo_id].append(trait)
-        # Unmapped traits are kept but not grouped
-        if is_unmapped:
-            grouped_tuples.append((trait.preferred_or_other_valid_name, trait.medgen_id, None))
-
-    # Generate tuples by keeping only one disease from each group.
-    for efo_id, traits in efo_to_traits.items():
-        traits = sorted(traits, key=lambda t: t.preferred_or_other_valid_name)
-        selected_trait = traits[0]
-        grouped_tuples.append((selected_trait.preferred_or_other_valid_name, selected_trait.medgen_id, efo_id))
-    return grouped_tuples
+        * (G, MedGen_G, None)
+
+    The mappings can be either an OntologyMappingIndex, in which case the grouping is memoised by the names of the
+    traits, or a dictionary keyed by lower-cased trait name."""
+    if isinstance(string_to_efo_mappings, OntologyMappingIndex):
+        grouped_traits = string_to_efo_mappings.group_traits(clinvar_record_traits)
+    else:
+        grouped_traits = [
+            (clinvar_record_traits[trait_number], trait_name, efo_id)
+            for trait_number, trait_name, efo_id in group_trait_names(
+                clinvar_record_traits, lambda name: string_to_efo_mappings.get(name.lower(), []))
+        ]
+    return [(trait_name, trait.medgen_id, efo_id) for trait, trait_name, efo_id in grouped_traits]
 
 
 def contains_mapping(grouped_diseases):
@@ -1,5 +1,13 @@
 from collections import defaultdict
+from datetime import date
+from functools import lru_cache
+import json
 import logging
+import mmap
+from operator import itemgetter
+import os
+import struct
+import sys
 
 import requests
 from retry import retry
@@ -9,20 +17,29 @@ from cmat.trait_mapping.ols import OLS_SERVER
 
 logger = logging.getLogger(__package__)
 
+# Header of a consequence store file (see write_consequence_store): magic bytes, number of variants and number of
+# consequences.
+STORE_MAGIC = b'CMATCSQ1'
+STORE_HEADER = struct.Struct('<8sQQ')
+STORE_OFFSET = struct.Struct('<Q')
+
+# Snapshot of the Sequence Ontology accessions and of the Ensembl consequence severity ranking, which are otherwise
+# queried from OLS and Ensembl (see refresh_so_snapshot). The location can be set with the CMAT_SO_SNAPSHOT environment
+# variable, by default it is in the home directory of the user. Until a snapshot is created there, the snapshot bundled
+# with the package is used.
+SO_SNAPSHOT_ENV_VARIABLE = 'CMAT_SO_SNAPSHOT'
+DEFAULT_SO_SNAPSHOT = os.path.join(os.path.expanduser('~'), '.cache', 'cmat', 'so_snapshot.json')
+BUNDLED_SO_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'so_snapshot.json')
+# Version of the snapshot format, to be incremented when it changes.
+SO_SNAPSHOT_VERSION = 1
+
 
 def process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term, ensembl_transcript_id=None):
     consequence_type_dict[variant_id].append(ConsequenceType(ensembl_gene_id, SoTerm(so_term), ensembl_transcript_id))
 
 
-def process_consequence_type_file(snp_2_gene_file, consequence_type_dict=None):
-    """
-    Return a dictionary of consequence information extracted from the given file.
-    If consequence_type_dict is provided then the information will be merged into this dictionary.
-    """
-    logger.info('Loading mapping rs -> ENSG/SOterms')
-    if consequence_type_dict is None:
-        consequence_type_dict = defaultdict(list)
-
+def iterate_consequence_lines(snp_2_gene_file):
+    """Yields the valid lines of a consequences file, split into fields."""
     with open(snp_2_gene_file, "rt") as snp_2_gene_file:
         for line in snp_2_gene_file:
             line = line.rstrip()
@@ -32,25 +49,85 @@ def process_consequence_type_file(snp_2_gene_file, consequence_type_dict=None):
                 logger.warning('Skip invalid line in snp_2_gene file: {}'.format(line))
                 continue
 
-            variant_id = line_list[0]
-            ensembl_gene_id = line_list[1]
-            so_term = line_list[3]
-
-            if ensembl_gene_id == 'NA':
+            if line_list[1] == 'NA':
                 logger.warning('Skip line with missing gene ID: {}'.format(line))
                 continue
 
-            # Include transcript if present
-            if len(line_list) >= 5:
-                ensembl_transcript_id = line_list[4]
-                process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term, ensembl_transcript_id)
-            else:
-                process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term)
+            yield line_list
+
+
+def process_consequence_type_file(snp_2_gene_file, consequence_type_dict=None):
+    """
+    Return a dictionary of consequence information extracted from the given file.
+    If consequence_type_dict is provided then the information will be merged into this dictionary.
+    If the file is a consequence store (see write_consequence_store), it is opened as a ConsequenceStore instead, which
+    provides the same read-only interface as the dictionary.
+    """
+    if is_consequence_store(snp_2_gene_file):
+        if consequence_type_dict is not None:
+            raise ValueError('Consequences from a consequence store cannot be merged into a dictionary')
+        store = ConsequenceStore(snp_2_gene_file)
+        logger.info('{} rs->ENSG/SOterms mappings opened'.format(len(store)))
+        return store
+
+    logger.info('Loading mapping rs -> ENSG/SOterms')
+    if consequence_type_dict is None:
+        consequence_type_dict = defaultdict(list)
+
+    for line_list in iterate_consequence_lines(snp_2_gene_file):
+        variant_id = line_list[0]
+        # Gene and transcript IDs are shared by many variants, so only one copy of each is kept
+        ensembl_gene_id = sys.intern(line_list[1])
+        so_term = line_list[3]
+
+        # Include transcript if present
+        if len(line_list) >= 5:
+            ensembl_transcript_id = sys.intern(line_list[4])
+            process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term, ensembl_transcript_id)
+        else:
+            process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term)
 
     logger.info('{} rs->ENSG/SOterms mappings loaded'.format(len(consequence_type_dict)))
     return consequence_type_dict
 
 
+def is_consequence_store(path):
+    with open(path, 'rb') as f:
+        return f.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+
+def write_consequence_store(snp_2_gene_file, output_file):
+    """Converts a consequences file into a consequence store, which can be used in place of the file. The store
+    contains the valid lines of the file sorted by variant ID, preceded by the offset of the first line of each variant,
+    so that the consequences of a variant can be found by binary search without loading the file into memory. Lines of
+    the same variant keep their original order."""
+    with open(output_file, 'wb') as f:
+        return pack_consequence_store(snp_2_gene_file, f)
+
+
+def pack_consequence_store(snp_2_gene_file, f):
+    """Writes a consequence store (see write_consequence_store) to a binary file object, at its current position, and
+    returns the number of variants."""
+    # Sorting is stable and only by variant ID, so that the lines of each variant stay in the order of the file
+    lines = sorted(((line_list[0].encode('utf-8'), '\t'.join(line_list).encode('utf-8') + b'\n')
+                    for line_list in iterate_consequence_lines(snp_2_gene_file)), key=itemgetter(0))
+    offsets = []
+    body_size = 0
+    previous_variant_id = None
+    for variant_id, line in lines:
+        if variant_id != previous_variant_id:
+            offsets.append(body_size)
+            previous_variant_id = variant_id
+        body_size += len(line)
+    offsets.append(body_size)
+    f.write(STORE_HEADER.pack(STORE_MAGIC, len(offsets) - 1, len(lines)))
+    for offset in offsets:
+        f.write(STORE_OFFSET.pack(offset))
+    for _, line in lines:
+        f.write(line)
+    return len(offsets) - 1
+
+
 @retry(tries=10, delay=5, backoff=1.2, jitter=(1, 3), logger=logger)
 def get_so_accession_dict(page_size=500):
     """Get name and accession of all hierarchical descendents of sequence_variant in the Sequence Ontology."""
@@ -72,21 +149,94 @@ def get_so_accession_dict(page_size=500):
     }
 
 
+def get_so_snapshot_path():
+    return os.environ.get(SO_SNAPSHOT_ENV_VARIABLE, DEFAULT_SO_SNAPSHOT)
+
+
+def find_so_snapshot():
+    """Returns the location of the snapshot which is loaded by default: the configured one (see get_so_snapshot_path),
+    unless it is the default location and no snapshot was created there, in which case the bundled one is used."""
+    path = get_so_snapshot_path()
+    if SO_SNAPSHOT_ENV_VARIABLE not in os.environ and not os.path.exists(path):
+        return BUNDLED_SO_SNAPSHOT
+    return path
+
+
+def fetch_so_snapshot():
+    """Queries OLS and Ensembl for the current SO accessions and consequence severity ranking."""
+    return {
+        'version': SO_SNAPSHOT_VERSION,
+        'date': date.today().strftime('%Y-%m-%d'),
+        'so_accessions': get_so_accession_dict(),
+        'severity_ranking': get_severity_ranking(),
+    }
+
+
+def refresh_so_snapshot(path=None):
+    """Fetches a new snapshot (see fetch_so_snapshot), writes it to path, which defaults to the configured location
+    (see get_so_snapshot_path), and returns it."""
+    path = path or get_so_snapshot_path()
+    snapshot = fetch_so_snapshot()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Write to a temporary file first, so that concurrent readers never see a partially written snapshot
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(temp_path, path)
+    logger.info(f'SO snapshot with {len(snapshot["so_accessions"])} terms written to {path}')
+    return snapshot
+
+
+def load_so_snapshot(path=None):
+    """Loads the snapshot of SO accessions and consequence severity ranking from path, which defaults to the configured
+    or the bundled snapshot (see find_so_snapshot). The snapshot is never fetched implicitly, a newer one can be created
+    with bin/refresh_so_snapshot.py."""
+    path = path or find_so_snapshot()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'SO snapshot {path} not found; create it using bin/refresh_so_snapshot.py, or set '
+                                f'{SO_SNAPSHOT_ENV_VARIABLE} to the location of an existing snapshot')
+    with open(path) as f:
+        snapshot = json.load(f)
+    if snapshot.get('version') != SO_SNAPSHOT_VERSION:
+        raise ValueError(f'SO snapshot {path} has version {snapshot.get("version")}, expected {SO_SNAPSHOT_VERSION}; '
+                         f'refresh it using bin/refresh_so_snapshot.py')
+    return snapshot
+
+
+@lru_cache
+def get_so_terms_data():
+    """Returns the SO accessions by term name and the severity rank of each term, loading the snapshot the first time
+    they are needed rather than on import."""
+    snapshot = load_so_snapshot()
+    severity_ranks = {so_name: rank for rank, so_name in enumerate(snapshot['severity_ranking'])}
+    return snapshot['so_accessions'], severity_ranks
+
+
 class SoTerm(object):
     """
     Represents a sequence ontology term belonging to a consequence type object.
     Holds information on accession and rank.
+    Terms are immutable and interned: constructing a term with the same name again returns the existing instance.
+    Accessions and ranks come from the SO snapshot (see load_so_snapshot), which is loaded when the first term is
+    constructed.
     """
-    so_accession_name_dict = get_so_accession_dict()
+    __slots__ = ('so_name', '_so_accession')
 
-    ranked_so_names_list = get_severity_ranking()
+    # Instances by name, see __new__
+    _instances = {}
 
-    def __init__(self, so_name):
-        self.so_name = so_name
-        if so_name in SoTerm.so_accession_name_dict:
-            self._so_accession = SoTerm.so_accession_name_dict[so_name]
-        else:
-            self._so_accession = None
+    def __new__(cls, so_name):
+        if so_name not in cls._instances:
+            so_accessions, _ = get_so_terms_data()
+            so_term = super().__new__(cls)
+            so_term.so_name = so_name
+            so_term._so_accession = so_accessions.get(so_name)
+            cls._instances[so_name] = so_term
+        return cls._instances[so_name]
+
+    def __reduce__(self):
+        # Unpickled terms are interned as well
+        return SoTerm, (self.so_name,)
 
     @property
     def accession(self):
@@ -98,10 +248,8 @@ class SoTerm(object):
     @property
     def rank(self):
         # If So name not in Ensembl's ranked list, return the least severe rank
-        if self.so_name not in SoTerm.ranked_so_names_list:
-            return len(SoTerm.ranked_so_names_list)
-        else:
-            return SoTerm.ranked_so_names_list.index(self.so_name)
+        _, severity_ranks = get_so_terms_data()
+        return severity_ranks.get(self.so_name, len(severity_ranks))
 
     def __eq__(self, other):
         return self.accession == other.accession
@@ -115,6 +263,7 @@ class ConsequenceType:
     Holds information on the type of consequence related to a variation
     with relationship to ensembl gene IDs and SO terms
     """
+    __slots__ = ('ensembl_gene_id', 'so_term', 'ensembl_transcript_id')
 
     def __init__(self, ensembl_gene_id, so_term, ensembl_transcript_id=None):
         self.ensembl_gene_id = ensembl_gene_id
@@ -122,7 +271,75 @@ class ConsequenceType:
         self.ensembl_transcript_id = ensembl_transcript_id
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+        return isinstance(other, self.__class__) and all(
+            getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
 
     def __ne__(self, other):
         return not self.__eq__(other)
+
+
+class ConsequenceStore:
+    """
+    Read-only mapping of variant IDs to lists of ConsequenceType objects, backed by a memory-mapped consequence store
+    file (see write_consequence_store). Nothing is loaded into memory in advance, and the pages of the file are shared
+    by all processes which open the same store. Pickling a store only transfers its path.
+
+    A store can also be embedded at the end of another file (see lookup_bundle), starting at offset, which must be a
+    multiple of mmap.ALLOCATIONGRANULARITY.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ, offset=offset)
+        magic, self.variant_count, self.consequence_count = STORE_HEADER.unpack_from(self.data)
+        if magic != STORE_MAGIC:
+            raise ValueError(f'{path} does not contain a consequence store at offset {offset}')
+        self.body_start = STORE_HEADER.size + (self.variant_count + 1) * STORE_OFFSET.size
+
+    def __reduce__(self):
+        return ConsequenceStore, (self.path, self.offset)
+
+    def __len__(self):
+        return self.variant_count
+
+    def __contains__(self, variant_id):
+        return self._find(variant_id) is not None
+
+    def __getitem__(self, variant_id):
+        index = self._find(variant_id)
+        if index is None:
+            raise KeyError(variant_id)
+        consequences = []
+        start, end = self._offset(index), self._offset(index + 1)
+        for line in self.data[start:end].decode('utf-8').splitlines():
+            line_list = line.split('\t')
+            ensembl_transcript_id = line_list[4] if len(line_list) >= 5 else None
+            consequences.append(ConsequenceType(line_list[1], SoTerm(line_list[3]), ensembl_transcript_id))
+        return consequences
+
+    def get(self, variant_id, default=None):
+        return self[variant_id] if variant_id in self else default
+
+    def _offset(self, index):
+        """Returns the position in the file of the first line of a variant."""
+        return self.body_start + STORE_OFFSET.unpack_from(self.data, STORE_HEADER.size + index * STORE_OFFSET.size)[0]
+
+    def _variant_id_at(self, index):
+        start = self._offset(index)
+        return self.data[start:self.data.find(b'\t', start)]
+
+    def _find(self, variant_id):
+        """Returns the index of a variant in the store, or None if it is not present."""
+        key = variant_id.encode('utf-8')
+        low, high = 0, self.variant_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._variant_id_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.variant_count and self._variant_id_at(low) == key:
+            return low
+        return None
@@ -0,0 +1,137 @@
+"""Serialisation and writing of evidence strings. Evidence strings are serialised to bytes using the selected JSON
+encoder and written one per line through a large write buffer, optionally compressed with gzip or zstd. Compressed
+outputs of several batches can be concatenated as they are: both a sequence of gzip members and a sequence of zstd
+frames are read back as a single file."""
+
+import gzip
+import json
+import logging
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__package__)
+
+# Supported JSON encoders. The stdlib encoder produces the same output as json.dumps with default arguments. orjson and
+# ujson are considerably faster and produce equivalent JSON, but without whitespace between the items, and (for orjson)
+# with non-ASCII characters written as UTF-8 rather than escaped.
+JSON_ENCODER = 'json'
+ORJSON_ENCODER = 'orjson'
+UJSON_ENCODER = 'ujson'
+JSON_ENCODER_ENV_VARIABLE = 'CMAT_JSON_ENCODER'
+
+json_encoder = os.environ.get(JSON_ENCODER_ENV_VARIABLE, JSON_ENCODER).lower()
+
+# Supported compression formats for the output, and the extensions added to the output file names.
+GZIP_COMPRESSION = 'gzip'
+ZSTD_COMPRESSION = 'zstd'
+COMPRESSION_EXTENSIONS = {GZIP_COMPRESSION: '.gz', ZSTD_COMPRESSION: '.zst'}
+
+# Number of serialised bytes collected before they are written (and compressed) at once.
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def set_json_encoder(encoder):
+    """Selects the encoder used for all subsequent serialisation. The initial value is taken from the CMAT_JSON_ENCODER
+    environment variable, defaulting to the stdlib json module."""
+    global json_encoder
+    json_encoder = encoder.lower()
+
+
+def get_json_encoder(encoder=None):
+    encoder = encoder or json_encoder
+    if encoder not in (JSON_ENCODER, ORJSON_ENCODER, UJSON_ENCODER):
+        raise ValueError(f'Unknown JSON encoder: {encoder}')
+    if encoder == ORJSON_ENCODER and orjson is None:
+        raise ImportError('orjson must be installed to use the orjson encoder')
+    if encoder == UJSON_ENCODER and ujson is None:
+        raise ImportError('ujson must be installed to use the ujson encoder')
+    return encoder
+
+
+def encode_evidence_string(evidence_string, encoder=None):
+    """Serialises an evidence string into bytes, using the selected encoder (see set_json_encoder)."""
+    encoder = get_json_encoder(encoder)
+    if encoder == ORJSON_ENCODER:
+        return orjson.dumps(evidence_string)
+    if encoder == UJSON_ENCODER:
+        return ujson.dumps(evidence_string).encode('utf-8')
+    return json.dumps(evidence_string).encode('utf-8')
+
+
+def get_output_file_name(file_name, compression=None):
+    """Returns the name of an output file with the extension of the compression format, if any."""
+    if compression is None:
+        return file_name
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f'Unsupported output compression: {compression}')
+    return file_name + COMPRESSION_EXTENSIONS[compression]
+
+
+class EvidenceStringWriter:
+    """Writes serialised evidence strings to a file, one per line. Lines are collected in memory until buffer_size bytes
+    are reached, and then written, and compressed if requested, in one go."""
+
+    def __init__(self, path, compression=None, compression_level=None, buffer_size=WRITE_BUFFER_SIZE):
+        self.fileobj = open(path, 'wb')
+        if compression is None:
+            self.stream = self.fileobj
+        elif compression == GZIP_COMPRESSION:
+            level = compression_level if compression_level is not None else 6
+            self.stream = gzip.GzipFile(fileobj=self.fileobj, mode='wb', compresslevel=level, mtime=0)
+        elif compression == ZSTD_COMPRESSION:
+            if zstandard is None:
+                self.fileobj.close()
+                raise ImportError('zstandard must be installed to write zstd-compressed evidence strings')
+            level = compression_level if compression_level is not None else 10
+            self.stream = zstandard.ZstdCompressor(level=level).stream_writer(self.fileobj, closefd=False)
+        else:
+            self.fileobj.close()
+            raise ValueError(f'Unsupported output compression: {compression}')
+        self.buffer_size = buffer_size
+        self.lines = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, serialised_evidence_string):
+        self.lines.append(serialised_evidence_string)
+        self.buffered += len(serialised_evidence_string) + 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, serialised_evidence_strings):
+        for serialised_evidence_string in serialised_evidence_strings:
+            self.write(serialised_evidence_string)
+
+    def flush(self):
+        if self.lines:
+            self.lines.append(b'')
+            self.stream.write(b'\n'.join(self.lines))
+            self.lines = []
+            self.buffered = 0
+
+    def close(self):
+        try:
+            self.flush()
+            if self.stream is not self.fileobj:
+                self.stream.close()
+        finally:
+            self.fileobj.close()
@@ -0,0 +1,111 @@
+"""State of an evidence string generation run, which makes the next run incremental. For every ClinVar record, the state
+stores a hash of all inputs of its evidence string generation (see clinvar_to_evidence_strings.get_record_input_hash),
+together with the evidence strings and the counts produced for it. Records with the same inputs in the next run are
+not processed again, and their stored evidence strings and counts are used instead.
+
+A state file is a sequence of independent entries, one per record, so the states written for several chunks can be
+concatenated into the state of the complete run."""
+
+import logging
+import mmap
+import os
+import pickle
+import struct
+
+from cmat.output_generation.report import Report
+
+logger = logging.getLogger(__package__)
+
+STATE_FILE_NAME = 'evidence_state.bin'
+# Header of a state entry: magic bytes, hash of the inputs of the record, and lengths of the RCV accession, of the
+# evidence strings (serialised and separated by newlines) and of the pickled counts which follow it.
+ENTRY_MAGIC = b'CMES'
+ENTRY_HEADER = struct.Struct('<4s16sIII')
+# Version of the state, to be incremented whenever evidence strings generated from the same inputs change, so that the
+# states of earlier versions are not reused.
+STATE_VERSION = 1
+
+# Attributes of a report which are not specific to a single record, and are not stored.
+GLOBAL_REPORT_ATTRIBUTES = {'total_trait_mappings', 'total_consequence_mappings'}
+
+
+def encode_state_entry(accession, input_hash, evidence_strings, record_report):
+    """Returns the state entry of a record: the hash of its inputs, its serialised evidence strings and its report,
+    from which only the counts which are not empty are kept."""
+    accession = accession.encode('utf-8')
+    evidence = b'\n'.join(evidence_strings)
+    counts = pickle.dumps({var_name: value for var_name, value in vars(record_report).items()
+                           if value and var_name not in GLOBAL_REPORT_ATTRIBUTES}, protocol=pickle.HIGHEST_PROTOCOL)
+    return ENTRY_HEADER.pack(ENTRY_MAGIC, input_hash, len(accession), len(evidence), len(counts)) + accession + \
+        evidence + counts
+
+
+def decode_state_entry(entry):
+    """Returns the evidence strings and the report of a record from its state entry."""
+    _, _, accession_length, evidence_length, counts_length = ENTRY_HEADER.unpack_from(entry)
+    evidence_start = ENTRY_HEADER.size + accession_length
+    evidence = entry[evidence_start:evidence_start + evidence_length]
+    record_report = Report()
+    record_report.__dict__.update(pickle.loads(entry[evidence_start + evidence_length:]))
+    return evidence.split(b'\n') if evidence else [], record_report
+
+
+class EvidenceState:
+    """
+    Read-only index of the entries of a state file by RCV accession. The file is memory-mapped, and only the position
+    of each entry is kept in memory. Pickling a state only transfers its path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.entries = {}
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+        position = 0
+        while position < len(self.data):
+            magic, _, accession_length, evidence_length, counts_length = ENTRY_HEADER.unpack_from(self.data, position)
+            if magic != ENTRY_MAGIC:
+                raise ValueError(f'{path} is not a valid evidence state file')
+            accession_start = position + ENTRY_HEADER.size
+            accession = self.data[accession_start:accession_start + accession_length].decode('utf-8')
+            end = accession_start + accession_length + evidence_length + counts_length
+            self.entries[accession] = (position, end)
+            position = end
+        logger.info(f'{len(self.entries)} records loaded from evidence state {path}')
+
+    def __reduce__(self):
+        return EvidenceState, (self.path,)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, accession, input_hash):
+        """Returns the state entry of a record if its inputs have the given hash, otherwise None."""
+        if accession not in self.entries:
+            return None
+        start, end = self.entries[accession]
+        if ENTRY_HEADER.unpack_from(self.data, start)[1] != input_hash:
+            return None
+        return self.data[start:end]
+
+
+class EvidenceStateWriter:
+    """Writes the state entries of records to a file, in the order in which they are processed."""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write_all(self, entries):
+        for entry in entries:
+            # Records whose processing raised an exception have no entry, so that they are processed again
+            if entry is not None:
+                self.file.write(entry)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,245 @@
+"""Validation of evidence strings against the Open Targets JSON schema. The schema is compiled into a validator only
+once per process, rather than for every evidence string."""
+
+import json
+import logging
+import os
+import re
+
+import jsonschema
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+logger = logging.getLogger(__package__)
+
+# Supported validator backends. The fastjsonschema backend generates Python code from the schema and is considerably
+# faster, but requires fastjsonschema to be installed.
+JSONSCHEMA_VALIDATOR = 'jsonschema'
+FASTJSONSCHEMA_VALIDATOR = 'fastjsonschema'
+SCHEMA_VALIDATOR_ENV_VARIABLE = 'CMAT_SCHEMA_VALIDATOR'
+
+schema_validator = os.environ.get(SCHEMA_VALIDATOR_ENV_VARIABLE, JSONSCHEMA_VALIDATOR).lower()
+
+# Compiled validators, by the id of the schema contents and the backend. The schema contents are stored alongside, so
+# that a validator is never reused for another schema which happens to get the same id.
+_validators = {}
+
+
+def set_schema_validator(backend):
+    """Selects the backend used for all subsequently compiled validators. The initial value is taken from the
+    CMAT_SCHEMA_VALIDATOR environment variable, defaulting to jsonschema."""
+    global schema_validator
+    schema_validator = backend.lower()
+
+
+def get_schema_validator(backend=None):
+    backend = backend or schema_validator
+    if backend not in (JSONSCHEMA_VALIDATOR, FASTJSONSCHEMA_VALIDATOR):
+        raise ValueError(f'Unknown schema validator: {backend}')
+    if backend == FASTJSONSCHEMA_VALIDATOR and fastjsonschema is None:
+        raise ImportError('fastjsonschema must be installed to use the fastjsonschema validator')
+    return backend
+
+
+class JsonschemaValidator:
+    """Validates with jsonschema, raising the same errors as jsonschema.validate."""
+
+    def __init__(self, schema):
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        self.validator = validator_class(schema, format_checker=jsonschema.FormatChecker())
+
+    def validate(self, instance):
+        error = jsonschema.exceptions.best_match(self.validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
+class FastjsonschemaValidator:
+    """Validates with code generated by fastjsonschema. Instances which fail validation are validated again with
+    jsonschema, so that the reported errors are the same as for the jsonschema backend."""
+
+    def __init__(self, schema):
+        self.fallback = JsonschemaValidator(schema)
+        self.compiled_validate = fastjsonschema.compile(schema)
+
+    def validate(self, instance):
+        try:
+            self.compiled_validate(instance)
+        except fastjsonschema.JsonSchemaException:
+            self.fallback.validate(instance)
+
+
+def compile_validator(schema, backend=None):
+    """Returns a validator for the schema, using the selected backend (see set_schema_validator). Raises
+    jsonschema.exceptions.SchemaError if the schema itself is invalid."""
+    if get_schema_validator(backend) == FASTJSONSCHEMA_VALIDATOR:
+        return FastjsonschemaValidator(schema)
+    return JsonschemaValidator(schema)
+
+
+def get_validator(schema, backend=None, fingerprint=False):
+    """Returns a validator for the schema, compiling it only the first time it is requested in the process. If
+    fingerprint is set, the validator is wrapped in a FingerprintValidator."""
+    backend = get_schema_validator(backend)
+    key = (id(schema), backend, fingerprint)
+    if key not in _validators or _validators[key][0] is not schema:
+        validator = compile_validator(schema, backend)
+        if fingerprint:
+            validator = FingerprintValidator(schema, validator)
+        _validators[key] = (schema, validator)
+    return _validators[key][1]
+
+
+# Keywords which can make the validity of a value depend on anything other than its own value and subschema. Schemas
+# using them are always validated in full.
+UNSUPPORTED_KEYWORDS = {'allOf', 'anyOf', 'oneOf', 'not', 'if', 'then', 'else', 'dependencies', 'dependentRequired',
+                        'dependentSchemas', 'patternProperties', 'propertyNames', 'contains', 'unevaluatedItems',
+                        'unevaluatedProperties', '$dynamicRef', '$recursiveRef'}
+# Marks the elements of an array in a path within an evidence string.
+ARRAY_ITEMS = object()
+
+
+class UnsupportedSchemaError(Exception):
+    pass
+
+
+def get_fingerprint(instance):
+    """Returns the structural fingerprint of a JSON value: its keys and the types of all values, recursively. The
+    fingerprint of an array is the set of fingerprints of its items."""
+    if isinstance(instance, dict):
+        return tuple(sorted((key, get_fingerprint(value)) for key, value in instance.items()))
+    if isinstance(instance, list):
+        return 'array', frozenset(get_fingerprint(item) for item in instance)
+    return type(instance).__name__
+
+
+class FingerprintValidator:
+    """Validates the first instance of every structural fingerprint (see get_fingerprint) in full. Instances with an
+    already validated fingerprint are guaranteed to have the same keys and types, so only the constraints which depend
+    on the values themselves (enums, patterns, formats, ranges and lengths) are checked for them. When any of these
+    checks fail, the instance is validated in full again, so that errors are reported in the same way."""
+
+    def __init__(self, schema, validator):
+        self.schema = schema
+        self.validator = validator
+        self.format_checker = jsonschema.FormatChecker()
+        # Value checks by fingerprint, or None for fingerprints which always have to be validated in full
+        self.value_checks = {}
+
+    def validate(self, instance):
+        fingerprint = get_fingerprint(instance)
+        if fingerprint not in self.value_checks:
+            self.validator.validate(instance)
+            try:
+                self.value_checks[fingerprint] = self.get_value_checks(instance)
+            except UnsupportedSchemaError:
+                self.value_checks[fingerprint] = None
+            return
+        value_checks = self.value_checks[fingerprint]
+        if value_checks is None or not all(check(value) for path, check in value_checks
+                                           for value in iterate_values(instance, path)):
+            self.validator.validate(instance)
+
+    def get_value_checks(self, instance):
+        """Returns a list of (path, check) tuples for all constraints on values of an instance which was validated in
+        full. Raises UnsupportedSchemaError if this is not possible for the schema."""
+        value_checks = []
+        self._collect_value_checks(self.schema, instance, (), value_checks, set())
+        return value_checks
+
+    def _collect_value_checks(self, subschema, instance, path, value_checks, visited):
+        subschema = self._resolve(subschema)
+        if subschema is True or subschema == {}:
+            return
+        if not isinstance(subschema, dict) or UNSUPPORTED_KEYWORDS & subschema.keys():
+            raise UnsupportedSchemaError()
+        # Items of an array share a path, so the same subschema may be reached several times
+        if (path, id(subschema)) not in visited:
+            visited.add((path, id(subschema)))
+            value_checks.extend((path, check) for check in self._compile_checks(subschema))
+        if isinstance(instance, dict):
+            for key, value in instance.items():
+                if key in subschema.get('properties', {}):
+                    self._collect_value_checks(subschema['properties'][key], value, path + (key,), value_checks,
+                                               visited)
+                elif isinstance(subschema.get('additionalProperties'), dict):
+                    self._collect_value_checks(subschema['additionalProperties'], value, path + (key,), value_checks,
+                                               visited)
+        elif isinstance(instance, list):
+            items = subschema.get('items', {})
+            if not isinstance(items, dict) or 'prefixItems' in subschema or 'additionalItems' in subschema:
+                raise UnsupportedSchemaError()
+            for item in instance:
+                self._collect_value_checks(items, item, path + (ARRAY_ITEMS,), value_checks, visited)
+
+    def _resolve(self, subschema):
+        """Follows local references ("#/..."), which are the only ones supported."""
+        while isinstance(subschema, dict) and '$ref' in subschema:
+            ref = subschema['$ref']
+            if not ref.startswith('#') or len(subschema) > 1:
+                raise UnsupportedSchemaError()
+            subschema = self.schema
+            for part in filter(None, ref[1:].split('/')):
+                subschema = subschema[part.replace('~1', '/').replace('~0', '~')]
+        return subschema
+
+    def _compile_checks(self, subschema):
+        checks = []
+        types = subschema.get('type', [])
+        if 'integer' in types and 'number' not in types:
+            # Both 1 and 1.0 are integers, so a float value might not be one even if the fingerprint is the same
+            checks.append(lambda value: not isinstance(value, float) or value.is_integer())
+        if 'enum' in subschema:
+            checks.append(lambda value, enum=subschema['enum']: value in enum)
+        if 'const' in subschema:
+            checks.append(lambda value, const=subschema['const']: value == const)
+        if 'pattern' in subschema:
+            checks.append(lambda value, regex=re.compile(subschema['pattern']):
+                          not isinstance(value, str) or regex.search(value) is not None)
+        if 'format' in subschema:
+            checks.append(lambda value, format_=subschema['format']: self.format_checker.conforms(value, format_))
+        for keyword, compare in (('minLength', lambda a, b: len(a) >= b), ('maxLength', lambda a, b: len(a) <= b)):
+            if keyword in subschema:
+                checks.append(lambda value, limit=subschema[keyword], compare=compare:
+                              not isinstance(value, str) or compare(value, limit))
+        for keyword, compare in (('minimum', lambda a, b: a >= b), ('maximum', lambda a, b: a <= b),
+                                 ('exclusiveMinimum', lambda a, b: a > b), ('exclusiveMaximum', lambda a, b: a < b)):
+            if keyword in subschema:
+                if isinstance(subschema[keyword], bool):
+                    # Draft 4 boolean exclusive limits modify minimum / maximum
+                    raise UnsupportedSchemaError()
+                checks.append(lambda value, limit=subschema[keyword], compare=compare:
+                              not _is_number(value) or compare(value, limit))
+        if 'multipleOf' in subschema:
+            checks.append(lambda value, divisor=subschema['multipleOf']:
+                          not _is_number(value) or value % divisor == 0)
+        for keyword, compare in (('minItems', lambda a, b: len(a) >= b), ('maxItems', lambda a, b: len(a) <= b)):
+            if keyword in subschema:
+                checks.append(lambda value, limit=subschema[keyword], compare=compare:
+                              not isinstance(value, list) or compare(value, limit))
+        if subschema.get('uniqueItems'):
+            checks.append(lambda value: not isinstance(value, list) or
+                          len({json.dumps(item, sort_keys=True) for item in value}) == len(value))
+        return checks
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def iterate_values(instance, path):
+    """Yields all values at a path within an instance, see FingerprintValidator.get_value_checks. Items of an array can
+    have different structures, so a path only leads to the values of the items which contain it."""
+    if not path:
+        yield instance
+        return
+    key, rest = path[0], path[1:]
+    if key is ARRAY_ITEMS:
+        for item in instance:
+            yield from iterate_values(item, rest)
+    elif isinstance(instance, dict) and key in instance:
+        yield from iterate_values(instance[key], rest)
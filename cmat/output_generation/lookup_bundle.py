@@ -0,0 +1,68 @@
+"""Lookup bundle: the trait mappings, the consequences and the Open Targets JSON schema used by evidence string
+generation, prepared once and stored in a single binary file. Loading a bundle does not depend on the size of the
+consequences, as they are stored as a consequence store which is memory-mapped rather than read (see
+consequence_type.ConsequenceStore), and the trait mappings and the schema are unpickled rather than parsed from text."""
+
+import json
+import logging
+import mmap
+import pickle
+import shutil
+import struct
+
+from cmat.output_generation import consequence_type as CT
+from cmat.output_generation.ontology_mapping import load_ontology_mapping
+
+logger = logging.getLogger(__package__)
+
+# Header of a lookup bundle file: magic bytes, format version, length of the pickled trait mappings and schema which
+# follow it, and offset of the consequence store at the end of the file.
+BUNDLE_MAGIC = b'CMATBNDL'
+BUNDLE_VERSION = 1
+BUNDLE_HEADER = struct.Struct('<8sIQQ')
+
+
+def is_lookup_bundle(path):
+    with open(path, 'rb') as f:
+        return f.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+
+
+def write_lookup_bundle(trait_mapping_file, gene_mapping_file, ot_schema_file, output_file):
+    """Writes a lookup bundle from a trait mapping file, a consequences file (or consequence store) and an Open Targets
+    JSON schema file."""
+    string_to_efo_mappings, target_ontology = load_ontology_mapping(trait_mapping_file)
+    with open(ot_schema_file, 'rt') as f:
+        ot_schema_contents = json.load(f)
+    lookups = pickle.dumps((string_to_efo_mappings, target_ontology, ot_schema_contents),
+                           protocol=pickle.HIGHEST_PROTOCOL)
+    # The consequence store is memory-mapped from its offset, which has to be aligned
+    alignment = mmap.ALLOCATIONGRANULARITY
+    store_offset = (BUNDLE_HEADER.size + len(lookups) + alignment - 1) // alignment * alignment
+
+    with open(output_file, 'wb') as f:
+        f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(lookups), store_offset))
+        f.write(lookups)
+        f.write(b'\0' * (store_offset - f.tell()))
+        if CT.is_consequence_store(gene_mapping_file):
+            with open(gene_mapping_file, 'rb') as store:
+                shutil.copyfileobj(store, f)
+        else:
+            CT.pack_consequence_store(gene_mapping_file, f)
+    logger.info(f'Lookup bundle written to {output_file}')
+
+
+def load_lookup_bundle(bundle_file):
+    """Loads a lookup bundle written by write_lookup_bundle. Returns the trait mappings (as an OntologyMappingIndex),
+    the target ontology, the consequences (as a ConsequenceStore) and the contents of the JSON schema."""
+    with open(bundle_file, 'rb') as f:
+        magic, version, lookups_length, store_offset = BUNDLE_HEADER.unpack(f.read(BUNDLE_HEADER.size))
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f'{bundle_file} is not a lookup bundle')
+        if version != BUNDLE_VERSION:
+            raise ValueError(f'Lookup bundle {bundle_file} has version {version}, expected {BUNDLE_VERSION}; '
+                             f'rebuild it with bin/build_lookup_bundle.py')
+        string_to_efo_mappings, target_ontology, ot_schema_contents = pickle.loads(f.read(lookups_length))
+    variant_to_gene_mappings = CT.ConsequenceStore(bundle_file, store_offset)
+    logger.info(f'Lookup bundle loaded: {string_to_efo_mappings.mapping_count} ontology mappings, '
+                f'{len(variant_to_gene_mappings)} rs->ENSG/SOterms mappings')
+    return string_to_efo_mappings, target_ontology, variant_to_gene_mappings, ot_schema_contents
@@ -0,0 +1,164 @@
+"""Index of the mappings from trait names to ontology terms, as loaded from a trait mapping file (see
+load_ontology_mapping)."""
+
+import logging
+import re
+from collections.abc import Mapping
+
+logger = logging.getLogger(__package__)
+
+# Maximum number of entries kept in each of the memoisation caches of an index. When a cache is full, it is cleared.
+CACHE_SIZE = 2 ** 18
+
+
+class OntologyMappingIndex(Mapping):
+    """
+    Read-only mapping of lower-cased trait names to lists of (ontology ID, ontology label) tuples, with the same
+    contents as the dictionary previously used for the mappings. Every trait name and ontology ID is assigned an integer
+    ID once, when the index is built, and the mappings of each name are stored as tuples of (ontology ID number, label).
+
+    Names taken from ClinVar records are normalised only the first time they are looked up (see lookup), and the
+    grouping of the traits of a record (see group_traits) is memoised by the names of the traits, as many records share
+    identical trait sets. The caches are local to each process and are not pickled.
+    """
+    __slots__ = ('name_ids', 'name_mappings', 'ontology_ids', 'ontology_id_numbers', 'target_ontology',
+                 'mapping_count', '_lookup_cache', '_grouping_cache')
+
+    def __init__(self, string_to_ontology_mappings=None, target_ontology='EFO'):
+        self.name_ids = {}
+        self.name_mappings = []
+        self.ontology_ids = []
+        self.ontology_id_numbers = {}
+        self.target_ontology = target_ontology
+        self.mapping_count = 0
+        self._lookup_cache = {}
+        self._grouping_cache = {}
+        for trait_name, mappings in (string_to_ontology_mappings or {}).items():
+            for ontology_id, ontology_label in mappings:
+                self.add(trait_name, ontology_id, ontology_label)
+
+    def __getstate__(self):
+        return self.name_ids, self.name_mappings, self.ontology_ids, self.target_ontology, self.mapping_count
+
+    def __setstate__(self, state):
+        self.name_ids, self.name_mappings, self.ontology_ids, self.target_ontology, self.mapping_count = state
+        self.ontology_id_numbers = {ontology_id: i for i, ontology_id in enumerate(self.ontology_ids)}
+        self._lookup_cache = {}
+        self._grouping_cache = {}
+
+    def add(self, trait_name, ontology_id, ontology_label):
+        """Adds a mapping of a trait name (which is lower-cased) to an ontology term."""
+        name_id = self.name_ids.setdefault(trait_name.lower(), len(self.name_ids))
+        if name_id == len(self.name_mappings):
+            self.name_mappings.append(())
+        ontology_id_number = self.ontology_id_numbers.setdefault(ontology_id, len(self.ontology_ids))
+        if ontology_id_number == len(self.ontology_ids):
+            self.ontology_ids.append(ontology_id)
+        self.name_mappings[name_id] += ((ontology_id_number, ontology_label),)
+        self.mapping_count += 1
+        self._lookup_cache.clear()
+        self._grouping_cache.clear()
+
+    def __getitem__(self, trait_name):
+        return [(self.ontology_ids[ontology_id_number], ontology_label)
+                for ontology_id_number, ontology_label in self.name_mappings[self.name_ids[trait_name]]]
+
+    def __iter__(self):
+        return iter(self.name_ids)
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def __contains__(self, trait_name):
+        return trait_name in self.name_ids
+
+    def get(self, trait_name, default=None):
+        return self[trait_name] if trait_name in self.name_ids else default
+
+    def lookup(self, trait_name):
+        """Returns a tuple of (ontology ID number, label) tuples for a trait name as found in ClinVar, i.e. before it is
+        lower-cased. Ontology IDs are obtained from the numbers with get_ontology_id."""
+        mappings = self._lookup_cache.get(trait_name)
+        if mappings is None:
+            if len(self._lookup_cache) >= CACHE_SIZE:
+                self._lookup_cache.clear()
+            name_id = self.name_ids.get(trait_name.lower())
+            mappings = self.name_mappings[name_id] if name_id is not None else ()
+            self._lookup_cache[trait_name] = mappings
+        return mappings
+
+    def get_ontology_id(self, ontology_id_number):
+        return self.ontology_ids[ontology_id_number]
+
+    def group_traits(self, clinvar_record_traits):
+        """Groups the traits of a ClinVar record by their ontology mappings, as described in
+        clinvar_to_evidence_strings.group_diseases_by_efo_mapping. Returns a list of (trait, name of the trait, ontology
+        ID or None) tuples, one for each group. The result is memoised by the preferred and all names of the traits,
+        which determine it completely."""
+        signature = tuple((trait.preferred_name, tuple(trait.all_names)) for trait in clinvar_record_traits)
+        grouping = self._grouping_cache.get(signature)
+        if grouping is None:
+            if len(self._grouping_cache) >= CACHE_SIZE:
+                self._grouping_cache.clear()
+            grouping = tuple(
+                (trait_number, trait_name, self.ontology_ids[ontology_id_number]
+                 if ontology_id_number is not None else None)
+                for trait_number, trait_name, ontology_id_number
+                in group_trait_names(clinvar_record_traits, self.lookup))
+            self._grouping_cache[signature] = grouping
+        return [(clinvar_record_traits[trait_number], trait_name, ontology_id)
+                for trait_number, trait_name, ontology_id in grouping]
+
+
+def group_trait_names(clinvar_record_traits, lookup):
+    """Groups traits by their ontology mappings, where lookup returns the (ontology ID, label) tuples for a trait name.
+    Returns a list of (trait number, name of the trait, ontology ID or None) tuples, one for each group: first the
+    unmapped traits, and then the first trait lexicographically mapped to each ontology ID."""
+    ontology_id_to_traits = {}
+    grouping = []
+    for trait_number, trait in enumerate(clinvar_record_traits):
+        is_unmapped = True
+        # Try to match using all trait names.
+        for trait_name in trait.all_names:
+            for ontology_id, _ in lookup(trait_name):
+                is_unmapped = False
+                ontology_id_to_traits.setdefault(ontology_id, []).append(trait_number)
+        # Unmapped traits are kept but not grouped
+        if is_unmapped:
+            grouping.append((trait_number, trait.preferred_or_other_valid_name, None))
+
+    # Keep only one trait from each group. Of traits with the same name, min selects the first one.
+    trait_names = [trait.preferred_or_other_valid_name for trait in clinvar_record_traits]
+    for ontology_id, trait_numbers in ontology_id_to_traits.items():
+        selected_trait_number = min(trait_numbers, key=trait_names.__getitem__)
+        grouping.append((selected_trait_number, trait_names[selected_trait_number], ontology_id))
+    return grouping
+
+
+def load_ontology_mapping(trait_mapping_file):
+    """Loads a trait mapping file into an OntologyMappingIndex, keyed by lower-cased trait name. Returns the index and
+    the target ontology of the mappings."""
+    trait_2_ontology = OntologyMappingIndex()
+    target_ontology = 'EFO'
+    n_ontology_mappings = 0
+    in_header = True
+
+    with open(trait_mapping_file, 'rt') as f:
+        for line in f:
+            line = line.rstrip()
+            if in_header:
+                # Extract ontology if present
+                m = re.match(r'^#ontology=(.*?)$', line)
+                if m and m.group(1):
+                    target_ontology = m.group(1).upper()
+            if line.startswith('#') or not line:
+                continue
+            in_header = False
+            line_list = line.split('\t')
+            assert len(line_list) == 3, f'Incorrect string to ontology mapping format for line {line}'
+            clinvar_name, ontology_id, ontology_label = line_list
+            trait_2_ontology.add(clinvar_name, ontology_id, ontology_label)
+            n_ontology_mappings += 1
+    trait_2_ontology.target_ontology = target_ontology
+    logger.info('{} ontology mappings loaded for ontology {}'.format(n_ontology_mappings, target_ontology))
+    return trait_2_ontology, target_ontology
@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import os
+from array import array
 from collections import Counter
 
 import yaml
@@ -12,6 +14,7 @@ yaml.SafeDumper.add_representer(Counter,
 
 UNMAPPED_TRAITS_FILE_NAME = 'unmapped_traits.tsv'
 COUNTS_FILE_NAME = 'counts.yml'
+EVIDENCE_STRING_KEYS_FILE_NAME = 'evidence_string_keys.bin'
 
 
 class Report:
@@ -42,7 +45,11 @@ class Report:
         # Total number of trait-to-ontology mappings present in the database.
         self.total_trait_mappings = 0
         if trait_mappings:
-            self.total_trait_mappings = sum([len(mappings) for mappings in trait_mappings.values()])
+            if hasattr(trait_mappings, 'mapping_count'):
+                # Ontology mapping indexes (see ontology_mapping.OntologyMappingIndex) keep the total
+                self.total_trait_mappings = trait_mappings.mapping_count
+            else:
+                self.total_trait_mappings = sum([len(mappings) for mappings in trait_mappings.values()])
         # All distinct (trait name, EFO ID) mappings used in the evidence strings.
         self.used_trait_mappings = set()
         # All unmapped trait names which prevented evidence string generation and their counts.
@@ -51,10 +58,21 @@ class Report:
         # Variant-to-consequence mapping counts.
         self.total_consequence_mappings = 0
         if consequence_mappings:
-            self.total_consequence_mappings = sum([len(mappings) for mappings in consequence_mappings.values()])
+            if hasattr(consequence_mappings, 'consequence_count'):
+                # Consequence stores (see consequence_type.ConsequenceStore) keep the total, so that it is not necessary
+                # to read all the consequences
+                self.total_consequence_mappings = consequence_mappings.consequence_count
+            else:
+                self.total_consequence_mappings = sum([len(mappings) for mappings in consequence_mappings.values()])
         self.repeat_expansion_variants = 0
         self.structural_variants = 0
 
+        # Uniqueness keys of all generated evidence strings, stored as 64-bit hashes (see add_evidence_string_key), and
+        # the number of evidence strings with a key which was already present. The keys are not included in the counts
+        # file, but written separately (see write_evidence_string_keys).
+        self.evidence_string_keys = set()
+        self.duplicate_evidence_strings = 0
+
     def __eq__(self, other):
         if not isinstance(other, Report):
             return NotImplemented
@@ -64,21 +82,57 @@ class Report:
         if not isinstance(other, Report):
             return NotImplemented
         result = Report()
+        result += self
+        result += other
+        return result
+
+    def __iadd__(self, other):
+        """Adds the counts of another report to this one in place, which avoids copying the evidence string keys when
+        many reports are added up one by one."""
+        if not isinstance(other, Report):
+            return NotImplemented
         for var_name in vars(self).keys() | vars(other).keys():
             if var_name == 'total_trait_mappings':
-                result.total_trait_mappings = max(self.total_trait_mappings, other.total_trait_mappings)
+                self.total_trait_mappings = max(self.total_trait_mappings, other.total_trait_mappings)
             elif var_name == 'total_consequence_mappings':
-                result.total_consequence_mappings = max(self.total_consequence_mappings,
-                                                        other.total_consequence_mappings)
+                self.total_consequence_mappings = max(self.total_consequence_mappings,
+                                                      other.total_consequence_mappings)
             elif var_name == 'used_trait_mappings':
-                result.used_trait_mappings = self.used_trait_mappings | other.used_trait_mappings
+                self.used_trait_mappings |= other.used_trait_mappings
+            elif var_name == 'unmapped_trait_names':
+                self.unmapped_trait_names.update(other.unmapped_trait_names)
+            elif var_name == 'evidence_string_keys':
+                # Keys present in both reports are duplicates as well
+                self.duplicate_evidence_strings += len(self.evidence_string_keys & other.evidence_string_keys)
+                self.evidence_string_keys |= other.evidence_string_keys
             else:
-                result.__setattr__(var_name, self.__getattribute__(var_name) + other.__getattribute__(var_name))
-        return result
+                self.__setattr__(var_name, self.__getattribute__(var_name) + other.__getattribute__(var_name))
+        return self
+
+    def add_evidence_string_key(self, key):
+        """Records the uniqueness key of an evidence string and returns whether the same key was recorded before, in
+        which case the evidence string is counted as a duplicate."""
+        hashed_key = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+        if hashed_key in self.evidence_string_keys:
+            self.duplicate_evidence_strings += 1
+            return True
+        self.evidence_string_keys.add(hashed_key)
+        return False
+
+    def write_evidence_string_keys(self, dir_out, filename=EVIDENCE_STRING_KEYS_FILE_NAME):
+        with open(os.path.join(dir_out, filename), 'wb') as f:
+            array('Q', sorted(self.evidence_string_keys)).tofile(f)
+
+    def load_evidence_string_keys(self, filename):
+        keys = array('Q')
+        with open(filename, 'rb') as f:
+            keys.fromfile(f, os.path.getsize(filename) // keys.itemsize)
+        self.evidence_string_keys = set(keys)
 
     def dump_to_file(self, dir_out, filename=COUNTS_FILE_NAME):
         with open(os.path.join(dir_out, filename), 'w') as f:
-            yaml.safe_dump(vars(self), f)
+            yaml.safe_dump({var_name: value for var_name, value in vars(self).items()
+                            if var_name != 'evidence_string_keys'}, f)
 
     def load_from_file(self, filename):
         with open(filename, 'r') as f:
@@ -112,6 +166,7 @@ class Report:
         self.compute_record_tallies()
         report = f'''Total number of evidence strings generated\t{self.evidence_string_count}
             Total number of complete evidence strings generated\t{self.complete_evidence_string_count}
+            Total number of duplicate evidence strings generated\t{self.duplicate_evidence_strings}
 
             Total number of ClinVar records\t{self.clinvar_total}
                 Fatal: Cannot produce evidence\t{self.clinvar_fatal}
@@ -0,0 +1,55 @@
+import itertools
+from time import gmtime, strftime
+
+from cmat.clinvar_xml_io.ontology_uri import OntologyUri
+from cmat.clinvar_xml_io.scan import RecordConsumer
+
+ZOOMA_FEEDBACK_HEADER = 'STUDY\tBIOENTITY\tPROPERTY_TYPE\tPROPERTY_VALUE\tSEMANTIC_TAG\tANNOTATOR\tANNOTATION_DATE\n'
+
+
+def write_zooma_record(clinvar_acc, variant_id, trait_name, ontology_uri, date, outfile):
+    zooma_output_list = [clinvar_acc,
+                         variant_id,
+                         'disease',
+                         trait_name,
+                         str(ontology_uri),
+                         'clinvar-xrefs',
+                         date]
+    outfile.write('\t'.join(zooma_output_list) + '\n')
+
+
+def process_clinvar_record(clinvar_record, outfile):
+    """Extract the variant, trait and ontology from Clinvar record and write them as a ZOOMA feedback record."""
+    if clinvar_record.measure is None:
+        return
+    variant_ids = [variant_id
+                   for variant_id in (clinvar_record.measure.rs_id, clinvar_record.measure.nsv_id)
+                   if variant_id is not None]
+    traits = clinvar_record.traits
+    for variant_id, trait in itertools.product(variant_ids, traits):
+        if trait.preferred_or_other_valid_name is None:
+            continue
+        for db, identifier, status in trait.xrefs:
+            if status != 'current' or db.lower() not in OntologyUri.db_to_uri_conversion:
+                continue
+            ontology_uri = OntologyUri(identifier, db)
+            write_zooma_record(clinvar_record.accession, variant_id, trait.preferred_or_other_valid_name, ontology_uri,
+                               strftime('%d/%m/%y %H:%M', gmtime()), outfile)
+
+
+class ZoomaFeedbackConsumer(RecordConsumer):
+    """Writes OMIM and MedGen cross-references of all records in ZOOMA feedback format."""
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.outfile = None
+
+    def start(self):
+        self.outfile = open(self.output_file, 'wt')
+        self.outfile.write(ZOOMA_FEEDBACK_HEADER)
+
+    def consume(self, record):
+        process_clinvar_record(record, self.outfile)
+
+    def finish(self):
+        self.outfile.close()
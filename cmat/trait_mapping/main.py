@@ -97,9 +97,9 @@ def read_traits_from_csv(traits_filepath):
     return traits
 
 
-def parse_traits(input_filepath, output_traits_filepath, output_for_platform=None):
+def parse_traits(input_filepath, output_traits_filepath, output_for_platform=None, parallel=None):
     logger.info('Started parsing trait names')
-    trait_list = parse_trait_names(input_filepath)
+    trait_list = parse_trait_names(input_filepath, parallel=parallel)
     logger.info("Loaded {} trait names".format(len(trait_list)))
     # Remove non-specific trait names which should never be output
     trait_list = [trait for trait in trait_list if trait.name.lower() not in ClinVarTrait.NONSPECIFIC_TRAITS]
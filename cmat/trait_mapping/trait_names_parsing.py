@@ -1,11 +1,26 @@
 from collections import Counter
 
-from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io.columnar import open_dataset
 from cmat.clinvar_xml_io.filtering import filter_by_submission_name
 from cmat.trait_mapping.trait import Trait
 
+# Columns required by get_trait_names_and_ids when reading from the columnar store.
+TRAIT_COLUMNS = ['accession', 'vcv_id', 'traits', 'measure', 'scv_submission_names']
 
-def parse_trait_names(filepath: str) -> list:
+
+def get_trait_names_and_ids(clinvar_set):
+    """Returns a tuple of (1) the set of (trait name, trait identifier) tuples for all valid traits of a ClinVarSet, and
+    (2) whether the set is linked to an NT expansion variant. Returns None if the set should be filtered out."""
+    if not filter_by_submission_name(clinvar_set):
+        return None
+    clinvar_record = clinvar_set.rcv
+    trait_names_and_ids = set((trait.preferred_or_other_valid_name.lower(), trait.identifier)
+                              for trait in clinvar_record.traits_with_valid_names)
+    is_nt_expansion = bool(clinvar_record.measure and clinvar_record.measure.is_repeat_expansion_variant)
+    return trait_names_and_ids, is_nt_expansion
+
+
+def parse_trait_names(filepath: str, parallel: int = None) -> list:
     """For a file containing ClinVar records in the XML format, return a list of Traits for the records in the file.
     Each Trait object contains trait name, how many times it occurs in the input file, and whether it is linked to an NT
     expansion variant.
@@ -18,7 +33,8 @@ def parse_trait_names(filepath: str) -> list:
     microsatellites are NT expansion variants, and their curation is of highest importance even if the number of records
     which they are linked to is low.
 
-    :param filepath: Path to a gzipped file containing ClinVar XML dump.
+    :param filepath: Path to a gzipped file containing ClinVar XML dump, or to its columnar export (.parquet).
+    :param parallel: Number of worker processes to parse the XML with (default: parse in the current process).
     :return: A list of Trait objects."""
 
     # Tracks how many times a trait name occurs in ClinVar
@@ -28,16 +44,14 @@ def parse_trait_names(filepath: str) -> list:
     # Their curation is of highest importance regardless of how many records they are actually associated with.
     nt_expansion_traits = set()
 
-    dataset = ClinVarDataset(filepath)
-    for clinvar_set in dataset.iter_cvs():
-        if not filter_by_submission_name(clinvar_set):
+    dataset = open_dataset(filepath, columns=TRAIT_COLUMNS)
+    for result in dataset.iter_cvs(parallel=parallel, map_func=get_trait_names_and_ids):
+        if result is None:
             continue
-        clinvar_record = clinvar_set.rcv
-        trait_names_and_ids = set((trait.preferred_or_other_valid_name.lower(), trait.identifier)
-                                  for trait in clinvar_record.traits_with_valid_names)
+        trait_names_and_ids, is_nt_expansion = result
         for trait_tuple in trait_names_and_ids:
             trait_name_counter[trait_tuple] += 1
-        if clinvar_record.measure and clinvar_record.measure.is_repeat_expansion_variant:
+        if is_nt_expansion:
             nt_expansion_traits |= trait_names_and_ids
 
     # Count trait occurrences
@@ -0,0 +1,62 @@
+"""Compares the memory used by the consequence mappings when loading a consequences file into a dictionary, and when
+opening it as a consequence store (see cmat.output_generation.consequence_type.ConsequenceStore). Each measurement runs
+in a separate process, so that the memory used by one does not affect the other. Only works on Linux."""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from cmat.output_generation import consequence_type as CT
+
+
+def get_rss():
+    """Returns the current resident set size of the process in MB, and the part of it which is private to the process,
+    i.e. excluding the pages of files (including memory-mapped ones) which are shared with other processes."""
+    with open('/proc/self/statm') as f:
+        resident, shared = map(int, f.read().split()[1:3])
+    page_size = os.sysconf('SC_PAGE_SIZE') / 2**20
+    return resident * page_size, (resident - shared) * page_size
+
+
+def measure(mappings_file, gene_mapping_file, lookups):
+    """Loads the mappings from mappings_file (the consequences file or a store built from it), looks up the variant of
+    every lookups-th line of the consequences file, and returns the increase in total and private RSS in MB and the time
+    taken."""
+    with open(gene_mapping_file) as f:
+        variant_ids = [line.split('\t', 1)[0] for i, line in enumerate(f) if i % lookups == 0]
+    rss_before = get_rss()
+    start_time = time.perf_counter()
+    mappings = CT.process_consequence_type_file(mappings_file)
+    for variant_id in variant_ids:
+        mappings[variant_id]
+    elapsed = time.perf_counter() - start_time
+    rss_after = get_rss()
+    return rss_after[0] - rss_before[0], rss_after[1] - rss_before[1], elapsed
+
+
+def main(gene_mapping_file, lookups):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_file = os.path.join(tmp_dir, 'consequences.csqstore')
+        start_time = time.perf_counter()
+        CT.write_consequence_store(gene_mapping_file, store_file)
+        print(f'Store built in {time.perf_counter() - start_time:.1f} s, {os.path.getsize(store_file) / 2**20:.1f} MB')
+        for label, path in (('dictionary', gene_mapping_file), ('store', store_file)):
+            output = subprocess.run([sys.executable, __file__, '--measure', path, '--gene-mapping', gene_mapping_file,
+                                     '--lookups', str(lookups)], capture_output=True, text=True, check=True).stdout
+            rss, private_rss, elapsed = map(float, output.split())
+            print(f'{label:<12} {rss:>8.1f} MB RSS increase ({private_rss:.1f} MB private), '
+                  f'{elapsed:>6.1f} s to load and look up')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--gene-mapping', help='Variant to gene & consequence mappings', required=True)
+    parser.add_argument('--lookups', help='Look up the variant of every N-th line', type=int, default=10)
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(*measure(args.measure, args.gene_mapping, args.lookups))
+    else:
+        main(args.gene_mapping, args.lookups)
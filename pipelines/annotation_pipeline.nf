@@ -14,6 +14,18 @@ def helpMessage() {
         --mappings             Trait mappings file (optional, will use a default path if omitted)
         --include_transcripts  Whether to include transcripts in consequences (default false)
         --evaluate             Whether to run evaluation or not (default false)
+        --full_validation      Whether to validate every evidence string against the complete schema (default false)
+        --evidence_compression Compression of the evidence strings output, gzip or zstd (optional, uncompressed if
+                               omitted)
+        --so_snapshot          SO accessions and severity ranking snapshot (optional, will fetch current if omitted)
+        --previous_evidence_state
+                               Evidence state of a previous run, only records changed since then are regenerated
+                               (optional)
+        --vep_cache            VEP results cache, only variants not in it are queried and it is updated (optional)
+        --local_vep_cache      VEP offline cache directory, to annotate variants with local VEP instead of VEP API
+                               (optional)
+        --gene_models          Ensembl GTF file, to skip structural variants overlapping too many genes before VEP
+                               (optional)
     """
 }
 
@@ -24,6 +36,13 @@ params.clinvar = null
 params.mappings = '${BATCH_ROOT_BASE}/manual_curation/latest_mappings.tsv'
 params.include_transcripts = false
 params.evaluate = false
+params.full_validation = false
+params.evidence_compression = null
+params.so_snapshot = null
+params.previous_evidence_state = null
+params.vep_cache = null
+params.local_vep_cache = null
+params.gene_models = null
 
 if (params.help) {
     exit 0, helpMessage()
@@ -34,6 +53,13 @@ if (!params.output_dir) {
 batchRoot = params.output_dir
 codeRoot = "${projectDir}/.."
 includeTranscriptsFlag = params.include_transcripts ? "--include-transcripts" : ""
+vepCacheFlag = params.vep_cache ? "--vep-cache ${params.vep_cache}" : ""
+localVepFlag = params.local_vep_cache ? "--local-vep-cache ${params.local_vep_cache}" : ""
+geneModelsFlag = params.gene_models ? "--gene-models ${params.gene_models}" : ""
+fullValidationFlag = params.full_validation ? "--full-validation" : ""
+compressionFlag = params.evidence_compression ? "--compression ${params.evidence_compression}" : ""
+// Compressed outputs of all chunks are concatenated without recompression
+evidenceStringsFile = "evidence_strings.json" + ["gzip": ".gz", "zstd": ".zst"].get(params.evidence_compression, "")
 // Number of chunks to run in parallel for evidence generation
 numChunks = 10
 
@@ -47,10 +73,19 @@ workflow {
         clinvarXml = downloadClinvar()
     }
 
+    // Extract the inputs of all subsequent steps in a single pass through the XML
+    scanClinvar(clinvarXml)
+    // Query SO accessions and consequence severity ranking once, rather than in every process which uses them
+    if (params.so_snapshot != null) {
+        soSnapshot = Channel.fromPath(params.so_snapshot)
+    } else {
+        soSnapshot = fetchSoSnapshot()
+    }
+
     // Functional consequences
-    runSnpIndel(clinvarXml)
-    runRepeat(clinvarXml)
-    runStructural(clinvarXml)
+    runSnpIndel(scanClinvar.out.vepVariants)
+    runRepeat(scanClinvar.out.repeatCandidates)
+    runStructural(scanClinvar.out.structuralVariants)
     combineConsequences(runSnpIndel.out.consequencesSnp,
                         runRepeat.out.consequencesRepeat,
                         runStructural.out.consequencesStructural)
@@ -58,25 +93,39 @@ workflow {
     if (params.schema != null) {
         // Open Targets evidence string output
         downloadJsonSchema()
-        // Get start/end indices to break XML into chunks
+        // Get start/end indices to break XML into chunks, by scanning the XML for record boundaries without parsing it
         countClinvarRecords(clinvarXml)
-        .map { strN ->
-            n = Integer.parseInt(strN.trim())
-            step = (Integer)Math.ceil(n / numChunks)
-            startIndices = (0..n-1).step(step)
-            endIndices = startIndices[1..-1] + [n]
-            [startIndices, endIndices].transpose()
+        countClinvarRecords.out.chunks
+        .map { chunksFile ->
+            chunksFile.readLines().collect { line ->
+                fields = line.split('\t')
+                [Integer.parseInt(fields[0]), Integer.parseInt(fields[1])]
+            }
         }
         .set { startEndPairs }
+        // Index the XML once so that each chunk can skip directly to its start
+        indexClinvar(clinvarXml)
+        // Trait mappings, consequences and schema prepared once in a lookup bundle, which every chunk loads quickly
+        buildLookupBundle(combineConsequences.out.consequencesCombined,
+                          downloadJsonSchema.out.jsonSchema)
+        // Evidence of records which did not change since the previous run is reused rather than generated again
+        if (params.previous_evidence_state != null) {
+            previousEvidenceState = file(params.previous_evidence_state)
+        } else {
+            // Nextflow needs a path-like dummy input here
+            previousEvidenceState = file("empty_state")
+        }
         // Generate evidence for each chunk and concatenate
         generateEvidence(clinvarXml,
-                         downloadJsonSchema.out.jsonSchema,
-                         combineConsequences.out.consequencesCombined,
+                         indexClinvar.out.clinvarIndex,
+                         buildLookupBundle.out.lookupBundle,
+                         soSnapshot,
+                         previousEvidenceState,
                          startEndPairs.collect())
         collectEvidenceStrings(generateEvidence.out.evidenceStrings.collect())
-        collectCounts(generateEvidence.out.countsYml.collect())
-        checkDuplicates(collectEvidenceStrings.out.evidenceStrings)
-        convertXrefs(clinvarXml)
+        collectEvidenceState(generateEvidence.out.evidenceState.collect())
+        collectCounts(generateEvidence.out.countsYml.collect(),
+                      generateEvidence.out.evidenceStringKeys.collect())
 
     } else {
         // Annotated ClinVar XML output
@@ -90,7 +139,8 @@ workflow {
             evalXrefMapping = file("empty2")
             evalLatest = file("empty3")
         }
-        generateAnnotatedXml(clinvarXml, combineConsequences.out.consequencesCombined, evalGeneMapping, evalXrefMapping, evalLatest)
+        generateAnnotatedXml(clinvarXml, combineConsequences.out.consequencesCombined, soSnapshot,
+                             evalGeneMapping, evalXrefMapping, evalLatest)
     }
 }
 
@@ -127,6 +177,39 @@ process downloadJsonSchema {
     """
 }
 
+/*
+ * Parse ClinVar once and extract everything needed by the consequence prediction steps, as well as the MedGen and
+ * OMIM cross-references in ZOOMA format.
+ */
+process scanClinvar {
+    clusterOptions "-o ${batchRoot}/logs/scan_clinvar.out \
+                    -e ${batchRoot}/logs/scan_clinvar.err"
+
+    publishDir "${batchRoot}/clinvar",
+        overwrite: true,
+        mode: "copy",
+        pattern: "*.txt"
+
+    input:
+    path clinvarXml
+
+    output:
+    path "vep_variants", emit: vepVariants
+    path "repeat_candidates.tsv", emit: repeatCandidates
+    path "structural_variants", emit: structuralVariants
+    path "clinvar_xrefs.txt", emit: clinvarXrefs
+
+    script:
+    """
+    \${PYTHON_BIN} ${codeRoot}/bin/scan_clinvar.py \
+        --clinvar-xml ${clinvarXml} \
+        --output-vep-variants vep_variants \
+        --output-repeat-candidates repeat_candidates.tsv \
+        --output-structural-variants structural_variants \
+        --output-zooma-feedback clinvar_xrefs.txt
+    """
+}
+
 /*
  * Run simple variants (SNPs and other variants with complete coordinates) through VEP and map them
  * to genes and functional consequences.
@@ -141,23 +224,20 @@ process runSnpIndel {
         pattern: "*.tsv"
 
     input:
-    path clinvarXml
+    path vepVariants
 
     output:
     path "consequences_snp.tsv", emit: consequencesSnp
+    path "vep_rejects_snp.tsv"
 
     script:
     """
-    \${PYTHON_BIN} "${codeRoot}/bin/consequence_prediction/extract_variants_for_vep.py" --clinvar-xml ${clinvarXml} \
-    | sort -u \
-    | parallel \
-        --halt now,fail=1    `# If any job fails, kill the remaining ones immediately and report failure` \
-        --pipe               `# Input is read from STDIN and split by chunks`                             \
-        -j 20                `# Number of concurrent workers`                                             \
-        -N 200               `# Number of records (lines) per worker`                                     \
-        --tmpdir .           `# Store temporary files in the current directory to avoid /tmp overflow`    \
-        \${PYTHON_BIN} "${codeRoot}/cmat/consequence_prediction/snp_indel_variants/pipeline.py" \
-            ${includeTranscriptsFlag} \
+    sort -u ${vepVariants} \
+    | \${PYTHON_BIN} "${codeRoot}/cmat/consequence_prediction/snp_indel_variants/pipeline.py" \
+        ${includeTranscriptsFlag} \
+        ${vepCacheFlag} \
+        ${localVepFlag} \
+        --vep-rejects vep_rejects_snp.tsv \
     | sort -u > consequences_snp.tsv
     """
 }
@@ -175,7 +255,7 @@ process runRepeat {
        pattern: "*.tsv"
 
    input:
-   path clinvarXml
+   path repeatCandidates
 
    output:
    path "consequences_repeat.tsv", emit: consequencesRepeat
@@ -183,7 +263,7 @@ process runRepeat {
    script:
    """
    \${PYTHON_BIN} ${codeRoot}/bin/consequence_prediction/run_repeat_expansion_variants.py \
-        --clinvar-xml ${clinvarXml} \
+        --clinvar-candidates ${repeatCandidates} \
         ${includeTranscriptsFlag} \
         --output-consequences consequences_repeat.tsv
 
@@ -206,16 +286,21 @@ process runStructural {
        pattern: "*.tsv"
 
    input:
-   path clinvarXml
+   path structuralVariants
 
    output:
    path "consequences_structural.tsv", emit: consequencesStructural
+   path "vep_rejects_structural.tsv"
 
    script:
    """
    \${PYTHON_BIN} ${codeRoot}/bin/consequence_prediction/run_structural_variants.py \
-        --clinvar-xml ${clinvarXml} \
+        --vep-variants ${structuralVariants} \
         ${includeTranscriptsFlag} \
+        ${vepCacheFlag} \
+        ${localVepFlag} \
+        ${geneModelsFlag} \
+        --vep-rejects vep_rejects_structural.tsv \
         --output-consequences consequences_structural.tsv
 
     # create an empty file if nothing generated
@@ -223,6 +308,22 @@ process runStructural {
    """
 }
 
+/*
+ * Fetch the snapshot of SO accessions and consequence severity ranking used when generating the outputs.
+ */
+process fetchSoSnapshot {
+    label 'short_time'
+    label 'small_mem'
+
+    output:
+    path "so_snapshot.json", emit: soSnapshot
+
+    script:
+    """
+    \${PYTHON_BIN} ${codeRoot}/bin/refresh_so_snapshot.py --output so_snapshot.json
+    """
+}
+
 /*
  * Unite results of consequence mapping.
  */
@@ -310,6 +411,7 @@ process generateAnnotatedXml {
     input:
     path clinvarXml
     path consequenceMappings
+    path soSnapshot
     path evalGeneMapping
     path evalXrefMapping
     path evalLatest
@@ -322,7 +424,7 @@ process generateAnnotatedXml {
     def evalXrefFlag = evalXrefMapping != file("empty2")? "--eval-xref-file ${evalXrefMapping}" : ""
     def evalLatestFlag = evalLatest != file("empty3")? "--eval-latest-file ${evalLatest}" : ""
     """
-    \${PYTHON_BIN} ${codeRoot}/bin/generate_annotated_xml.py \
+    CMAT_SO_SNAPSHOT=${soSnapshot} \${PYTHON_BIN} ${codeRoot}/bin/generate_annotated_xml.py \
         --clinvar-xml ${clinvarXml} \
         --trait-mapping ${params.mappings} \
         --gene-mapping ${consequenceMappings} \
@@ -332,20 +434,67 @@ process generateAnnotatedXml {
 }
 
 /*
- * Count number of RCV records in ClinVar.
+ * Count the records in ClinVar and split them into chunks for evidence generation, scanning the XML without parsing it.
  */
 process countClinvarRecords {
+    label 'short_time'
     label 'small_mem'
 
     input:
     path clinvarXml
 
     output:
-    stdout emit: count
+    path "chunks.tsv", emit: chunks
 
     script:
     """
-    \${PYTHON_BIN} ${codeRoot}/bin/count_clinvar_rcvs.py --clinvar-xml ${clinvarXml}
+    \${PYTHON_BIN} ${codeRoot}/bin/count_clinvar_rcvs.py \
+        --clinvar-xml ${clinvarXml} \
+        --num-chunks ${numChunks} \
+        --output-chunks chunks.tsv
+    """
+}
+
+/*
+ * Build a byte-offset index of ClinVarSet records in ClinVar.
+ */
+process indexClinvar {
+    label 'small_mem'
+
+    input:
+    path clinvarXml
+
+    output:
+    path "clinvar.cvsidx", emit: clinvarIndex
+
+    script:
+    """
+    \${PYTHON_BIN} ${codeRoot}/bin/index_clinvar_xml.py --clinvar-xml ${clinvarXml} --output-index clinvar.cvsidx
+    """
+}
+
+/*
+ * Prepare the trait mappings, consequences and schema used by evidence generation in a lookup bundle. The consequences
+ * are stored sorted, so that the chunks can read them without loading them all into memory.
+ */
+process buildLookupBundle {
+    label 'short_time'
+    label 'small_mem'
+
+    input:
+    path consequencesCombined
+    path jsonSchema
+
+    output:
+    path "lookup_bundle.bin", emit: lookupBundle
+
+    script:
+    """
+    \${PYTHON_BIN} ${codeRoot}/bin/build_lookup_bundle.py \
+        --efo-mapping ${params.mappings} \
+        --gene-mapping ${consequencesCombined} \
+        --ot-schema ${jsonSchema} \
+        --output-bundle lookup_bundle.bin
     """
 }
 
@@ -358,24 +507,33 @@ process generateEvidence {
 
     input:
     path clinvarXml
-    path jsonSchema
-    path consequenceMappings
+    path clinvarIndex
+    path lookupBundle
+    path soSnapshot
+    path previousEvidenceState
     each startEnd
 
     output:
-    path "evidence_strings.json", emit: evidenceStrings
+    path "${evidenceStringsFile}", emit: evidenceStrings
     path "counts.yml", emit: countsYml
+    path "evidence_string_keys.bin", emit: evidenceStringKeys
+    path "evidence_state.bin", emit: evidenceState
 
     script:
+    def previousStateFlag = previousEvidenceState != file("empty_state")?
+        "--previous-state ${previousEvidenceState}" : ""
     """
-    \${PYTHON_BIN} ${codeRoot}/bin/evidence_string_generation.py \
+    CMAT_SO_SNAPSHOT=${soSnapshot} \${PYTHON_BIN} ${codeRoot}/bin/evidence_string_generation.py \
         --clinvar-xml ${clinvarXml} \
-        --efo-mapping ${params.mappings} \
-        --gene-mapping ${consequenceMappings} \
-        --ot-schema ${jsonSchema} \
+        --lookup-bundle ${lookupBundle} \
         --out . \
+        --clinvar-index ${clinvarIndex} \
         --start ${startEnd[0]} \
-        --end ${startEnd[1]}
+        --end ${startEnd[1]} \
+        ${fullValidationFlag} \
+        ${compressionFlag} \
+        ${previousStateFlag} \
+        --write-state
     """
 }
 
@@ -389,86 +547,70 @@ process collectEvidenceStrings {
     publishDir "${batchRoot}/evidence_strings",
         overwrite: true,
         mode: "copy",
-        pattern: "*.json"
+        pattern: "evidence_strings.json*"
 
     input:
-    path "evidence_strings_*.json"
+    path "evidence_strings_*"
 
     output:
-    path "evidence_strings.json", emit: evidenceStrings
+    path "${evidenceStringsFile}", emit: evidenceStrings
 
     script:
     """
-    cat evidence_strings_*.json >> evidence_strings.json
+    cat evidence_strings_* >> ${evidenceStringsFile}
     """
 }
 
 /*
- * Aggregate counts into a single file and print the report.
+ * Concatenate the evidence states of all chunks into the state of the run, which can be used as the previous state of
+ * the next one.
  */
-process collectCounts {
+process collectEvidenceState {
     label 'short_time'
     label 'small_mem'
-    clusterOptions "-o ${batchRoot}/logs/collect_counts.out \
-                    -e ${batchRoot}/logs/collect_counts.err"
 
-    publishDir "${batchRoot}/logs",
+    publishDir "${batchRoot}/evidence_strings",
         overwrite: true,
         mode: "copy",
-        pattern: "*.yml"
+        pattern: "evidence_state.bin"
 
     input:
-    path "counts_*.yml"
+    path "evidence_state_*"
 
     output:
-    path "counts.yml", emit: countsYml
+    path "evidence_state.bin", emit: evidenceState
 
     script:
     """
-    \${PYTHON_BIN} ${codeRoot}/bin/aggregate_counts.py --counts-yml counts_*.yml
+    cat evidence_state_* > evidence_state.bin
     """
 }
 
 /*
- * Check that the generated evidence strings do not contain any duplicated evidence strings.
+ * Aggregate counts into a single file and print the report. Also checks that there are no duplicated evidence strings,
+ * both within and between the chunks.
  */
-process checkDuplicates {
+process collectCounts {
     label 'short_time'
     label 'small_mem'
+    clusterOptions "-o ${batchRoot}/logs/collect_counts.out \
+                    -e ${batchRoot}/logs/collect_counts.err"
 
-    input:
-    path evidenceStrings
-
-    script:
-    """
-    jq --arg sep \$'\t' -jr \
-        '.datatypeId,\$sep,.studyId,\$sep,.targetFromSourceId,\$sep,.variantId,\$sep,.variantFunctionalConsequenceId,\$sep,.diseaseFromSourceMappedId,\$sep,.diseaseFromSource,"\n"' \
-        ${evidenceStrings} | sort | uniq -d > duplicates.tsv
-    [[ ! -s duplicates.tsv ]]
-    """
-}
-
-/*
- * Convert MedGen and OMIM cross-references into ZOOMA format.
- */
-process convertXrefs {
-    clusterOptions "-o ${batchRoot}/logs/traits_to_zooma_format.out \
-                    -e ${batchRoot}/logs/traits_to_zooma_format.err"
-
-    publishDir "${batchRoot}/clinvar",
+    publishDir "${batchRoot}/logs",
         overwrite: true,
         mode: "copy",
-        pattern: "*.txt"
+        pattern: "*.yml"
 
     input:
-    path clinvarXml
+    path "counts_*.yml"
+    path "evidence_string_keys_*.bin"
 
     output:
-    path "clinvar_xrefs.txt", emit: clinvarXrefs
+    path "counts.yml", emit: countsYml
 
+    script:
     """
-    \${PYTHON_BIN} ${codeRoot}/bin/traits_to_zooma_format.py \
-        --clinvar-xml ${clinvarXml} \
-        --zooma-feedback clinvar_xrefs.txt
+    \${PYTHON_BIN} ${codeRoot}/bin/aggregate_counts.py --counts-yml counts_*.yml \
+        --evidence-string-keys evidence_string_keys_*.bin
     """
 }
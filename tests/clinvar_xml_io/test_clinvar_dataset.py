@@ -1,6 +1,7 @@
 import os
 
 from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io.scan import RecordConsumer, CountConsumer
 
 
 resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
@@ -18,3 +19,51 @@ def test_dataset_write():
 
     if os.path.exists(output_file):
         os.remove(output_file)
+
+
+def get_accession(record):
+    return record.accession
+
+
+def get_rcv_accession(clinvar_set):
+    return clinvar_set.rcv.accession
+
+
+def test_parallel_iteration(monkeypatch):
+    # Use small shards so that records are split between several tasks
+    monkeypatch.setattr('cmat.clinvar_xml_io.clinvar_dataset.RECORDS_PER_SHARD', 2)
+    input_file = os.path.join(resources_dir, 'multiple_records.xml.gz')
+    dataset = ClinVarDataset(input_file)
+    serial_accessions = [record.accession for record in dataset]
+
+    parallel_dataset = ClinVarDataset(input_file, parallel=2)
+    assert [record.accession for record in parallel_dataset] == serial_accessions
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs(parallel=2)] == serial_accessions
+    assert list(dataset.iter_rcvs(parallel=2, map_func=get_accession)) == serial_accessions
+    assert list(dataset.iter_cvs(start=2, end=9, parallel=3, map_func=get_rcv_accession)) == serial_accessions[2:9]
+    assert sorted(dataset.iter_cvs(parallel=3, map_func=get_rcv_accession, ordered=False)) == sorted(serial_accessions)
+
+
+class AccessionConsumer(RecordConsumer):
+    def __init__(self):
+        self.accessions = []
+        self.finished = False
+
+    def consume(self, record):
+        self.accessions.append(record.accession)
+
+    def finish(self):
+        self.finished = True
+
+
+def test_scan(tmp_path):
+    input_file = os.path.join(resources_dir, 'multiple_records.xml.gz')
+    count_file = str(tmp_path / 'count')
+    dataset = ClinVarDataset(input_file)
+    accession_consumer = AccessionConsumer()
+    count_consumer = CountConsumer(count_file)
+    assert dataset.scan([accession_consumer, count_consumer]) == 12
+    assert accession_consumer.finished
+    assert accession_consumer.accessions == [record.accession for record in dataset]
+    assert count_consumer.count == 12
+    assert open(count_file).read() == '12\n'
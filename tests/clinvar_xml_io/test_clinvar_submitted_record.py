@@ -26,6 +26,13 @@ def test_clinvar_set(clinvar_set):
     assert clinvar_set.status == 'current'
 
 
+def test_clinvar_set_submission_names(clinvar_set):
+    assert clinvar_set.submission_names == [None, 'MENDELICS_CLINVAR_020', None, 'SUB7495291', 'SUB13856327']
+    # Submitted records are not constructed to get their submission names
+    assert 'scvs' not in clinvar_set.__dict__
+    assert clinvar_set.submission_names == [scv.submission_name for scv in clinvar_set.scvs]
+
+
 def test_clinvar_submitted_record(submitted_record):
     assert submitted_record.submitter == 'OMIM'
     assert submitted_record.submitter_id == '3'
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io.hgvs_variant import HgvsVariant
+
+pytest.importorskip('pyarrow')
+from cmat.clinvar_xml_io.columnar import export_to_parquet, ColumnarClinVarDataset, open_dataset
+
+resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+resource_files = ['clinvar_dataset_v1.xml.gz', 'clinvar_dataset_v2.xml.gz', 'multiple_classifications.xml.gz',
+                  'multiple_records.xml.gz']
+
+record_attributes = ('accession', 'vcv_id', 'last_updated_date', 'created_date', 'mode_of_inheritance',
+                     'trait_set_type', 'evidence_support_pubmed_refs', 'allele_origins', 'valid_allele_origins',
+                     'review_status', 'score', 'clinical_significance_list', 'valid_clinical_significances')
+trait_attributes = ('identifier', 'all_names', 'all_valid_names', 'preferred_name', 'preferred_or_other_valid_name',
+                    'pubmed_refs', 'xrefs', 'medgen_id', 'current_efo_aligned_xrefs')
+measure_attributes = ('all_names', 'preferred_name', 'preferred_or_other_name', 'preferred_gene_symbols', 'hgnc_ids',
+                      'rs_id', 'nsv_id', 'existing_so_terms', 'all_hgvs', 'current_hgvs', 'genomic_hgvs',
+                      'toplevel_refseq_hgvs', 'preferred_current_hgvs', 'variant_type', 'microsatellite_category',
+                      'is_repeat_expansion_variant', 'pubmed_refs', 'chr', 'vcf_pos', 'vcf_ref', 'vcf_alt',
+                      'vcf_full_coords', 'explicit_insertion_length')
+
+
+def get_value(obj, attr):
+    try:
+        value = getattr(obj, attr)
+    except Exception as e:
+        return type(e).__name__
+    if isinstance(value, HgvsVariant):
+        return value.text
+    if isinstance(value, (set, list)):
+        return sorted(v.text if isinstance(v, HgvsVariant) else str(v) for v in value)
+    return value
+
+
+def summarise(clinvar_set):
+    record = clinvar_set.rcv
+    return {
+        'set': (clinvar_set.id, clinvar_set.title, clinvar_set.status),
+        'record': {attr: get_value(record, attr) for attr in record_attributes},
+        'classifications': [(c.type, c.review_status, get_value(c, 'clinical_significance_list'))
+                            for c in record.clinical_classifications],
+        'traits': [{attr: get_value(trait, attr) for attr in trait_attributes} for trait in record.traits],
+        'measure': {attr: get_value(record.measure, attr) for attr in measure_attributes} if record.measure else None,
+        'submission_names': [scv.submission_name for scv in clinvar_set.scvs],
+    }
+
+
+@pytest.mark.parametrize('resource_file', resource_files)
+def test_columnar_parity(resource_file, tmp_path):
+    input_file = os.path.join(resources_dir, resource_file)
+    parquet_file = str(tmp_path / 'clinvar.parquet')
+    xml_dataset = ClinVarDataset(input_file)
+    assert export_to_parquet(input_file, parquet_file) > 0
+
+    columnar_dataset = ColumnarClinVarDataset(parquet_file)
+    assert columnar_dataset.xsd_version == xml_dataset.xsd_version
+    assert len(columnar_dataset) == sum(1 for _ in xml_dataset)
+    assert [summarise(cvs) for cvs in columnar_dataset.iter_cvs()] == [summarise(cvs) for cvs in xml_dataset.iter_cvs()]
+
+
+def test_selected_columns(tmp_path):
+    input_file = os.path.join(resources_dir, 'multiple_records.xml.gz')
+    parquet_file = str(tmp_path / 'clinvar.parquet')
+    export_to_parquet(input_file, parquet_file)
+    dataset = open_dataset(parquet_file, columns=['accession', 'vcv_id', 'measure'])
+    assert isinstance(dataset, ColumnarClinVarDataset)
+    records = list(dataset.iter_cvs(start=1, end=3))
+    assert [cvs.rcv.accession for cvs in records] == [r.accession for r in ClinVarDataset(input_file)][1:3]
+    assert records[0].rcv.measure.has_complete_coordinates
+    with pytest.raises(KeyError):
+        records[0].rcv.traits
+    assert isinstance(open_dataset(input_file), ClinVarDataset)
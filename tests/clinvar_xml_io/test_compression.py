@@ -0,0 +1,57 @@
+import gzip
+import os
+
+import pytest
+
+from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io import compression
+from cmat.clinvar_xml_io.compression import detect_format, open_decompressed, recompress, BGZF_FORMAT, GZIP_FORMAT, \
+    ZSTD_FORMAT
+from cmat.clinvar_xml_io.xml_index import build_index, count_records
+
+resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+input_file = os.path.join(resources_dir, 'multiple_records.xml.gz')
+
+
+@pytest.fixture
+def bgzf_file(tmp_path, monkeypatch):
+    # Use small tasks, so that the data is split between several threads
+    monkeypatch.setattr(compression, 'BGZF_BLOCKS_PER_TASK', 1)
+    output_file = str(tmp_path / 'clinvar.xml.bgz')
+    recompress(input_file, output_file, BGZF_FORMAT, threads=3)
+    return output_file
+
+
+def get_accessions(clinvar_xml, **kwargs):
+    return [clinvar_set.rcv.accession for clinvar_set in ClinVarDataset(clinvar_xml, **kwargs).iter_cvs()]
+
+
+def test_bgzf(bgzf_file):
+    assert detect_format(input_file) == GZIP_FORMAT
+    assert detect_format(bgzf_file) == BGZF_FORMAT
+    data = gzip.open(input_file, 'rb').read()
+    # BGZF files can be read by any gzip reader, as well as in parallel
+    assert gzip.open(bgzf_file, 'rb').read() == data
+    for threads in (1, 3):
+        with open_decompressed(bgzf_file, threads) as fh:
+            assert fh.read() == data
+    assert get_accessions(bgzf_file) == get_accessions(input_file)
+    assert count_records(bgzf_file) == 12
+
+
+def test_bgzf_index(bgzf_file, tmp_path):
+    index_file = str(tmp_path / 'clinvar.cvsidx')
+    build_index(bgzf_file, index_file)
+    all_accessions = get_accessions(input_file)
+    dataset = ClinVarDataset(bgzf_file, index_file=index_file)
+    assert len(dataset.index.member_compressed_offsets) > 1
+    assert [clinvar_set.rcv.accession for clinvar_set in dataset.iter_cvs(start=5, end=8)] == all_accessions[5:8]
+
+
+def test_zstd(tmp_path):
+    pytest.importorskip('zstandard')
+    output_file = str(tmp_path / 'clinvar.xml.zst')
+    recompress(input_file, output_file, ZSTD_FORMAT)
+    assert detect_format(output_file) == ZSTD_FORMAT
+    assert get_accessions(output_file) == get_accessions(input_file)
+    assert get_accessions(output_file, parallel=2) == get_accessions(input_file)
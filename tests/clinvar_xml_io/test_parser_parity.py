@@ -0,0 +1,112 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pytest
+
+from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io import xml_parsing
+from cmat.clinvar_xml_io.hgvs_variant import HgvsVariant
+
+pytest.importorskip('lxml')
+
+resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+resource_files = ['clinvar_dataset_v1.xml.gz', 'clinvar_dataset_v2.xml.gz', 'multiple_classifications.xml.gz',
+                  'multiple_records.xml.gz']
+
+
+def get_value(obj, attr):
+    """Returns a comparable representation of an attribute, including any exception raised while computing it."""
+    try:
+        value = getattr(obj, attr)
+    except Exception as e:
+        return type(e).__name__
+    if isinstance(value, (set, list)):
+        return sorted(to_comparable(v) for v in value)
+    return to_comparable(value)
+
+
+def to_comparable(value):
+    if hasattr(value, 'tag'):
+        return str((value.tag, value.text, dict(value.attrib)))
+    if isinstance(value, HgvsVariant):
+        return value.text
+    return str(value) if value is not None else None
+
+
+def summarise_record(record):
+    summary = {attr: get_value(record, attr) for attr in (
+        'accession', 'vcv_id', 'last_updated_date', 'created_date', 'mode_of_inheritance', 'trait_set_type',
+        'evidence_support_pubmed_refs', 'allele_origins', 'valid_allele_origins', 'review_status', 'score',
+        'last_evaluated_date', 'clinical_significance_list', 'valid_clinical_significances')}
+    summary['traits'] = [{attr: get_value(trait, attr) for attr in (
+        'identifier', 'all_names', 'all_valid_names', 'preferred_name', 'preferred_or_other_valid_name', 'pubmed_refs',
+        'xrefs', 'medgen_id', 'current_efo_aligned_xrefs')} for trait in record.traits]
+    if record.measure:
+        summary['measure'] = {attr: get_value(record.measure, attr) for attr in (
+            'all_names', 'preferred_name', 'preferred_gene_symbols', 'hgnc_ids', 'rs_id', 'nsv_id', 'existing_so_terms',
+            'all_hgvs', 'current_hgvs', 'genomic_hgvs', 'toplevel_refseq_hgvs', 'preferred_current_hgvs',
+            'variant_type', 'microsatellite_category', 'pubmed_refs', 'chr', 'vcf_pos', 'vcf_ref', 'vcf_alt',
+            'vcf_full_coords')}
+    return summary
+
+
+def summarise_dataset(input_file):
+    summaries = []
+    for clinvar_set in ClinVarDataset(input_file).iter_cvs():
+        summary = summarise_record(clinvar_set.rcv)
+        summary['set'] = (clinvar_set.id, clinvar_set.title, clinvar_set.status)
+        summary['scvs'] = [
+            {attr: get_value(scv, attr) for attr in ('accession', 'submission_name', 'submitter', 'submitter_id',
+                                                     'submission_date', 'created_date', 'last_updated_date')}
+            for scv in clinvar_set.scvs
+        ]
+        output = io.BytesIO()
+        clinvar_set.rcv.write(output)
+        summary['output'] = output.getvalue()
+        summaries.append(summary)
+    return summaries
+
+
+@pytest.fixture
+def use_lxml():
+    xml_parsing.set_xml_parser(xml_parsing.LXML_PARSER)
+    yield
+    xml_parsing.set_xml_parser(xml_parsing.ETREE_PARSER)
+
+
+@pytest.mark.parametrize('resource_file', resource_files)
+def test_lxml_parity(resource_file, use_lxml):
+    input_file = os.path.join(resources_dir, resource_file)
+    lxml_summaries = summarise_dataset(input_file)
+    xml_parsing.set_xml_parser(xml_parsing.ETREE_PARSER)
+    etree_summaries = summarise_dataset(input_file)
+    assert len(etree_summaries) > 0
+    assert lxml_summaries == etree_summaries
+
+
+def test_lxml_elements(use_lxml):
+    input_file = os.path.join(resources_dir, 'clinvar_dataset_v2.xml.gz')
+    record = next(iter(ClinVarDataset(input_file)))
+    assert xml_parsing.is_lxml_element(record.record_xml)
+
+
+def is_lxml_record(record):
+    return xml_parsing.is_lxml_element(record.record_xml)
+
+
+def test_lxml_in_spawned_workers(use_lxml, monkeypatch):
+    # Spawned workers start from a fresh interpreter, where the parser backend would default to ElementTree
+    monkeypatch.setattr('cmat.clinvar_xml_io.parallel.ProcessPoolExecutor',
+                        partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')))
+    input_file = os.path.join(resources_dir, 'multiple_records.xml.gz')
+    results = list(ClinVarDataset(input_file).iter_rcvs(parallel=2, map_func=is_lxml_record))
+    assert len(results) > 0
+    assert all(results)
+
+
+def test_unknown_parser():
+    with pytest.raises(ValueError):
+        xml_parsing.get_xml_parser('unknown')
@@ -0,0 +1,94 @@
+import gzip
+import os
+
+from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.clinvar_xml_io.xml_index import build_index, ClinVarIndex, iterate_cvs_offsets, iterate_cvs_boundaries, \
+    count_records, get_chunk_boundaries
+
+
+resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+input_file = os.path.join(resources_dir, 'multiple_records.xml.gz')
+
+
+def get_all_accessions():
+    return [clinvar_set.rcv.accession for clinvar_set in ClinVarDataset(input_file).iter_cvs()]
+
+
+def write_multi_member_copy(output_file, member_size):
+    """Recompress the input file as a sequence of independent gzip members of a given (decompressed) size."""
+    data = gzip.open(input_file, 'rb').read()
+    with open(output_file, 'wb') as f:
+        for i in range(0, len(data), member_size):
+            f.write(gzip.compress(data[i:i + member_size]))
+
+
+def test_iterate_cvs_offsets():
+    data = gzip.open(input_file, 'rb').read()
+    # Feed the data in small chunks, so that tags are split across chunk boundaries
+    chunks = iter([data[i:i + 7] for i in range(0, len(data), 7)] + [b''])
+    offsets = list(iterate_cvs_offsets(lambda: next(chunks)))
+    assert [accession for _, accession in offsets] == get_all_accessions()
+    for offset, _ in offsets:
+        assert data[offset:offset + len(b'<ClinVarSet ')] == b'<ClinVarSet '
+
+
+def test_iterate_cvs_boundaries():
+    data = gzip.open(input_file, 'rb').read()
+    expected = [offset for offset, _ in iterate_cvs_offsets(iter([data, b'']).__next__)]
+    for chunk_size in (1, 7, 11, len(data)):
+        chunks = iter([data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] + [b''])
+        assert list(iterate_cvs_boundaries(lambda: next(chunks))) == expected
+
+
+def test_get_chunk_boundaries():
+    assert get_chunk_boundaries(10, 3) == [(0, 4), (4, 8), (8, 10)]
+    assert get_chunk_boundaries(2, 10) == [(0, 1), (1, 2)]
+    assert get_chunk_boundaries(0, 10) == []
+
+
+def test_count_records():
+    assert count_records(input_file) == 12
+
+
+def test_build_index(tmp_path):
+    index_file = str(tmp_path / 'test.cvsidx')
+    assert build_index(input_file, index_file) == 12
+    index = ClinVarIndex(index_file)
+    assert len(index) == 12
+    assert index.accessions == get_all_accessions()
+    assert index.record_number('RCV000000950') == 1
+    assert index.record_number('RCV999999999') is None
+    assert index.matches(input_file)
+    assert index.member_compressed_offsets == [0]
+
+
+def test_dataset_iter_range_with_index(tmp_path):
+    index_file = str(tmp_path / 'test.cvsidx')
+    build_index(input_file, index_file)
+    all_accessions = get_all_accessions()
+    dataset = ClinVarDataset(input_file, index_file=index_file)
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs()] == all_accessions
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs(start=5)] == all_accessions[5:]
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs(start=3, end=7)] == all_accessions[3:7]
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs(start=12)] == []
+    assert dataset.record_number(all_accessions[4]) == 4
+
+
+def test_dataset_iter_range_without_index():
+    all_accessions = get_all_accessions()
+    dataset = ClinVarDataset(input_file)
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs(start=3, end=7)] == all_accessions[3:7]
+    assert dataset.record_number(all_accessions[4]) == 4
+
+
+def test_multi_member_index(tmp_path):
+    multi_member_file = str(tmp_path / 'multi_member.xml.gz')
+    write_multi_member_copy(multi_member_file, member_size=10000)
+    index_file = str(tmp_path / 'multi_member.cvsidx')
+    build_index(multi_member_file, index_file)
+    index = ClinVarIndex(index_file)
+    assert len(index.member_compressed_offsets) > 10
+
+    all_accessions = get_all_accessions()
+    dataset = ClinVarDataset(multi_member_file, index_file=index_file)
+    assert [cvs.rcv.accession for cvs in dataset.iter_cvs(start=8, end=11)] == all_accessions[8:11]
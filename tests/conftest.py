@@ -0,0 +1,5 @@
+import os
+
+# Tests use the SO snapshot bundled with the package, rather than one created from the current OLS and Ensembl data
+os.environ['CMAT_SO_SNAPSHOT'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cmat', 'output_generation',
+                                              'so_snapshot.json')
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+from cmat.consequence_prediction.common.local_vep import LocalVepClient, get_cache_release
+from cmat.consequence_prediction.common.vep_cache import VepCache
+
+# Stand-in for VEP, which outputs one consequence for each input variant, and records the options it was run with
+FAKE_VEP = '''#!{python}
+import json
+import sys
+with open({options_file!r}, 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+for line in sys.stdin:
+    gene_id = 'ENSG00000120539' if line.startswith('10 ') else 'ENSG00000107897'
+    print(json.dumps({{'input': line.rstrip('\\n'), 'transcript_consequences': [{{
+        'gene_id': gene_id, 'gene_symbol': 'GENE', 'biotype': 'protein_coding', 'transcript_id': 'ENST00000342386',
+        'consequence_terms': ['missense_variant']}}]}}))
+'''
+
+
+@pytest.fixture
+def vep_cache_dir(tmp_path):
+    for release in ('112_GRCh38', '113_GRCh38', '114_GRCh37'):
+        os.makedirs(tmp_path / 'vep_cache' / 'homo_sapiens' / release)
+    return str(tmp_path / 'vep_cache')
+
+
+@pytest.fixture
+def fake_vep(tmp_path):
+    executable = str(tmp_path / 'vep')
+    with open(executable, 'w') as f:
+        f.write(FAKE_VEP.format(python=sys.executable, options_file=str(tmp_path / 'options')))
+    os.chmod(executable, 0o755)
+    return executable
+
+
+def test_get_cache_release(vep_cache_dir, tmp_path):
+    assert get_cache_release(vep_cache_dir) == 113
+    assert get_cache_release(vep_cache_dir, 'GRCh37') == 114
+    with pytest.raises(ValueError):
+        get_cache_release(str(tmp_path))
+
+
+def test_local_vep_client(vep_cache_dir, fake_vep, tmp_path):
+    variants = ['10 27169969 . C A', '11 5226797 . G T', '10 27169970 . C G']
+    with VepCache(str(tmp_path / 'vep_results.sqlite')) as cache:
+        client = LocalVepClient(vep_cache_dir, cache=cache, executable=fake_vep)
+        batches = list(client.query_all(variants, batch_size=2))
+        assert [batch for batch, _ in batches] == [variants[:2], variants[2:]]
+        vep_results = [result for _, results in batches for result in results]
+        # Results of local VEP are cached for the release of the VEP cache
+        assert len(cache.get_many(variants, 113, 5000, 0)) == 3
+
+    # Results are in the same format as the results of VEP API
+    assert [(result['input'], result['transcript_consequences'][0]['gene_id']) for result in vep_results] == [
+        ('10 27169969 . C A', 'ENSG00000120539'), ('11 5226797 . G T', 'ENSG00000107897'),
+        ('10 27169970 . C G', 'ENSG00000120539')]
+    with open(tmp_path / 'options') as f:
+        options = f.readline().split()
+    assert options[options.index('--cache_version') + 1] == '113'
+    assert options[options.index('--distance') + 1] == '5000'
+    assert '--offline' in options
+
+
+def test_local_vep_failure(vep_cache_dir, tmp_path):
+    client = LocalVepClient(vep_cache_dir, executable='false')
+    with pytest.raises(RuntimeError):
+        list(client.query_all(['10 27169969 . C A']))
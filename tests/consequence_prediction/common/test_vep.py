@@ -1,5 +1,14 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import requests_mock
+
 from cmat.consequence_prediction.common.vep import extract_consequences, overall_most_severe_consequence, \
-    most_severe_consequence_per_gene
+    most_severe_consequence_per_gene, parse_retry_after, VepClient, VEP_REQUEST_URL
+from cmat.consequence_prediction.common.vep_cache import VepCache
 
 
 def get_vep_results():
@@ -143,3 +152,121 @@ def test_most_severe_consequence_per_gene_with_transcripts():
         ('10 27169969 . C A', 'ENSG00000107897', 'ACBD5', '3_prime_UTR_variant', 'ENST00000676731'),
         ('10 27169969 . C A', 'ENSG00000208008', 'MIR125A', 'missense_variant', 'ENST00000385273')
     ]
+
+
+def test_vep_client():
+    in_flight = []
+    max_in_flight = [0]
+    lock = threading.Lock()
+    failed_batches = set()
+
+    def vep_response(request, context):
+        variants = json.loads(request.body)['variants']
+        with lock:
+            in_flight.append(variants[0])
+            max_in_flight[0] = max(max_in_flight[0], len(in_flight))
+        # Later batches are answered sooner, and the first request for every third batch fails
+        time.sleep(0.01 * (10 - len(variants[0])))
+        with lock:
+            in_flight.remove(variants[0])
+        if len(variants[0]) % 3 == 0 and variants[0] not in failed_batches:
+            failed_batches.add(variants[0])
+            context.status_code = 500
+            return []
+        return [{'input': variant} for variant in variants]
+
+    variants = ['1' * i for i in range(1, 10) for _ in range(3)]
+    client = VepClient(concurrency=2, requests_per_second=1000, delay=0, jitter=(0, 0))
+    with requests_mock.mock() as m:
+        m.post(VEP_REQUEST_URL, json=vep_response)
+        batches = list(client.query_all(variants, batch_size=3))
+    assert [batch for batch, _ in batches] == [variants[i:i + 3] for i in range(0, len(variants), 3)]
+    assert [[result['input'] for result in results] for _, results in batches] == [batch for batch, _ in batches]
+    assert max_in_flight[0] == 2
+    assert len(failed_batches) == 3
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2') == 2
+    assert parse_retry_after('0.5') == 0.5
+    # HTTP dates in the past mean no waiting at all
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    in_an_hour = format_datetime(datetime.now(timezone.utc) + timedelta(hours=1), usegmt=True)
+    assert 3590 < parse_retry_after(in_an_hour) <= 3600
+    assert parse_retry_after('soon') is None
+
+
+def test_vep_client_retries_after_http_date():
+    responses = [
+        {'status_code': 429, 'headers': {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}, 'json': {}},
+        {'status_code': 200, 'json': [{'input': '1 1 . A G'}]},
+    ]
+    client = VepClient(requests_per_second=1000, delay=0, jitter=(0, 0))
+    with requests_mock.mock() as m:
+        m.post(VEP_REQUEST_URL, responses)
+        batches = list(client.query_all(['1 1 . A G']))
+    assert batches == [(['1 1 . A G'], [{'input': '1 1 . A G'}])]
+    assert m.call_count == 2
+
+
+def test_vep_client_stopped_early():
+    variants = [f'1 {i} . A G' for i in range(20)]
+    client = VepClient(concurrency=2, requests_per_second=1000)
+    with requests_mock.mock() as m:
+        m.post(VEP_REQUEST_URL, json=lambda request, context: [
+            {'input': variant} for variant in json.loads(request.body)['variants']])
+        batches = client.query_all(variants, batch_size=1)
+        assert next(batches) == (['1 0 . A G'], [{'input': '1 0 . A G'}])
+        # Closing the stream cancels the queued batches, and waits for them to finish cancelling
+        batches.close()
+    assert m.call_count < len(variants)
+
+
+def test_vep_client_with_cache(tmp_path):
+    queried_variants = []
+
+    def vep_response(request, context):
+        variants = json.loads(request.body)['variants']
+        queried_variants.extend(variants)
+        return [{'input': variant} for variant in variants]
+
+    with VepCache(str(tmp_path / 'vep_cache.sqlite')) as cache, requests_mock.mock() as m:
+        m.post(VEP_REQUEST_URL, json=vep_response)
+        client = VepClient(cache=cache, ensembl_release=113)
+        list(client.query_all([f'1 {i} . A G' for i in range(10)], batch_size=3))
+        queried_variants.clear()
+        batches = list(client.query_all([f'1 {i} . A G' for i in range(5, 15)], batch_size=3))
+        assert queried_variants == [f'1 {i} . A G' for i in range(10, 15)]
+        assert sorted(result['input'] for _, results in batches for result in results) == \
+            sorted(f'1 {i} . A G' for i in range(5, 15))
+        assert (cache.hits, cache.misses) == (5, 15)
+
+
+def test_vep_client_bisects_bad_requests(tmp_path):
+    bad_variants = {'1 37 . A G', '1 150 . A G'}
+    request_count = [0]
+
+    def vep_response(request, context):
+        variants = json.loads(request.body)['variants']
+        request_count[0] += 1
+        if bad_variants & set(variants):
+            context.status_code = 400
+            return {'error': 'Invalid allele'}
+        return [{'input': variant} for variant in variants]
+
+    variants = [f'1 {i} . A G' for i in range(200)]
+    client = VepClient(requests_per_second=1000, delay=0, jitter=(0, 0))
+    with requests_mock.mock() as m:
+        m.post(VEP_REQUEST_URL, json=vep_response)
+        batches = list(client.query_all(variants))
+    assert [result['input'] for _, results in batches for result in results] == \
+        [variant for variant in variants if variant not in bad_variants]
+    # Each bad variant is isolated in two requests per halving of the batch, and bad requests are not retried
+    assert request_count[0] <= 1 + 2 * 2 * 8
+    assert sorted(variant for variant, _ in client.rejected_variants) == sorted(bad_variants)
+
+    rejects_file = str(tmp_path / 'rejects.tsv')
+    client.write_rejected_variants(rejects_file)
+    with open(rejects_file) as f:
+        assert sorted(f.read().splitlines()) == [
+            '1 150 . A G\t{"error": "Invalid allele"}', '1 37 . A G\t{"error": "Invalid allele"}']
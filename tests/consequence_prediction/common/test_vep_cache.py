@@ -0,0 +1,25 @@
+from cmat.consequence_prediction.common.vep_cache import VepCache
+
+
+def test_vep_cache(tmp_path):
+    path = str(tmp_path / 'vep_cache.sqlite')
+    results = [{'input': '1 100 . A G', 'most_severe_consequence': 'missense_variant'},
+               {'input': '1 200 . C T', 'most_severe_consequence': 'intron_variant'}]
+    with VepCache(path) as cache:
+        cache.put_many(results, 112, 5000, 0)
+        cache.put_many(results[:1], 113, 5000, 0)
+
+    with VepCache(path) as cache:
+        assert len(cache) == 3
+        # Results are only returned for the same release and query parameters, regardless of whitespace
+        assert cache.get_many(['1  100 . A G', '1 200 . C T', '1 300 . G A'], 112, 5000, 0) == {
+            '1  100 . A G': results[0], '1 200 . C T': results[1]}
+        assert cache.get_many(['1 100 . A G', '1 200 . C T'], 113, 5000, 0) == {'1 100 . A G': results[0]}
+        assert cache.get_many(['1 100 . A G'], 113, 500000, 0) == {}
+        assert (cache.hits, cache.misses) == (3, 3)
+
+        assert cache.invalidate(keep_release=113) == 2
+        assert cache.get_many(['1 100 . A G', '1 200 . C T'], 112, 5000, 0) == {}
+        assert len(cache) == 1
+        assert cache.invalidate() == 1
+        assert len(cache) == 0
@@ -4,11 +4,14 @@ manually extracted from the main ClinVar XML to check specific cases."""
 import os
 import tempfile
 
+import numpy as np
 import pandas as pd
 import pytest
 
 from cmat.consequence_prediction.repeat_expansion_variants import pipeline
-from cmat.consequence_prediction.repeat_expansion_variants.pipeline import annotate_ensembl_gene_info, assert_uniqueness
+from cmat.clinvar_xml_io import ClinVarDataset
+from cmat.consequence_prediction.repeat_expansion_variants.pipeline import annotate_ensembl_gene_info, \
+    assert_uniqueness, load_clinvar_data, load_candidates, RepeatCandidateConsumer
 
 
 def get_test_resource(resource_name):
@@ -106,6 +109,22 @@ def test_missing_names_and_hgvs():
     ]
 
 
+@pytest.mark.parametrize('resource_name', ['alternatives.xml.gz', 'missing_names.xml.gz', 'no_explicit_coords.xml.gz',
+                                           'explicit_coords.xml.gz'])
+def test_candidates_round_trip(resource_name, tmp_path):
+    """Candidates written by the consumer in a shared scan must be loaded back identically to the ones parsed
+    directly."""
+    input_filename = get_test_resource(resource_name)
+    candidates_file = str(tmp_path / 'candidates.tsv')
+    ClinVarDataset(input_filename).scan([RepeatCandidateConsumer(candidates_file)])
+    variants, stats = load_clinvar_data(input_filename)
+    loaded_variants, loaded_stats = load_candidates(candidates_file)
+    assert loaded_stats == stats
+    # Missing names are None in the parsed dataframe, but are indistinguishable from NaN after writing to a file
+    variants = variants.reset_index(drop=True)
+    pd.testing.assert_frame_equal(loaded_variants, variants.where(variants.notnull(), np.nan), check_dtype=False)
+
+
 def test_assert_uniqueness():
     uniqueness_columns = ['letter', 'number']
     target_column = 'target'
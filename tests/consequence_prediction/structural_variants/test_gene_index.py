@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from cmat.consequence_prediction.structural_variants import pipeline
+from cmat.consequence_prediction.structural_variants.gene_index import GeneIntervalIndex, IntervalTree, \
+    refseq_to_chromosome, CONTAINED, COVERED, PARTIAL
+
+GTF_TRANSCRIPTS = [
+    # chromosome, start, end, gene ID, gene name, transcript biotype
+    ('16', 72054505, 72061055, 'ENSG00000257017', 'HP', 'protein_coding'),
+    ('16', 72055000, 72059000, 'ENSG00000257017', 'HP', 'retained_intron'),
+    ('16', 72063148, 72077246, 'ENSG00000261701', 'HPR', 'protein_coding'),
+    ('16', 72080000, 72090000, 'ENSG00000261701', 'HPR', 'protein_coding'),
+    ('16', 72100000, 72100080, 'ENSG00000000001', 'MIR0001', 'miRNA'),
+    ('16', 72110000, 72120000, 'ENSG00000000002', 'LNC0002', 'lncRNA'),
+    ('X', 100, 200, 'ENSG00000000003', 'GENEX', 'protein_coding'),
+]
+
+
+def write_gtf(path):
+    with open(path, 'wt') as f:
+        f.write('#!genome-build GRCh38.p14\n')
+        for chromosome, start, end, gene_id, gene_name, biotype in GTF_TRANSCRIPTS:
+            attributes = f'gene_id "{gene_id}"; gene_name "{gene_name}"; transcript_biotype "{biotype}";'
+            f.write('\t'.join([chromosome, 'ensembl', 'gene', str(start), str(end), '.', '+', '.', attributes]) + '\n')
+            f.write('\t'.join([chromosome, 'ensembl', 'transcript', str(start), str(end), '.', '+', '.', attributes])
+                    + '\n')
+
+
+def assert_overlaps_match(intervals, queries):
+    tree = IntervalTree(intervals)
+    for start, end in queries:
+        expected = [value for interval_start, interval_end, value in intervals
+                    if interval_start < end and start < interval_end]
+        assert sorted(tree.overlap(start, end)) == sorted(expected), (len(intervals), start, end)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_interval_tree(seed):
+    rng = random.Random(seed)
+    # Sizes which are not powers of two leave the right-hand subtrees incomplete
+    n = rng.choice([0, 1, 2, 3, 7, 8, 9, 31, 33, 42, 70, 100, rng.randint(500, 3000)])
+    chromosome_length = 1000
+    intervals = []
+    for i in range(n):
+        start = rng.randint(0, chromosome_length)
+        intervals.append((start, start + rng.choice([1, 5, 50, 300]), i))
+    # Queries span the whole chromosome, including its end beyond the start of the last interval
+    queries = []
+    for _ in range(50):
+        start = rng.randint(0, chromosome_length + 400)
+        queries.append((start, start + rng.choice([1, 10, 40, 300])))
+    last_start = max((start for start, _, _ in intervals), default=0)
+    queries.extend((start, start + 50) for start in range(last_start - 20, last_start + 300, 10))
+    assert_overlaps_match(intervals, queries)
+
+
+@pytest.mark.parametrize('n', (42, 74))
+def test_interval_tree_incomplete_subtree(n):
+    # The last interval is in an incomplete subtree, and is the only one overlapping queries beyond its start
+    intervals = [(i, i + 1, i) for i in range(n - 1)] + [(n - 1, n + 100, n - 1)]
+    tree = IntervalTree(intervals)
+    assert tree.overlap(n + 50, n + 51) == [n - 1]
+    assert_overlaps_match(intervals, [(start, start + 1) for start in range(n + 110)])
+
+
+def test_refseq_to_chromosome():
+    assert refseq_to_chromosome('NC_000016.10') == '16'
+    assert refseq_to_chromosome('NC_000023.11') == 'X'
+    assert refseq_to_chromosome('NC_000024.10') == 'Y'
+    assert refseq_to_chromosome('NC_012920.1') == 'MT'
+    assert refseq_to_chromosome('NG_008930.1') is None
+    assert refseq_to_chromosome('NC_000025.1') is None
+
+
+def test_gene_interval_index(tmp_path):
+    gtf_file = str(tmp_path / 'genes.gtf')
+    write_gtf(gtf_file)
+    index = GeneIntervalIndex.from_gtf(gtf_file)
+    # Only genes with protein coding or miRNA transcripts are loaded
+    assert len(index) == 4
+
+    assert index.overlapping_genes('16', 72059151, 72063259) == [
+        ('ENSG00000257017', 'HP', PARTIAL), ('ENSG00000261701', 'HPR', PARTIAL)]
+    assert index.overlapping_genes('16', 72065000, 72066000) == [('ENSG00000261701', 'HPR', CONTAINED)]
+    # Spans between transcripts of a gene do not overlap it
+    assert index.overlapping_genes('16', 72078000, 72079000) == []
+    assert index.overlapping_genes('16', 72050000, 72120000) == [
+        ('ENSG00000257017', 'HP', COVERED), ('ENSG00000261701', 'HPR', COVERED),
+        ('ENSG00000000001', 'MIR0001', COVERED)]
+    assert index.overlapping_genes('1', 72050000, 72120000) == []
+
+    assert index.annotate_vep_identifier('NC_000023.11 150 160 DEL + NC_000023.11:g.150_160del') == [
+        ('ENSG00000000003', 'GENEX', CONTAINED)]
+    assert index.annotate_vep_identifier('NW_003315950.2 150 160 DEL + NW_003315950.2:g.150_160del') is None
+
+
+def test_filter_broad_variants(tmp_path):
+    gtf_file = str(tmp_path / 'genes.gtf')
+    write_gtf(gtf_file)
+    index = GeneIntervalIndex.from_gtf(gtf_file)
+    variants = [
+        'NC_000016.10 72050000 72120000 DEL + NC_000016.10:g.72050000_72120000del',
+        'NC_000016.10 72059151 72063259 DEL + NC_000016.10:g.72059151_72063259del',
+        'NW_003315950.2 150 160 DEL + NW_003315950.2:g.150_160del',
+    ]
+    assert pipeline.filter_broad_variants(variants, index, max_genes=2) == variants[1:]
+    assert pipeline.filter_broad_variants(variants, index) == variants
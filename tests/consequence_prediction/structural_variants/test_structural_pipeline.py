@@ -1,5 +1,6 @@
 import os
 
+from cmat.clinvar_xml_io import ClinVarDataset
 from cmat.consequence_prediction.structural_variants import pipeline
 
 
@@ -50,3 +51,12 @@ def test_no_current_genomic_hgvs():
 
 def test_no_valid_precise_span():
     assert run_pipeline('no_valid_precise_span.xml.gz') == []
+
+
+def test_extracted_variants(tmp_path):
+    input_filename = get_test_resource('precise_genomic.xml.gz')
+    variants_file = str(tmp_path / 'variants')
+    ClinVarDataset(input_filename).scan([pipeline.StructuralVariantConsumer(variants_file)])
+    variants = pipeline.load_variants(variants_file)
+    assert variants == pipeline.extract_variants(input_filename)
+    assert 'NC_000011.10 5226797 5226798 INS + NC_000011.10:g.5226797_5226798insGCC' in variants
@@ -1,5 +1,6 @@
 import json
 import os
+import pickle
 
 import requests
 import xml.etree.ElementTree as ElementTree
@@ -8,6 +9,7 @@ from cmat.clinvar_xml_io import ClinVarTrait
 from cmat.output_generation import clinvar_to_evidence_strings
 from cmat.output_generation import consequence_type as CT
 from cmat.output_generation.clinvar_to_evidence_strings import MAX_TARGET_GENES
+from cmat.output_generation.ontology_mapping import OntologyMappingIndex
 
 import config
 
@@ -240,6 +242,17 @@ class TestGenerateEvidenceStringTest:
         assert 'alleleOrigins' not in evidence
         assert evidence['datasourceId'] == 'eva'
 
+    def test_evidence_string_from_template(self):
+        """Verifies that evidence strings generated using a record template are the same as without it."""
+        template = clinvar_to_evidence_strings.get_evidence_string_template(self.clinvar_record)
+        for allele_origins in (['germline'], ['somatic'], []):
+            for disease_mapped_efo_id in (self.disease_mapped_efo_id, None):
+                args = (self.clinvar_record, allele_origins, self.disease_name, self.disease_source_id,
+                        disease_mapped_efo_id, self.consequence_attributes)
+                evidence = clinvar_to_evidence_strings.generate_evidence_string(*args)
+                evidence_from_template = clinvar_to_evidence_strings.generate_evidence_string(*args, template)
+                assert json.dumps(evidence_from_template) == json.dumps(evidence)
+
 
 class TestGroupDiseasesByMappingTest:
     """Verifies behaviour of group_diseases_by_efo_mapping."""
@@ -298,3 +311,78 @@ class TestGroupDiseasesByMappingTest:
             string_to_efo_mappings=self.string_to_efo_mappings,
         )
         assert result == expected_result
+
+    def test_mapping_index(self):
+        """Grouping with an index, including memoised and unpickled ones, should be the same as with a dictionary."""
+        index = OntologyMappingIndex(self.string_to_efo_mappings)
+        assert dict(index) == self.string_to_efo_mappings
+        trait_sets = [
+            [self.get_trait('Disease B', 'MedGen_B'), self.get_trait('Disease E', 'MedGen_E'),
+             self.get_trait('DISEASE A', 'MedGen_A'), self.get_trait('Disease D', 'MedGen_D')],
+            [self.get_trait('Disease C', 'MedGen_C'), self.get_trait('Disease A', 'MedGen_A2')],
+        ]
+        for mappings in (index, index, pickle.loads(pickle.dumps(index))):
+            for traits in trait_sets:
+                assert clinvar_to_evidence_strings.group_diseases_by_efo_mapping(traits, mappings) == \
+                       clinvar_to_evidence_strings.group_diseases_by_efo_mapping(traits, self.string_to_efo_mappings)
+
+
+def test_evidence_generation_with_workers(tmp_path):
+    """Output and counts of the multi-process mode must be identical to the serial run."""
+    clinvar_xml = os.path.join(config.test_dir, '..', 'pipelines', 'resources', 'input.xml.gz')
+    # Only the output of the pipeline is compared here, so the evidence strings are not validated against a real schema
+    ot_schema = str(tmp_path / 'schema.json')
+    with open(ot_schema, 'w') as f:
+        f.write('{}')
+    outputs = []
+    for workers in (None, 2):
+        output_file = str(tmp_path / f'evidence_strings_{workers}.json')
+        report, exception_raised = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+            EFO_MAPPINGS, GENE_MAPPINGS, clinvar_xml, ot_schema, output_file, workers=workers)
+        assert not exception_raised
+        outputs.append((open(output_file).read(), report))
+    (serial_output, serial_report), (parallel_output, parallel_report) = outputs
+    assert serial_report.clinvar_total == 1236
+    assert parallel_output == serial_output
+    assert parallel_report == serial_report
+
+
+def test_incremental_evidence_generation(tmp_path, monkeypatch):
+    """Output and counts of an incremental run must be identical to a full run, and only records whose inputs changed
+    since the previous run are processed again."""
+    resources = os.path.join(config.test_dir, '..', 'pipelines', 'resources')
+    clinvar_xml = os.path.join(resources, 'input.xml.gz')
+    efo_mappings, _ = clinvar_to_evidence_strings.load_ontology_mapping(
+        os.path.join(resources, 'expected', 'trait_names_to_ontology_mappings.tsv'))
+    gene_mappings = CT.process_consequence_type_file(os.path.join(resources, 'expected', 'consequences_snp.tsv'))
+    ot_schema = str(tmp_path / 'schema.json')
+    with open(ot_schema, 'w') as f:
+        f.write('{}')
+    previous_state = str(tmp_path / 'previous_state.bin')
+    clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+        efo_mappings, gene_mappings, clinvar_xml, ot_schema, str(tmp_path / 'previous.json'),
+        output_state=previous_state)
+
+    # Consequences of one of the variants change in the next run
+    changed_variant = next(iter(gene_mappings))
+    gene_mappings[changed_variant] = [CT.ConsequenceType('ENSG00000139988', CT.SoTerm('stop_gained'))]
+    full_output_file = str(tmp_path / 'full.json')
+    full_report, _ = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+        efo_mappings, gene_mappings, clinvar_xml, ot_schema, full_output_file)
+
+    process_clinvar_set = clinvar_to_evidence_strings.process_clinvar_set
+    processed_records = []
+    monkeypatch.setattr(clinvar_to_evidence_strings, 'process_clinvar_set',
+                        lambda clinvar_set, *args: processed_records.append(clinvar_set.rcv.accession) or
+                        process_clinvar_set(clinvar_set, *args))
+    for workers in (None, 2):
+        processed_records.clear()
+        output_file = str(tmp_path / f'incremental_{workers}.json')
+        report, exception_raised = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+            efo_mappings, gene_mappings, clinvar_xml, ot_schema, output_file, workers=workers,
+            previous_state=previous_state, output_state=str(tmp_path / f'state_{workers}.bin'))
+        assert not exception_raised
+        assert open(output_file).read() == open(full_output_file).read()
+        assert report == full_report
+        if workers is None:
+            assert 0 < len(processed_records) < full_report.clinvar_total
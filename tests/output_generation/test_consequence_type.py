@@ -1,5 +1,9 @@
+import json
+import pickle
 from collections import defaultdict
 
+import pytest
+
 from cmat.output_generation import consequence_type as CT
 from cmat.output_generation.consequence_type import get_so_accession_dict
 
@@ -24,6 +28,88 @@ def test_process_consequence_type_file_tsv():
     assert consequence_type_dict["14:67729241:C:T"][0] == test_consequence_type
 
 
+def test_consequence_store(tmp_path):
+    consequence_type_dict = CT.process_consequence_type_file(config.snp_2_gene_file)
+    store_file = str(tmp_path / 'consequences.csqstore')
+    assert CT.write_consequence_store(config.snp_2_gene_file, store_file) == len(consequence_type_dict)
+
+    store = CT.process_consequence_type_file(store_file)
+    assert isinstance(store, CT.ConsequenceStore)
+    assert len(store) == len(consequence_type_dict)
+    assert store.consequence_count == sum(len(consequences) for consequences in consequence_type_dict.values())
+    for variant_id, consequences in consequence_type_dict.items():
+        assert variant_id in store
+        assert store[variant_id] == consequences
+    assert 'rs0' not in store
+    assert store.get('rs0') is None
+
+    # Only the path is pickled, the unpickled store opens the same file
+    unpickled_store = pickle.loads(pickle.dumps(store))
+    assert unpickled_store.path == store_file
+    assert unpickled_store['14:67729241:C:T'] == consequence_type_dict['14:67729241:C:T']
+
+
+def test_consequence_store_keeps_line_order(tmp_path):
+    # Lines of the same variant are deliberately not sorted
+    consequences_file = tmp_path / 'consequences.tsv'
+    consequences_file.write_text('1:100:A:G\tENSG2\tGENE2\tmissense_variant\n'
+                                 '0:100:C:T\tENSG3\tGENE3\tintron_variant\n'
+                                 '1:100:A:G\tENSG1\tGENE1\tstop_gained\n')
+    store_file = str(tmp_path / 'consequences.csqstore')
+    CT.write_consequence_store(str(consequences_file), store_file)
+    consequence_type_dict = CT.process_consequence_type_file(str(consequences_file))
+    store = CT.process_consequence_type_file(store_file)
+    assert [c.ensembl_gene_id for c in store['1:100:A:G']] == ['ENSG2', 'ENSG1']
+    assert store['1:100:A:G'] == consequence_type_dict['1:100:A:G']
+
+
+def test_so_term_interned():
+    so_term = CT.SoTerm('stop_gained')
+    assert CT.SoTerm('stop_gained') is so_term
+    assert pickle.loads(pickle.dumps(so_term)) is so_term
+
+
+def test_so_snapshot(tmp_path, monkeypatch):
+    snapshot_file = str(tmp_path / 'so_snapshot.json')
+    monkeypatch.setattr(CT, 'fetch_so_snapshot', lambda: pytest.fail('Snapshot fetched implicitly'))
+
+    # A missing snapshot is not fetched
+    with pytest.raises(FileNotFoundError, match='bin/refresh_so_snapshot.py'):
+        CT.load_so_snapshot(snapshot_file)
+
+    monkeypatch.setattr(CT, 'fetch_so_snapshot', lambda: {
+        'version': CT.SO_SNAPSHOT_VERSION,
+        'date': '2024-01-01',
+        'so_accessions': {'stop_gained': 'SO_0001587'},
+        'severity_ranking': ['transcript_ablation', 'stop_gained'],
+    })
+    snapshot = CT.refresh_so_snapshot(snapshot_file)
+    assert CT.load_so_snapshot(snapshot_file) == snapshot
+    assert snapshot['so_accessions'] == {'stop_gained': 'SO_0001587'}
+    assert snapshot['severity_ranking'] == ['transcript_ablation', 'stop_gained']
+
+    with open(snapshot_file, 'w') as f:
+        json.dump(dict(snapshot, version=0), f)
+    with pytest.raises(ValueError):
+        CT.load_so_snapshot(snapshot_file)
+
+
+def test_bundled_so_snapshot(tmp_path, monkeypatch):
+    default_snapshot = str(tmp_path / 'so_snapshot.json')
+    monkeypatch.delenv(CT.SO_SNAPSHOT_ENV_VARIABLE)
+    monkeypatch.setattr(CT, 'DEFAULT_SO_SNAPSHOT', default_snapshot)
+    # The bundled snapshot is used until one is created in the default location
+    assert CT.find_so_snapshot() == CT.BUNDLED_SO_SNAPSHOT
+    assert CT.load_so_snapshot()['severity_ranking'][3] == 'stop_gained'
+    with open(default_snapshot, 'w') as f:
+        json.dump({'version': CT.SO_SNAPSHOT_VERSION}, f)
+    assert CT.find_so_snapshot() == default_snapshot
+    # A configured location is never replaced by the bundled snapshot
+    monkeypatch.setenv(CT.SO_SNAPSHOT_ENV_VARIABLE, str(tmp_path / 'missing.json'))
+    with pytest.raises(FileNotFoundError):
+        CT.load_so_snapshot()
+
+
 def test_ensembl_so_term():
     so_term = CT.SoTerm('stop_gained')
     assert so_term.accession == 'SO_0001587'
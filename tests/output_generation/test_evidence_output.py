@@ -0,0 +1,66 @@
+import gzip
+import json
+
+import pytest
+
+from cmat.output_generation.evidence_output import encode_evidence_string, get_output_file_name, EvidenceStringWriter, \
+    JSON_ENCODER, ORJSON_ENCODER, UJSON_ENCODER, GZIP_COMPRESSION, ZSTD_COMPRESSION
+
+EVIDENCE_STRINGS = [
+    {'datasourceId': 'eva', 'literature': ['123', '456'], 'diseaseFromSource': 'Sjögren syndrome'},
+    {'datasourceId': 'eva_somatic', 'alleleOrigins': ['somatic'], 'variantRsId': 'rs123'},
+]
+
+
+@pytest.mark.parametrize('encoder', [JSON_ENCODER, ORJSON_ENCODER, UJSON_ENCODER])
+def test_encode_evidence_string(encoder):
+    if encoder != JSON_ENCODER:
+        pytest.importorskip(encoder)
+    for evidence_string in EVIDENCE_STRINGS:
+        encoded = encode_evidence_string(evidence_string, encoder)
+        assert json.loads(encoded) == evidence_string
+        if encoder == JSON_ENCODER:
+            assert encoded == json.dumps(evidence_string).encode('utf-8')
+
+
+def test_unknown_encoder():
+    with pytest.raises(ValueError):
+        encode_evidence_string(EVIDENCE_STRINGS[0], 'pickle')
+
+
+def read_evidence_strings(path, compression):
+    if compression == GZIP_COMPRESSION:
+        with gzip.open(path, 'rt') as f:
+            return [json.loads(line) for line in f]
+    if compression == ZSTD_COMPRESSION:
+        zstandard = pytest.importorskip('zstandard')
+        with open(path, 'rb') as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read()
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+    with open(path, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('compression', [None, GZIP_COMPRESSION, ZSTD_COMPRESSION])
+def test_writer_concatenation(tmp_path, compression):
+    if compression == ZSTD_COMPRESSION:
+        pytest.importorskip('zstandard')
+    # Outputs of two batches are concatenated without recompression; the buffer is flushed after every line
+    paths = [str(tmp_path / get_output_file_name(f'evidence_strings_{i}.json', compression)) for i in range(2)]
+    for path in paths:
+        with EvidenceStringWriter(path, compression, buffer_size=1) as writer:
+            writer.write_all(encode_evidence_string(evidence_string) for evidence_string in EVIDENCE_STRINGS)
+    output_path = str(tmp_path / get_output_file_name('evidence_strings.json', compression))
+    with open(output_path, 'wb') as output_file:
+        for path in paths:
+            with open(path, 'rb') as f:
+                output_file.write(f.read())
+    assert read_evidence_strings(output_path, compression) == EVIDENCE_STRINGS * 2
+
+
+def test_output_file_name():
+    assert get_output_file_name('evidence_strings.json') == 'evidence_strings.json'
+    assert get_output_file_name('evidence_strings.json', GZIP_COMPRESSION) == 'evidence_strings.json.gz'
+    assert get_output_file_name('evidence_strings.json', ZSTD_COMPRESSION) == 'evidence_strings.json.zst'
+    with pytest.raises(ValueError):
+        get_output_file_name('evidence_strings.json', 'bzip2')
@@ -0,0 +1,101 @@
+import jsonschema
+import pytest
+
+from cmat.output_generation.evidence_validation import compile_validator, get_validator, JSONSCHEMA_VALIDATOR, \
+    FASTJSONSCHEMA_VALIDATOR
+
+SCHEMA = {
+    '$schema': 'http://json-schema.org/draft-07/schema#',
+    'type': 'object',
+    'properties': {
+        'datasourceId': {'type': 'string', 'enum': ['eva', 'eva_somatic']},
+        'confidence': {'type': 'string'},
+        'literature': {'type': 'array', 'items': {'type': 'string', 'pattern': '^[0-9]+$'}},
+        'releaseDate': {'type': 'string', 'format': 'date'},
+    },
+    'required': ['datasourceId'],
+    'additionalProperties': False,
+}
+
+VALID_EVIDENCE = {'datasourceId': 'eva', 'literature': ['123', '456'], 'releaseDate': '2024-01-31'}
+INVALID_EVIDENCE = [
+    {'literature': ['123']},
+    {'datasourceId': 'other'},
+    {'datasourceId': 'eva', 'literature': ['PMID:123']},
+    {'datasourceId': 'eva', 'unexpected': 1},
+]
+
+
+def get_jsonschema_error(instance, schema=SCHEMA):
+    try:
+        jsonschema.validate(instance, schema, format_checker=jsonschema.FormatChecker())
+    except jsonschema.exceptions.ValidationError as e:
+        return str(e)
+
+
+def get_validator_error(validator, instance):
+    try:
+        validator.validate(instance)
+    except jsonschema.exceptions.ValidationError as e:
+        return str(e)
+
+
+@pytest.mark.parametrize('backend', [JSONSCHEMA_VALIDATOR, FASTJSONSCHEMA_VALIDATOR])
+def test_validator(backend):
+    if backend == FASTJSONSCHEMA_VALIDATOR:
+        pytest.importorskip('fastjsonschema')
+    validator = compile_validator(SCHEMA, backend)
+    assert get_validator_error(validator, VALID_EVIDENCE) is None
+    for instance in INVALID_EVIDENCE:
+        # Errors must be reported exactly as by jsonschema.validate
+        assert get_validator_error(validator, instance) == get_jsonschema_error(instance) is not None
+
+
+def test_invalid_schema():
+    with pytest.raises(jsonschema.exceptions.SchemaError):
+        compile_validator({'type': 'no-such-type'}, JSONSCHEMA_VALIDATOR)
+
+
+def test_get_validator_is_cached():
+    validator = get_validator(SCHEMA, JSONSCHEMA_VALIDATOR)
+    assert get_validator(SCHEMA, JSONSCHEMA_VALIDATOR) is validator
+    assert get_validator(dict(SCHEMA), JSONSCHEMA_VALIDATOR) is not validator
+
+
+def test_fingerprint_validator():
+    schema = dict(SCHEMA, definitions={'score': {'type': 'integer', 'minimum': 0}})
+    schema['properties'] = dict(SCHEMA['properties'], score={'$ref': '#/definitions/score'})
+    validator = get_validator(schema, JSONSCHEMA_VALIDATOR, fingerprint=True)
+    assert get_validator_error(validator, dict(VALID_EVIDENCE, score=1)) is None
+    assert len(validator.value_checks) == 1
+    # Same structure, different values: only value checks, which fail and report the error from full validation
+    for instance in (dict(VALID_EVIDENCE, score=-1), dict(VALID_EVIDENCE, score=1.5),
+                     dict(VALID_EVIDENCE, datasourceId='other', score=1),
+                     dict(VALID_EVIDENCE, literature=['1', 'PMID:2'], score=1),
+                     dict(VALID_EVIDENCE, releaseDate='2024-13-45', score=1)):
+        assert get_validator_error(validator, instance) == get_jsonschema_error(instance, schema) is not None
+    assert get_validator_error(validator, dict(VALID_EVIDENCE, literature=['7'], score=2)) is None
+    # A new structure is validated in full
+    new_structure = {'literature': ['123']}
+    assert get_validator_error(validator, new_structure) == get_jsonschema_error(new_structure, schema)
+    assert len(validator.value_checks) == 1
+
+
+def test_fingerprint_validator_mixed_array_items():
+    schema = {
+        'type': 'object',
+        'properties': {
+            'arr': {'type': 'array', 'items': {
+                'type': 'object',
+                'properties': {'a': {'type': 'string', 'enum': ['x']}, 'b': {'type': 'string', 'pattern': '^y'}},
+            }},
+        },
+    }
+    validator = get_validator(schema, JSONSCHEMA_VALIDATOR, fingerprint=True)
+    assert get_validator_error(validator, {'arr': [{'a': 'x'}, {'b': 'y'}]}) is None
+    # The fingerprint of an array is the set of fingerprints of its items, so these have the same fingerprint
+    assert get_validator_error(validator, {'arr': [{'b': 'yy'}, {'a': 'x'}]}) is None
+    assert get_validator_error(validator, {'arr': [{'b': 'y'}]}) is None
+    assert len(validator.value_checks) == 2
+    for instance in ({'arr': [{'b': 'z'}, {'a': 'x'}]}, {'arr': [{'a': 'z'}, {'b': 'y'}]}):
+        assert get_validator_error(validator, instance) == get_jsonschema_error(instance, schema) is not None
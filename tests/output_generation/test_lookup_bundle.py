@@ -0,0 +1,47 @@
+import json
+import pickle
+
+import pytest
+
+from cmat.output_generation import consequence_type as CT
+from cmat.output_generation.lookup_bundle import is_lookup_bundle, load_lookup_bundle, write_lookup_bundle
+from cmat.output_generation.ontology_mapping import load_ontology_mapping
+
+import config
+
+OT_SCHEMA = {'type': 'object', 'properties': {'datasourceId': {'type': 'string'}}}
+
+
+@pytest.mark.parametrize('from_store', [False, True])
+def test_lookup_bundle(tmp_path, from_store):
+    ot_schema_file = str(tmp_path / 'schema.json')
+    with open(ot_schema_file, 'w') as f:
+        json.dump(OT_SCHEMA, f)
+    gene_mapping_file = config.snp_2_gene_file
+    if from_store:
+        gene_mapping_file = str(tmp_path / 'consequences.csqstore')
+        CT.write_consequence_store(config.snp_2_gene_file, gene_mapping_file)
+    bundle_file = str(tmp_path / 'lookup_bundle.bin')
+    write_lookup_bundle(config.efo_mapping_file, gene_mapping_file, ot_schema_file, bundle_file)
+    assert is_lookup_bundle(bundle_file)
+    assert not is_lookup_bundle(config.snp_2_gene_file)
+
+    string_to_efo_mappings, target_ontology, variant_to_gene_mappings, ot_schema_contents = \
+        load_lookup_bundle(bundle_file)
+    expected_mappings, expected_target_ontology = load_ontology_mapping(config.efo_mapping_file)
+    assert dict(string_to_efo_mappings) == dict(expected_mappings)
+    assert target_ontology == expected_target_ontology
+    assert ot_schema_contents == OT_SCHEMA
+
+    consequence_type_dict = CT.process_consequence_type_file(config.snp_2_gene_file)
+    assert len(variant_to_gene_mappings) == len(consequence_type_dict)
+    for variant_id, consequences in consequence_type_dict.items():
+        assert variant_to_gene_mappings[variant_id] == consequences
+    # The consequence store within the bundle is pickled with its offset
+    unpickled_store = pickle.loads(pickle.dumps(variant_to_gene_mappings))
+    assert unpickled_store['14:67729241:C:T'] == consequence_type_dict['14:67729241:C:T']
+
+
+def test_not_a_lookup_bundle():
+    with pytest.raises(ValueError):
+        load_lookup_bundle(config.snp_2_gene_file)
@@ -53,3 +53,24 @@ def test_check_counts():
     assert report.check_counts()
     report.clinvar_total = 5
     assert not report.check_counts()
+
+
+def test_duplicate_evidence_strings(tmp_path):
+    report_1 = Report()
+    assert not report_1.add_evidence_string_key('eva\tRCV1\tENSG1')
+    assert not report_1.add_evidence_string_key('eva\tRCV1\tENSG2')
+    assert report_1.add_evidence_string_key('eva\tRCV1\tENSG1')
+    assert report_1.duplicate_evidence_strings == 1
+
+    report_2 = Report()
+    report_2.add_evidence_string_key('eva\tRCV1\tENSG2')
+    report_2.add_evidence_string_key('eva\tRCV2\tENSG1')
+    # Keys are written separately from the counts, so both have to be loaded to detect duplicates between reports
+    report_2.write_evidence_string_keys(tmp_path)
+    loaded_report = Report()
+    loaded_report.load_evidence_string_keys(tmp_path / 'evidence_string_keys.bin')
+    assert loaded_report.evidence_string_keys == report_2.evidence_string_keys
+
+    combined = report_1 + loaded_report
+    assert combined.duplicate_evidence_strings == 2
+    assert len(combined.evidence_string_keys) == 3